@@ -0,0 +1,82 @@
+// Mirrors server/app/realtime/ot.py: an op is a list of edits applied in order.
+export type Edit = { pos: number; del: number; ins: string }
+export type Op = Edit[]
+
+export function apply(text: string, op: Op): string {
+  for (const e of op) text = text.slice(0, e.pos) + e.ins + text.slice(e.pos + e.del)
+  return text
+}
+
+function transformEdit(a: Edit, b: Edit, aFirst: boolean): Op {
+  const aEnd = a.pos + a.del
+  const bEnd = b.pos + b.del
+  const bLen = b.ins.length
+  const left = Math.max(0, Math.min(aEnd, b.pos) - a.pos)
+  const right = Math.max(0, aEnd - Math.max(a.pos, bEnd))
+  const rightPos = Math.max(a.pos, bEnd) - b.del + bLen
+  let pos: number
+  if (a.pos < b.pos || (a.pos === b.pos && aFirst)) pos = a.pos
+  else if (a.pos >= bEnd && a.pos > b.pos) pos = a.pos - b.del + bLen
+  else pos = b.pos + bLen
+  if (right && pos + left === rightPos) return [{ pos, del: left + right, ins: a.ins }]
+  const out: Op = []
+  if (right) out.push({ pos: rightPos, del: right, ins: '' })
+  if (left || a.ins) out.push({ pos, del: left, ins: a.ins })
+  return out
+}
+
+export function transform(a: Op, b: Op, aFirst = false): [Op, Op] {
+  if (!a.length || !b.length) return [a, b]
+  if (a.length === 1 && b.length === 1) return [transformEdit(a[0], b[0], aFirst), transformEdit(b[0], a[0], !aFirst)]
+  if (a.length > 1) {
+    const [head, b1] = transform(a.slice(0, 1), b, aFirst)
+    const [tail, b2] = transform(a.slice(1), b1, aFirst)
+    return [[...head, ...tail], b2]
+  }
+  const [a1, head] = transform(a, b.slice(0, 1), aFirst)
+  const [a2, tail] = transform(a1, b.slice(1), aFirst)
+  return [a2, [...head, ...tail]]
+}
+
+// Client side of the revision protocol: at most one op in flight, local edits
+// made meanwhile are buffered and sent once the server acknowledges.
+export class OpClient {
+  rev = 0
+  inflight: Op | null = null
+  buffer: Op | null = null
+  private send: (rev: number, op: Op) => void
+
+  constructor(send: (rev: number, op: Op) => void) {
+    this.send = send
+  }
+
+  reset(rev: number) {
+    this.rev = rev
+    this.inflight = null
+    this.buffer = null
+  }
+
+  local(op: Op) {
+    if (!op.length) return
+    if (this.inflight) this.buffer = [...(this.buffer || []), ...op]
+    else {
+      this.inflight = op
+      this.send(this.rev, op)
+    }
+  }
+
+  ack(rev: number) {
+    this.rev = rev
+    this.inflight = this.buffer
+    this.buffer = null
+    if (this.inflight) this.send(this.rev, this.inflight)
+  }
+
+  // Returns the remote op rewritten against local unacknowledged edits.
+  remote(rev: number, op: Op): Op {
+    this.rev = rev
+    if (this.inflight) [this.inflight, op] = transform(this.inflight, op)
+    if (this.buffer) [this.buffer, op] = transform(this.buffer, op)
+    return op
+  }
+}
@@ -1,11 +1,21 @@
 import { useEffect, useRef, useState } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
-import Editor from '@monaco-editor/react'
+import Editor, { type OnChange, type OnMount } from '@monaco-editor/react'
 import { io, Socket } from 'socket.io-client'
 import axios from 'axios'
 import { useSessionStore } from '../store/session'
+import { OpClient, type Op } from '../lib/ot'
 
 type Doc = { id:number; title:string; content:string; language:string }
+type Message = { id?:number; user?:string; content:string; created_at?:string }
+type Peer = { sid:string; user:string; document_id:number|null; cursor:number|null; selection:[number,number]|null }
+
+const HISTORY_PAGE = 50
+const HEARTBEAT_MS = 10000
+
+function toMessage(m:any): Message {
+  return { id: m.id, user: m.user_email || 'anon', content: m.content, created_at: m.created_at }
+}
 
 export default function EditorPage() {
   const { code } = useParams<{code:string}>()
@@ -13,57 +23,126 @@ export default function EditorPage() {
   const [socket, setSocket] = useState<Socket | null>(null)
   const [document, setDocument] = useState<Doc | null>(null)
   const [docs, setDocs] = useState<Doc[]>([])
-  const [messages, setMessages] = useState<{user?:string; content:string; created_at?:string}[]>([])
+  const [messages, setMessages] = useState<Message[]>([])
+  const [sessionId, setSessionId] = useState<number | null>(null)
+  const [hasEarlier, setHasEarlier] = useState(false)
   const [tab, setTab] = useState<'files'|'chat'>('files')
+  const [peers, setPeers] = useState<Record<string, Peer>>({})
   const userEmail = useSessionStore(s => s.userEmail)
+  const editorRef = useRef<Parameters<OnMount>[0] | null>(null)
+  const applyingRemote = useRef(false)
+  const docRef = useRef<Doc | null>(null)
+  const opClient = useRef<OpClient | null>(null)
+  const socketRef = useRef<Socket | null>(null)
+  docRef.current = document
 
   useEffect(() => {
     (async () => {
       const token = localStorage.getItem('token')
       if (!token) return navigate('/login')
-      const sess = await axios.get(`/api/sessions/by-code/${code}` , { headers: { Authorization: `Bearer ${token}` }})
-      const sessionId = sess.data.id
-      const docsRes = await axios.get(`/api/sessions/${sessionId}/documents`, { headers: { Authorization: `Bearer ${token}` }})
-      setDocs(docsRes.data)
-      setDocument(docsRes.data[0])
-      // Load chat history
-      const hist = await axios.get(`/api/sessions/${sessionId}/messages`, { headers: { Authorization: `Bearer ${token}` }})
-      setMessages((hist.data || []).map((m:any) => ({ user: m.user_email || 'anon', content: m.content, created_at: m.created_at })))
+      // Session, file list and latest chat in one request; file content
+      // arrives with editor_open
+      const res = await axios.get(`/api/sessions/${code}/bootstrap`, { params: { messages: HISTORY_PAGE }, headers: { Authorization: `Bearer ${token}` }})
+      const docs: Doc[] = res.data.documents.map((d:any) => ({ ...d, content: d.content ?? '' }))
+      setSessionId(res.data.session.id)
+      setDocs(docs)
+      setDocument(docs[0] ?? null)
+      setMessages(res.data.messages.map(toMessage))
+      setHasEarlier(res.data.has_earlier_messages)
     })()
   }, [code, navigate])
 
   useEffect(() => {
     const token = localStorage.getItem('token')
     const s = io('http://localhost:8000', { path: '/socket.io', transports: ['websocket', 'polling'] })
+    opClient.current = new OpClient((rev, ops) => {
+      s.emit('editor_op', { document_id: docRef.current?.id, rev, ops })
+    })
     s.on('connect', () => {
       s.emit('join_session', { code, token })
+      const d = docRef.current
+      if (d) s.emit('editor_open', { document_id: d.id })
+    })
+    s.on('editor_snapshot', (data:{document_id:number; rev:number; content:string}) => {
+      if (docRef.current?.id !== data.document_id) return
+      opClient.current?.reset(data.rev)
+      setDocument(d => d && d.id === data.document_id ? { ...d, content: data.content } : d)
     })
-    s.on('editor_change', (data:{document_id?:number; content:string}) => {
-      setDocument(d => d && (!data.document_id || d.id === data.document_id) ? { ...d, content: data.content } : d)
+    s.on('editor_ack', (data:{document_id:number; rev:number}) => {
+      if (docRef.current?.id === data.document_id) opClient.current?.ack(data.rev)
     })
-    s.on('chat_message', (data:{user?:string; content:string; created_at?:string}) => {
+    s.on('editor_op', (data:{document_id:number; rev:number; ops:Op}) => {
+      if (docRef.current?.id !== data.document_id || !opClient.current) return
+      applyRemote(opClient.current.remote(data.rev, data.ops))
+    })
+    s.on('editor_reject', (data:{document_id:number}) => {
+      const d = docRef.current
+      if (d && d.id === data.document_id) s.emit('editor_open', { document_id: d.id })
+    })
+    s.on('chat_message', (data:Message) => {
       setMessages(m => [...m, data])
     })
+    s.on('presence_state', (data:{members:Peer[]}) => {
+      setPeers(Object.fromEntries(data.members.map(p => [p.sid, p])))
+    })
+    const upsertPeer = (p:Peer) => setPeers(x => ({ ...x, [p.sid]: p }))
+    s.on('presence_join', upsertPeer)
+    s.on('presence', upsertPeer)
+    s.on('presence_leave', (data:{sid:string}) => {
+      setPeers(x => {
+        const next = { ...x }
+        delete next[data.sid]
+        return next
+      })
+    })
+    const heartbeat = setInterval(() => s.emit('presence_heartbeat'), HEARTBEAT_MS)
+    socketRef.current = s
     setSocket(s)
-    return () => { s.disconnect() }
+    return () => { clearInterval(heartbeat); s.disconnect() }
   }, [code])
 
-  const lastEmit = useRef(0)
-  const onChange = (value: string | undefined) => {
-    setDocument(d => d ? { ...d, content: value || '' } : d)
-    const now = Date.now()
-    if (now - lastEmit.current > 80) {
-      lastEmit.current = now
-      socket?.emit('editor_change', { document_id: document?.id, content: value, ts: now })
+  useEffect(() => {
+    const d = docRef.current
+    if (!socket || !d) return
+    opClient.current?.reset(0)
+    socket.emit('editor_open', { document_id: d.id })
+  }, [socket, document?.id])
+
+  function applyRemote(op: Op) {
+    const model = editorRef.current?.getModel()
+    if (!model || !op.length) return
+    applyingRemote.current = true
+    try {
+      for (const e of op) {
+        const start = model.getPositionAt(e.pos)
+        const end = model.getPositionAt(e.pos + e.del)
+        model.applyEdits([{ range: { startLineNumber: start.lineNumber, startColumn: start.column, endLineNumber: end.lineNumber, endColumn: end.column }, text: e.ins }])
+      }
+    } finally {
+      applyingRemote.current = false
     }
+    const content = model.getValue()
+    setDocument(d => d ? { ...d, content } : d)
+  }
+
+  const onChange: OnChange = (value, ev) => {
+    setDocument(d => d ? { ...d, content: value || '' } : d)
+    if (applyingRemote.current) return
+    // Monaco reports changes against the pre-change text; applying them from
+    // the highest offset down keeps every offset valid.
+    const op: Op = [...ev.changes]
+      .sort((a, b) => b.rangeOffset - a.rangeOffset)
+      .map(c => ({ pos: c.rangeOffset, del: c.rangeLength, ins: c.text }))
+    opClient.current?.local(op)
   }
 
-  async function save() {
+  async function loadEarlier() {
     const token = localStorage.getItem('token')
-    if (!token || !document) return
-    await axios.patch(`/api/sessions/documents/${document.id}`, {
-      content: document.content
-    }, { headers: { Authorization: `Bearer ${token}` }})
+    const before = messages.find(m => m.id !== undefined)?.id
+    if (!token || sessionId === null || before === undefined) return
+    const res = await axios.get(`/api/sessions/${sessionId}/messages`, { params: { before, limit: HISTORY_PAGE }, headers: { Authorization: `Bearer ${token}` }})
+    setMessages(m => [...(res.data || []).map(toMessage), ...m])
+    setHasEarlier((res.data || []).length === HISTORY_PAGE)
   }
 
   const [chatInput, setChatInput] = useState('')
@@ -78,8 +157,10 @@ export default function EditorPage() {
       <div style={{ height: 48, display: 'flex', alignItems: 'center', justifyContent: 'space-between', padding: '0 16px', borderBottom: '1px solid #e5e7eb', background: '#fff' }}>
         <div style={{ fontWeight: 500 }}>Session {code}</div>
         <div>
+          {Object.values(peers).filter(p => p.sid !== socket?.id).map(p => (
+            <span key={p.sid} title={p.document_id === document?.id && p.cursor !== null ? `${p.user} at offset ${p.cursor}` : p.user} style={{ marginRight: 8, padding: '2px 8px', borderRadius: 10, fontSize: 12, background: p.document_id === document?.id ? '#eef2ff' : '#f1f5f9', color: '#475569' }}>{p.user}</span>
+          ))}
           <span style={{ marginRight: 12, color: '#64748b' }}>{userEmail}</span>
-          <button onClick={save} style={{ padding: '6px 12px', background: '#1a73e8', color: '#fff', border: 0, borderRadius: 6, marginRight: 8 }}>Save</button>
           <button onClick={()=>navigate('/')} style={{ padding: '6px 12px', background: '#ef4444', color: '#fff', border: 0, borderRadius: 6 }}>Exit</button>
         </div>
       </div>
@@ -91,6 +172,19 @@ export default function EditorPage() {
             language={document?.language || 'typescript'}
             value={document?.content || ''}
             onChange={onChange}
+            onMount={(editor) => {
+              editorRef.current = editor
+              // The server throttles these, so every cursor move can be sent
+              editor.onDidChangeCursorSelection(e => {
+                const model = editor.getModel()
+                const d = docRef.current
+                if (!model || !d) return
+                const start = model.getOffsetAt(e.selection.getStartPosition())
+                const end = model.getOffsetAt(e.selection.getEndPosition())
+                const cursor = model.getOffsetAt(e.selection.getPosition())
+                socketRef.current?.emit('presence_update', { document_id: d.id, cursor, selection: start === end ? null : [start, end] })
+              })
+            }}
             options={{ minimap: { enabled: false }, fontSize: 14 }}
           />
         </div>
@@ -106,11 +200,16 @@ export default function EditorPage() {
                   <div key={d.id} onClick={()=>setDocument(d)} className="card-hover" style={{ padding: '8px 10px', borderRadius: 8, cursor: 'pointer', background: document?.id===d.id?'#eef2ff':'#fff', border: '1px solid #e5e7eb', marginBottom: 8 }}>{d.title}</div>
                 ))}
               </div>
-              <CreateFile code={code!} onCreated={(doc)=>{ setDocs(x=>[...x, doc]); setDocument(doc) }} />
+              <CreateFile sessionId={sessionId} onCreated={(doc)=>{ setDocs(x=>[...x, doc]); setDocument(doc) }} />
             </div>
           ) : (
             <div style={{ display: 'flex', flexDirection: 'column', height: '100%' }}>
               <div style={{ flex: 1, overflow: 'auto', padding: 12 }}>
+                {hasEarlier && (
+                  <div style={{ textAlign: 'center', marginBottom: 8 }}>
+                    <button onClick={loadEarlier} style={{ padding: '4px 10px', background: '#fff', border: '1px solid #e5e7eb', borderRadius: 6, color: '#64748b' }}>Load earlier messages</button>
+                  </div>
+                )}
                 {messages.map((m, i) => {
                   const mine = m.user === userEmail
                   return (
@@ -137,16 +236,15 @@ export default function EditorPage() {
   )
 }
 
-function CreateFile({ code, onCreated }: { code: string; onCreated: (doc: Doc)=>void }) {
+function CreateFile({ sessionId, onCreated }: { sessionId: number | null; onCreated: (doc: Doc)=>void }) {
   const [title, setTitle] = useState('')
   const [creating, setCreating] = useState(false)
   async function create() {
-    if (!title.trim()) return
+    if (!title.trim() || sessionId === null) return
     setCreating(true)
     try {
       const token = localStorage.getItem('token')
-      const sess = await axios.get(`/api/sessions/by-code/${code}`, { headers: { Authorization: `Bearer ${token}` }})
-      const res = await axios.post(`/api/sessions/${sess.data.id}/documents`, { title }, { headers: { Authorization: `Bearer ${token}` }})
+      const res = await axios.post(`/api/sessions/${sessionId}/documents`, { title }, { headers: { Authorization: `Bearer ${token}` }})
       onCreated(res.data)
       setTitle('')
     } finally {
@@ -0,0 +1,240 @@
+from __future__ import annotations
+import gzip
+import io
+import posixpath
+import tarfile
+import time
+import zipfile
+from datetime import datetime
+from typing import IO, Iterable, Iterator, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from .config import settings
+from . import models
+from .realtime import revisions
+from .realtime.documents import store
+
+
+LANGUAGES = {
+    ".ts": "typescript", ".tsx": "typescript", ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript",
+    ".py": "python", ".json": "json", ".md": "markdown", ".html": "html", ".css": "css", ".scss": "scss",
+    ".go": "go", ".rs": "rust", ".java": "java", ".kt": "kotlin", ".c": "c", ".h": "c", ".cpp": "cpp", ".hpp": "cpp",
+    ".cs": "csharp", ".rb": "ruby", ".php": "php", ".sh": "shell", ".sql": "sql", ".xml": "xml",
+    ".yml": "yaml", ".yaml": "yaml", ".toml": "ini", ".ini": "ini", ".dart": "dart", ".swift": "swift",
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def language_for(path: str) -> str:
+    return LANGUAGES.get(posixpath.splitext(path)[1].lower(), "plaintext")
+
+
+def clean_path(name: str) -> Optional[str]:
+    """Relative POSIX path for an archive member or a document title; None
+    for names that escape the root or are too long to be a title."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    path = "/".join(parts)
+    return path if len(path) <= 255 else None
+
+
+# Reading archives
+
+
+def _members(fileobj: IO[bytes]) -> Iterator[tuple[str, Optional[bytes], Optional[str]]]:
+    """(name, data, None) per regular file, or (name, None, reason) for one
+    that is skipped. Reads at most `import_max_file_bytes` + 1 per member.
+
+    Stops, after a final (name, None, reason), at the member that takes the
+    archive past `import_max_members` entries (directories and links count:
+    tarfile keeps every header it reads) or `import_max_total_bytes`
+    uncompressed (a tar is inflated through skipped members too).
+    """
+    limit = settings.import_max_file_bytes
+    members = 0
+    total = 0
+
+    def over(entries: int, size: int) -> Optional[str]:
+        nonlocal members, total
+        members += entries
+        total += size
+        if members > settings.import_max_members:
+            return "too many entries"
+        if total > settings.import_max_total_bytes:
+            return "archive too large"
+        return None
+
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                reason = over(1, 0)
+                if reason is not None:
+                    yield info.filename, None, reason
+                    return
+                if info.is_dir():
+                    continue
+                if info.file_size > limit:
+                    yield info.filename, None, "too large"
+                    continue
+                with zf.open(info) as f:
+                    data = f.read(limit + 1)
+                reason = over(0, len(data))
+                if reason is not None:
+                    yield info.filename, None, reason
+                    return
+                yield info.filename, data, None if len(data) <= limit else "too large"
+        return
+    fileobj.seek(0)
+    try:
+        tf = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        raise ArchiveError("Expected a zip or tar archive")
+    with tf:
+        for info in tf:
+            reason = over(1, info.size)
+            if reason is not None:
+                yield info.name, None, reason
+                return
+            if not info.isfile():
+                continue
+            if info.size > limit:
+                yield info.name, None, "too large"
+                continue
+            yield info.name, tf.extractfile(info).read(), None
+
+
+def import_archive(db: Session, session_id: int, fileobj: IO[bytes]) -> dict:
+    """Add every text file in the archive as a document titled by its path.
+
+    Files go in with one multi-row INSERT (plus their revision-0 snapshots)
+    per `import_batch_size` files or `import_batch_bytes`, each batch its own
+    transaction, so memory is bounded by a batch whatever the archive holds.
+    Paths that already name a document in the session are skipped.
+    """
+    D = models.Document
+    taken = {title for (title,) in db.query(D.title).filter(D.session_id == session_id)}
+    created = 0
+    skipped: list[dict] = []
+    skipped_count = 0
+    batch: list[tuple[str, str]] = []
+    batch_bytes = 0
+
+    def skip(path: str, reason: str) -> None:
+        nonlocal skipped_count
+        skipped_count += 1
+        if len(skipped) < 100:
+            skipped.append({"path": path, "reason": reason})
+
+    def flush() -> None:
+        nonlocal created, batch_bytes
+        if not batch:
+            return
+        now = datetime.utcnow()
+        db.execute(
+            insert(D),
+            [{"session_id": session_id, "title": t, "content": c, "language": language_for(t), "revision": 0, "updated_at": now} for t, c in batch],
+        )
+        ids = dict(db.query(D.title, D.id).filter(D.session_id == session_id, D.title.in_([t for t, _ in batch])).all())
+        db.execute(insert(models.DocumentRevision), [revisions.row(ids[t], 0, 0, c) for t, c in batch])
+        db.commit()
+        created += len(batch)
+        batch.clear()
+        batch_bytes = 0
+
+    for name, data, reason in _members(fileobj):
+        path = clean_path(name)
+        if path is None:
+            skip(name, "invalid path")
+        elif reason is not None:
+            skip(path, reason)
+        elif path in taken:
+            skip(path, "exists")
+        elif created + len(batch) >= settings.import_max_files:
+            skip(path, "too many files")
+        else:
+            try:
+                content = data.decode("utf-8")
+            except UnicodeDecodeError:
+                content = None
+            if content is None or "\0" in content:
+                skip(path, "binary")
+                continue
+            taken.add(path)
+            batch.append((path, content))
+            batch_bytes += len(data)
+            if len(batch) >= settings.import_batch_size or batch_bytes >= settings.import_batch_bytes:
+                flush()
+    flush()
+    return {"created": created, "skipped": skipped_count, "skipped_files": skipped}
+
+
+# Writing archives
+
+
+def export_files(db: Session, session_id: int) -> Iterator[tuple[str, str]]:
+    """(path, content) per document, read through a server-side cursor in
+    `export_fetch_size` row batches; live copies win over saved content."""
+    D = models.Document
+    result = db.execute(
+        select(D.id, D.title, D.content).where(D.session_id == session_id).order_by(D.id).execution_options(stream_results=True, yield_per=settings.export_fetch_size)
+    )
+    used: set[str] = set()
+    for row in result:
+        path = clean_path(row.title or "") or f"document-{row.id}"
+        if path in used:
+            stem, ext = posixpath.splitext(path)
+            path = f"{stem}~{row.id}{ext}"
+        used.add(path)
+        live = store.get(row.id)
+        yield path, live.content if live is not None else row.content or ""
+
+
+class _Sink(io.RawIOBase):
+    # Write-only, unseekable buffer that the archive writers fill and the
+    # response drains after every file
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_stream(files: Iterable[tuple[str, str]]) -> Iterator[bytes]:
+    sink = _Sink()
+    now = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for path, content in files:
+            info = zipfile.ZipInfo(path, now)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, content)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def tar_stream(files: Iterable[tuple[str, str]]) -> Iterator[bytes]:
+    sink = _Sink()
+    now = time.time()
+    # tarfile's own "w|gz" always compresses at level 9
+    with gzip.GzipFile(fileobj=sink, mode="wb", compresslevel=6, mtime=0) as gz, tarfile.open(fileobj=gz, mode="w|") as tf:
+        for path, content in files:
+            data = content.encode()
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            info.mtime = now
+            tf.addfile(info, io.BytesIO(data))
+            yield sink.drain()
+    yield sink.drain()
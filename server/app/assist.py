@@ -0,0 +1,216 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import importlib
+import logging
+import re
+from typing import AsyncIterator, Optional, Protocol
+from .config import settings
+from .metrics import registry
+from .utils.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class AssistBusy(Exception):
+    pass
+
+
+class AssistFailed(Exception):
+    pass
+
+
+class Backend(Protocol):
+    """A model: streams the answer to `question` about `code` as text tokens.
+
+    Runs on the event loop, so a backend that blocks must hand its work to a
+    thread (asyncio.to_thread) and feed tokens back.
+    """
+
+    def generate(self, code: str, question: str) -> AsyncIterator[str]: ...
+
+
+class FakeBackend:
+    """Local stand-in for a model: streams a canned answer a word at a time."""
+
+    def __init__(self, token_delay: float = 0.0):
+        self.token_delay = token_delay
+
+    async def generate(self, code: str, question: str) -> AsyncIterator[str]:
+        lines = code.count("\n") + 1 if code else 0
+        answer = f"AI assistant is not configured. You asked: {question} ({lines} lines of code)"
+        for token in re.findall(r"\S+\s*", answer):
+            await asyncio.sleep(self.token_delay)
+            yield token
+
+
+def load_backend(spec: str) -> Backend:
+    # "fake", or "package.module:factory" where factory() returns a backend
+    if spec == "fake":
+        return FakeBackend(settings.ai_fake_token_delay)
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+def prompt_key(code: str, question: str) -> str:
+    h = hashlib.sha256(code.encode())
+    h.update(b"\0")
+    h.update(question.encode())
+    return h.hexdigest()
+
+
+class AssistJob:
+    """One prompt's answer as it is generated; any number of readers may follow it."""
+
+    def __init__(self, key: str, tokens: tuple[str, ...] = (), cached: bool = False):
+        self.key = key
+        self.tokens = list(tokens)
+        self.cached = cached
+        self.done = cached
+        self.error: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    def push(self, token: str) -> None:
+        self.tokens.append(token)
+        self._wake()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        if not self.done:
+            self.done = True
+            self.error = error
+            self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Text generated so far, then each new piece; a slow reader gets the
+        tokens it missed joined into one. Raises AssistFailed if generation does."""
+        sent = 0
+        while True:
+            if sent < len(self.tokens):
+                chunk = "".join(self.tokens[sent:])
+                sent = len(self.tokens)
+                yield chunk
+            elif self.done:
+                if self.error is not None:
+                    raise AssistFailed(self.error)
+                return
+            else:
+                await self._changed.wait()
+
+    async def result(self) -> str:
+        async for _ in self.stream():
+            pass
+        return "".join(self.tokens)
+
+
+class Assistant:
+    """Queue of AI assist jobs served by `ai_workers` tasks.
+
+    At most `ai_queue_limit` jobs wait; beyond that `submit` raises
+    AssistBusy. A prompt identical to one being generated joins that job, and
+    finished answers are kept in an LRU keyed by a hash of code and question.
+    """
+
+    def __init__(self):
+        self.backend: Optional[Backend] = None
+        self.cache: TTLCache[str, tuple[str, ...]] = TTLCache(settings.ai_cache_size, settings.ai_cache_ttl)
+        self._queue: Optional[asyncio.Queue[tuple[AssistJob, str, str]]] = None
+        self._workers: list[asyncio.Task] = []
+        self._inflight: dict[str, AssistJob] = {}
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.joined = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, code: str, question: str) -> AssistJob:
+        key = prompt_key(code, question)
+        tokens = self.cache.get(key)
+        if tokens is not None:
+            return AssistJob(key, tokens, cached=True)
+        job = self._inflight.get(key)
+        if job is not None:
+            self.joined += 1
+            return job
+        if self._queue is None:
+            raise RuntimeError("assistant is not running")
+        job = AssistJob(key)
+        try:
+            self._queue.put_nowait((job, code, question))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise AssistBusy()
+        self._inflight[key] = job
+        return job
+
+    async def _generate(self, job: AssistJob, code: str, question: str) -> None:
+        async for token in self.backend.generate(code, question):
+            job.push(token)
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            job, code, question = await queue.get()
+            try:
+                await asyncio.wait_for(self._generate(job, code, question), settings.ai_job_timeout)
+                self.cache.set(job.key, tuple(job.tokens))
+                self.completed += 1
+                job.finish()
+            except asyncio.TimeoutError:
+                self.failed += 1
+                job.finish("The assistant took too long to answer")
+            except asyncio.CancelledError:
+                # stop() only sees the jobs still queued once this one is popped
+                job.finish("The assistant is shutting down")
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception("AI assist job failed")
+                job.finish("The assistant failed to answer")
+            finally:
+                self._inflight.pop(job.key, None)
+                queue.task_done()
+
+    def start(self) -> None:
+        if self._queue is None:
+            self.backend = load_backend(settings.ai_backend)
+            self._queue = asyncio.Queue(maxsize=settings.ai_queue_limit)
+            self._workers = [asyncio.create_task(self._run()) for _ in range(max(1, settings.ai_workers))]
+
+    async def stop(self) -> None:
+        if self._queue is None:
+            return
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        # Readers of unfinished jobs get an error instead of waiting forever
+        for job in list(self._inflight.values()):
+            job.finish("The assistant is shutting down")
+        self._inflight.clear()
+        self._workers = []
+        self._queue = None
+
+
+assistant = Assistant()
+
+registry.gauge("devhub_ai_queue_depth", "AI assist jobs waiting for a worker", lambda: {(): assistant.depth})
+registry.gauge(
+    "devhub_ai_jobs_total",
+    "AI assist prompts by outcome",
+    lambda: {
+        ("completed",): assistant.completed,
+        ("failed",): assistant.failed,
+        ("rejected",): assistant.rejected,
+        ("joined",): assistant.joined,
+        ("cached",): assistant.cache.hits,
+    },
+    ("outcome",),
+    kind="counter",
+)
@@ -1,25 +1,40 @@
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 import jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from .config import settings
 from . import models
+from .database import request_session
 from .deps import get_db_dep
+from .utils.cache import TTLCache
+from .utils import passwords
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/login")
 
 
+def _hash_in_pool(fn, *args):
+    try:
+        return passwords.run(fn, *args)
+    except passwords.HasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return _hash_in_pool(passwords.hash_sync, password)
 
 
 def verify_password(plain_password: str, password_hash: str) -> bool:
-    return pwd_context.verify(plain_password, password_hash)
+    return _hash_in_pool(passwords.verify_sync, plain_password, password_hash)
 
 
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
@@ -29,18 +44,68 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None)
     return token
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db_dep)) -> models.User:
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+
+
+# Bearer token -> principal, so most authenticated requests skip both the JWT
+# decode and the users lookup. Entries never outlive the token itself.
+principal_cache: TTLCache[str, Principal] = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl)
+
+
+def invalidate_user(email: str) -> None:
+    principal_cache.discard_where(lambda p: p.email == email)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target: models.User) -> None:
+    # A changed e-mail leaves the old address in the attribute history
+    for email in {target.email, *(inspect(target).attrs.email.history.deleted or ())}:
+        invalidate_user(email)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def authenticate(db: Session, token: str) -> Principal:
+    """The principal a bearer token stands for; raises InvalidToken."""
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     except jwt.PyJWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        raise InvalidToken("Invalid token")
+    email = payload.get("sub")
+    if email is None:
+        raise InvalidToken("Invalid token")
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = db.query(models.User.id, models.User.email).filter(models.User.email == email).first()
     if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+        raise InvalidToken("User not found")
+    principal = Principal(id=user.id, email=user.email)
+    exp = payload.get("exp")
+    principal_cache.set(token, principal, ttl=exp - time.time() if exp else None)
+    return principal
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db_dep)) -> Principal:
+    try:
+        return authenticate(db, token)
+    except InvalidToken as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
 
 
+def get_current_user_released(token: str = Depends(oauth2_scheme)) -> Principal:
+    """get_current_user that gives its database session back before the
+    route runs, for routes that read a long request body first."""
+    with request_session() as db:
+        try:
+            return authenticate(db, token)
+        except InvalidToken as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
@@ -1,6 +1,6 @@
 from pydantic import Field
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Literal
 import os
 
 
@@ -12,15 +12,152 @@ class Settings(BaseSettings):
     db_user: str = Field(default=os.getenv("DB_USER", "ANSK"))
     db_password: str = Field(default=os.getenv("DB_PASSWORD", "Nick8956"))
     db_name: str = Field(default=os.getenv("DB_NAME", "devhub"))
+    # Full SQLAlchemy URL; overrides the DB_* settings (e.g. sqlite:///devhub.db)
+    database_url: str = Field(default=os.getenv("DATABASE_URL", ""))
+    # Create the database and missing tables/columns/indexes at startup; turn
+    # off when `python -m server.app.utils.db_init` runs as a deploy step
+    db_auto_migrate: bool = Field(default=os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes"))
+    db_connect_timeout: int = 10
+    # HTTP connection pool, per worker process (DB_POOL_SIZE etc. in the env).
+    # Sync routes run on `http_threads` threads, so connections beyond that
+    # are never used; checkouts wait up to `db_pool_timeout` seconds.
+    db_pool_size: int = 10
+    db_pool_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    # "always" pings on every checkout, "idle" only connections unused for
+    # `db_pool_ping_idle` seconds, "never" relies on recycle and reconnects
+    db_pool_pre_ping: Literal["always", "idle", "never"] = "idle"
+    db_pool_ping_idle: float = 60.0
+    http_threads: int = 40
 
     # Auth
     jwt_secret: str = Field(default=os.getenv("JWT_SECRET", "change-me-dev-secret"))
     jwt_alg: str = Field(default=os.getenv("JWT_ALG", "HS256"))
     access_token_expire_minutes: int = 60 * 24 * 7
+    # Token -> user cache for authenticated routes; a ttl of 0 disables it
+    auth_cache_size: int = 10000
+    auth_cache_ttl: float = 60.0
+    # bcrypt worker processes; 0 hashes inline on the request thread
+    password_hash_workers: int = 2
+    password_hash_queue_limit: int = 32
+    password_hash_timeout: float = 10.0
+
+    # Session code -> session cache; a ttl of 0 disables it
+    session_cache_size: int = 10000
+    session_cache_ttl: float = 300.0
+
+    # Code search: trigram indexes for this many sessions per worker, checked
+    # against the database at most every interval
+    search_index_sessions: int = 32
+    search_sync_interval: float = 1.0
+    # Seconds of matching per search before the rest of the files are skipped
+    search_timeout: float = 2.0
+
+    # Session archives. Uploads spool to disk past `import_spool_bytes`; files
+    # are inserted in transactions of up to a batch's files or bytes. Reading
+    # stops past `import_max_total_bytes` uncompressed or `import_max_members`
+    # entries of any kind
+    import_max_bytes: int = 200 * 1024 * 1024
+    import_max_file_bytes: int = 2 * 1024 * 1024
+    import_max_total_bytes: int = 1024 * 1024 * 1024
+    import_max_files: int = 20000
+    import_max_members: int = 50000
+    import_spool_bytes: int = 8 * 1024 * 1024
+    import_batch_size: int = 200
+    import_batch_bytes: int = 8 * 1024 * 1024
+    export_fetch_size: int = 50
+
+    # AI assist: "fake" (a local stand-in streaming a canned answer) or a
+    # "package.module:factory" returning a backend. Jobs wait in a queue of
+    # `ai_queue_limit` for one of `ai_workers`; finished answers are cached
+    ai_backend: str = Field(default=os.getenv("AI_BACKEND", "fake"))
+    ai_workers: int = 4
+    ai_queue_limit: int = 64
+    ai_job_timeout: float = 120.0
+    ai_cache_size: int = 1000
+    ai_cache_ttl: float = 3600.0
+    ai_max_code_chars: int = 200_000
+    ai_max_question_chars: int = 4000
+    ai_fake_token_delay: float = 0.02
+
+    # Rate limits, as "N/s", "N/m", "N/h" or "N/10s" (bursts of up to N); empty
+    # for none. Buckets live in each worker, or in Redis when RATE_LIMIT_URL is
+    # set so the limits hold across workers
+    rate_limit_url: str = Field(default=os.getenv("RATE_LIMIT_URL", ""))
+    # Socket.IO events by group, per connection and where set per user or room
+    rate_limit_editor: str = "60/s"
+    rate_limit_editor_room: str = "2000/s"
+    rate_limit_presence: str = "30/s"
+    rate_limit_chat: str = "5/s"
+    rate_limit_chat_user: str = "10/s"
+    rate_limit_chat_room: str = "100/s"
+    rate_limit_join: str = "10/s"
+    rate_limit_ai_user: str = "30/m"
+    rate_limit_socket: str = "100/s"
+    # HTTP under /api, per user (per client IP without a valid token); sign-ins
+    # per IP and per account, sign-ups per IP
+    rate_limit_http: str = "1200/m"
+    rate_limit_login_ip: str = "30/m"
+    rate_limit_login_account: str = "10/m"
+    rate_limit_register_ip: str = "10/m"
+    # Take the client IP from X-Forwarded-For; only behind a proxy that sets it
+    rate_limit_trust_forwarded: bool = False
+
+    # Prometheus text on GET /metrics; when off, instrumentation is skipped
+    metrics_enabled: bool = Field(default=os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes"))
+    # When set, scrapers must send `Authorization: Bearer <token>`; when empty
+    # the endpoint is open and must not be reachable from outside
+    metrics_token: str = ""
 
     # CORS / Client
     cors_origins: str = Field(default=os.getenv("CORS_ORIGINS", "http://localhost:5173"))
     socket_cors_origin: str = Field(default=os.getenv("SOCKET_CORS_ORIGIN", "http://localhost:5173"))
+    # Empty for a single worker, redis://host:6379/0 or local://127.0.0.1:7465 for several
+    socket_manager_url: str = Field(default=os.getenv("SOCKET_MANAGER_URL", ""))
+
+    # Realtime editor
+    editor_history_limit: int = 500
+    editor_flush_interval: float = 2.0
+    editor_flush_batch_size: int = 100
+    # With several workers, the worker holding a document live renews its
+    # lease every flush, so the lease must outlast a few flush intervals;
+    # other workers wait this long for that worker to answer them
+    editor_lease_ttl: float = 10.0
+    editor_worker_timeout: float = 5.0
+    realtime_db_workers: int = 4
+    realtime_db_queue_limit: int = 256
+    realtime_db_queue_timeout: float = 5.0
+    # Outbound editor traffic, per connection: messages within the window are
+    # merged; a connection gets at most `editor_send_buffer` of them per window,
+    # none while its transport queue holds more than that, and past the queue
+    # limit its ops are rebuilt from history when it catches up. A transport
+    # queue past the limit disconnects it.
+    editor_broadcast_window: float = 0.03
+    editor_send_buffer: int = 16
+    editor_queue_limit: int = 256
+    # Largest inbound Socket.IO message, and the most a deflated msgpack
+    # payload may inflate to
+    socket_max_payload_bytes: int = 1_000_000
+    # Binary payloads are off unless enabled; the bundled client speaks JSON.
+    # For clients that negotiated msgpack, smaller payloads stay JSON (binary
+    # frames carry a fixed header) and larger ones are deflated
+    socket_msgpack: bool = False
+    socket_binary_min_bytes: int = 256
+    socket_compress_min_bytes: int = 2048
+    socket_compress_level: int = 1
+    # Presence: cursor broadcasts per connection at most every interval;
+    # members silent for the timeout are dropped
+    presence_interval: float = 0.05
+    presence_timeout: float = 30.0
+    # Saved revisions: a full snapshot at least every `revision_chain_limit` deltas
+    revision_chain_limit: int = 50
+    revision_compression_level: int = 6
+
+    # Chat persistence
+    chat_flush_interval: float = 0.5
+    chat_batch_size: int = 200
+    chat_queue_size: int = 10000
 
     class Config:
         env_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
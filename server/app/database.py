@@ -1,27 +1,144 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from anyio import CapacityLimiter, to_thread
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
 from .config import settings
-from .utils.db_init import ensure_database_exists
+from .metrics import TimedQueuePool, pool_timeouts, session_wait, watch_pool
 
 
-ensure_database_exists()
-
-DATABASE_URL = f"mysql+pymysql://{settings.db_user}:{settings.db_password}@{settings.db_host}/{settings.db_name}?charset=utf8mb4"
+DATABASE_URL = settings.database_url or f"mysql+pymysql://{settings.db_user}:{settings.db_password}@{settings.db_host}/{settings.db_name}?charset=utf8mb4"
+# SQLite connections are shared with the threadpool that runs sync routes
+CONNECT_ARGS = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=3600)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def build_engine(name: str, pool_size: int, max_overflow: int) -> Engine:
+    """Engine with the pool settings from `settings.db_pool_*`, reported to /metrics as `name`."""
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args=CONNECT_ARGS,
+        poolclass=TimedQueuePool,
+        pool_logging_name=name,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping == "always",
+    )
+    if settings.db_pool_pre_ping == "idle":
+        _ping_when_idle(engine, settings.db_pool_ping_idle)
+    watch_pool(name, engine, pool_size + max_overflow)
+    return engine
+
+
+def _ping_when_idle(engine: Engine, idle: float) -> None:
+    # Busy connections skip the round trip; ones that sat unused long enough
+    # for a firewall or wait_timeout to drop them are checked first
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, record):
+        record.info["checked_in"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, record, proxy):
+        since = record.info.pop("checked_in", None)
+        if since is None or time.monotonic() - since < idle:
+            return
+        try:
+            engine.dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            # The pool discards this connection and checks out a fresh one
+            raise exc.DisconnectionError() from e
+
+
+# Built on first use so importing the app never loads a DB driver or touches
+# the network; schema setup is an explicit step (utils.db_init.init_db).
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+_sessionmaker = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = build_engine("http", settings.db_pool_size, settings.db_pool_max_overflow)
+    return _engine
+
+
+def SessionLocal() -> Session:
+    return _sessionmaker(bind=get_engine())
+
+
+# Requests queue for a session slot here rather than for a connection inside
+# the pool, so a wait past `db_pool_timeout` is a 503 and shows up in metrics.
+# A slot is only taken when the request first needs a connection: requests
+# answered from caches never queue.
+_capacity = settings.db_pool_size + settings.db_pool_max_overflow
+_sessions = threading.BoundedSemaphore(_capacity)
+# Closing may roll back over the network; a limiter of its own keeps it off
+# the loop without waiting for a busy threadpool
+_closing = CapacityLimiter(_capacity)
+
+
+class _RequestSession(Session):
+    def get_bind(self, *args, **kwargs):
+        # Called before every connection the session uses; takes the slot once
+        if not self.info["slot"]:
+            _take_slot()
+            self.info["slot"] = True
+        return super().get_bind(*args, **kwargs)
+
 
+def _take_slot() -> None:
+    start = time.perf_counter()
+    if not _sessions.acquire(timeout=settings.db_pool_timeout):
+        pool_timeouts.inc("http")
+        raise HTTPException(status_code=503, detail="Database busy, try again")
+    if settings.metrics_enabled:
+        session_wait.observe(time.perf_counter() - start)
 
-def get_db():
-    db = SessionLocal()
+
+_request_sessionmaker = sessionmaker(class_=_RequestSession, autocommit=False, autoflush=False)
+
+
+def _close(db: Session) -> None:
+    try:
+        db.close()
+    finally:
+        if db.info["slot"]:
+            _sessions.release()
+
+
+@contextmanager
+def request_session() -> Iterator[Session]:
+    """A get_db session for code already off the event loop."""
+    db = _request_sessionmaker(bind=get_engine(), info={"slot": False})
     try:
         yield db
     finally:
-        db.close()
+        _close(db)
+
+
+async def get_db():
+    db = _request_sessionmaker(bind=get_engine(), info={"slot": False})
+    try:
+        yield db
+    finally:
+        if db.info["slot"]:
+            await to_thread.run_sync(_close, db, limiter=_closing)
+        else:
+            db.close()
 
 
+def dispose_engine() -> None:
+    if _engine is not None:
+        _engine.dispose()
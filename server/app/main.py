@@ -1,19 +1,58 @@
+import asyncio
+from contextlib import asynccontextmanager
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
 from .routers import users, sessions, ai
-from .database import engine
-from . import models
-from .realtime.socket import sio
+from . import metrics, ratelimit
+from .assist import assistant
+from .database import dispose_engine
+from .realtime.socket import sio, presence, bus
+from .realtime.documents import store
+from .realtime.chat import chat_writer
+from .realtime import db as realtime_db
+from .utils import passwords
+from .utils.db_init import init_db
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.routing import Mount
 from socketio import ASGIApp
 
 
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.http_threads
+    metrics.watch_threads(limiter)
+    # Schema work happens here rather than at import, so importing the app is
+    # cheap and an unreachable database fails startup instead of hanging it
+    if settings.db_auto_migrate:
+        await asyncio.to_thread(init_db)
+    if bus is not None:
+        bus.start()
+    store.start()
+    chat_writer.start()
+    presence.start()
+    assistant.start()
+    try:
+        yield
+    finally:
+        # Write back every dirty live document and queued chat message before the worker exits
+        await assistant.stop()
+        await presence.stop()
+        await chat_writer.stop()
+        await store.stop()
+        if bus is not None:
+            await bus.stop()
+        realtime_db.shutdown()
+        dispose_engine()
+        passwords.shutdown()
 
-app = FastAPI(title=settings.app_name)
 
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
+
+# Innermost, so refusals still carry CORS headers and show up in metrics
+app.add_middleware(ratelimit.RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[o.strip() for o in settings.cors_origins.split(",")],
@@ -23,10 +62,12 @@ app.add_middleware(
 )
 
 app.add_middleware(SessionMiddleware, secret_key=settings.jwt_secret)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(users.router)
 app.include_router(sessions.router)
 app.include_router(ai.router)
+app.include_router(metrics.router)
 
 # Mount Socket.IO
 socket_app = ASGIApp(sio, other_asgi_app=app)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import hmac
+import time
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from .config import settings
+from .utils.metrics import Registry
+
+
+registry = Registry()
+
+http_latency = registry.histogram("devhub_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+http_queries = registry.histogram(
+    "devhub_http_request_queries", "Database queries per HTTP request by route", ("method", "route"), buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+)
+db_queries = registry.counter("devhub_db_queries_total", "Database statements executed")
+pool_wait = registry.histogram(
+    "devhub_db_pool_checkout_seconds", "Time spent waiting for a pooled connection", ("pool",), buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+session_wait = registry.histogram(
+    "devhub_db_session_wait_seconds", "Time HTTP requests queue for a database session", buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+pool_timeouts = registry.counter("devhub_db_pool_timeouts_total", "Checkouts or HTTP session waits that gave up after the pool timeout", ("pool",))
+socket_events = registry.counter("devhub_socket_events_total", "Socket.IO packets by event and direction", ("direction", "event"))
+socket_bytes = registry.counter("devhub_socket_bytes_total", "Socket.IO payload bytes by event and direction", ("direction", "event"))
+
+# name -> (pool, size + max overflow)
+_pools: dict[str, tuple[QueuePool, int]] = {}
+_threads: list = []
+
+
+def _pool_stats() -> dict:
+    out = {}
+    for name, (pool, capacity) in _pools.items():
+        out[(name, "size")] = pool.size()
+        out[(name, "capacity")] = capacity
+        out[(name, "checked_out")] = pool.checkedout()
+        out[(name, "overflow")] = max(0, pool.overflow())
+    return out
+
+
+def _pool_saturation() -> dict:
+    return {(name,): pool.checkedout() / capacity for name, (pool, capacity) in _pools.items() if capacity}
+
+
+def _thread_stats() -> dict:
+    if not _threads:
+        return {}
+    limiter = _threads[0]
+    return {("size",): limiter.total_tokens, ("busy",): limiter.borrowed_tokens}
+
+
+registry.gauge("devhub_db_pool_connections", "Connection pool state", _pool_stats, ("pool", "state"))
+registry.gauge("devhub_db_pool_saturation", "Checked-out connections as a fraction of pool capacity", _pool_saturation, ("pool",))
+registry.gauge("devhub_http_threads", "Threads running sync routes", _thread_stats, ("state",))
+
+# Per-request query counter; a list so worker threads can bump the caller's copy
+_request_queries: ContextVar[Optional[list]] = ContextVar("request_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if not settings.metrics_enabled:
+        return
+    db_queries.inc()
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait; named by `pool_logging_name`."""
+
+    def _do_get(self):
+        if not settings.metrics_enabled:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts.inc(self.logging_name or "default")
+            raise
+        finally:
+            pool_wait.observe(time.perf_counter() - start, self.logging_name or "default")
+
+
+def watch_pool(name: str, engine: Engine, capacity: int) -> None:
+    if isinstance(engine.pool, QueuePool):
+        _pools[name] = (engine.pool, capacity)
+
+
+def watch_threads(limiter) -> None:
+    """Report the anyio limiter that sync routes run under; call from the event loop."""
+    _threads[:] = [limiter]
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and counts its queries, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_queries.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot blow up cardinality
+            path = getattr(route, "path", None) or "unmatched"
+            http_latency.observe(elapsed, scope["method"], path, str(status[0]))
+            http_queries.observe(queries[0], scope["method"], path)
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics(authorization: str = Header(default="")):
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_token and not hmac.compare_digest(authorization.encode(), f"Bearer {settings.metrics_token}".encode()):
+        raise HTTPException(status_code=401, detail="Unauthorized", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
 from .database import Base
@@ -37,16 +37,53 @@ class Document(Base):
     title: Mapped[str] = mapped_column(String(255), default="Untitled")
     content: Mapped[str] = mapped_column(Text, default="")
     language: Mapped[str] = mapped_column(String(32), default="typescript")
+    # Bumped by every content change; patches name the revision they were made against
+    revision: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     session = relationship("Session", back_populates="documents")
 
 
+class DocumentRevision(Base):
+    """One saved revision of a document.
+
+    Rows with depth 0 hold a compressed snapshot of the content; a row with
+    depth n holds the compressed edits leading to it from the previous row,
+    which is n - 1 deltas away from its snapshot.
+    """
+    __tablename__ = "document_revisions"
+    __table_args__ = (UniqueConstraint("document_id", "revision", name="uq_document_revisions_document_id_revision"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    document_id: Mapped[int] = mapped_column(ForeignKey("documents.id"), nullable=False)
+    revision: Mapped[int] = mapped_column(Integer, nullable=False)
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary(2**24), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class DocumentLease(Base):
+    """The worker holding a document live, until its lease runs out.
+
+    With several workers only the lease holder edits and saves a document;
+    the others hand it their edits. No foreign key: a lease on a deleted
+    document just runs out.
+    """
+    __tablename__ = "document_leases"
+
+    document_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    # Client manager host id of the worker
+    worker: Mapped[str] = mapped_column(String(64), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    # History pages are range scans over this index
+    __table_args__ = (Index("ix_chat_messages_session_id_id", "session_id", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    session_id: Mapped[int] = mapped_column(ForeignKey("sessions.id"), index=True)
+    session_id: Mapped[int] = mapped_column(ForeignKey("sessions.id"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
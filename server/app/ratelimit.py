@@ -0,0 +1,89 @@
+from __future__ import annotations
+import math
+import jwt
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from .config import settings
+from .metrics import registry
+from .utils.ratelimit import Buckets, create_buckets, parse_rate
+
+
+buckets: Buckets = create_buckets(settings.rate_limit_url)
+# Limits are parsed on every check; a malformed one fails at startup instead
+for _name, _spec in settings.model_dump().items():
+    if _name.startswith("rate_limit_") and _name != "rate_limit_url" and isinstance(_spec, str):
+        parse_rate(_spec)
+limited = registry.counter("devhub_rate_limited_total", "Requests and socket events over a rate limit", ("limit",))
+
+
+async def check(limit: str, spec: str, key: str) -> float:
+    """0 if `key` is within the `limit` bucket's rate, else seconds to wait."""
+    rate = parse_rate(spec)
+    if rate is None:
+        return 0.0
+    wait = await buckets.take(f"{limit}:{key}", rate)
+    if wait and settings.metrics_enabled:
+        limited.inc(limit)
+    return wait
+
+
+def client_ip(scope) -> str:
+    if settings.rate_limit_trust_forwarded:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                # The last hop is the one our proxy saw
+                return value.decode("latin-1").rsplit(",", 1)[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _identity(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                try:
+                    return "user:" + jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])["sub"]
+                except Exception:
+                    pass
+            break
+    return "ip:" + client_ip(scope)
+
+
+def _headers(wait: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(wait)))}
+
+
+class RateLimitMiddleware:
+    """Per-user limit on /api requests (per client IP without a valid token),
+    checked before routing so refused requests cost no thread or connection."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or parse_rate(settings.rate_limit_http) is None:
+            return await self.app(scope, receive, send)
+        wait = await check("http", settings.rate_limit_http, _identity(scope))
+        if wait:
+            response = JSONResponse({"detail": "Too many requests, please retry later"}, status_code=429, headers=_headers(wait))
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+def _refuse(wait: float) -> None:
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many attempts, please retry later", headers=_headers(wait))
+
+
+async def limit_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> None:
+    # Per IP against password spraying, per account against guessing one password
+    _refuse(
+        await check("login_ip", settings.rate_limit_login_ip, client_ip(request.scope))
+        or await check("login_account", settings.rate_limit_login_account, form_data.username.strip().lower())
+    )
+
+
+async def limit_register(request: Request) -> None:
+    _refuse(await check("register_ip", settings.rate_limit_register_ip, client_ip(request.scope)))
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Optional, Union
+import socketio
+
+
+logger = logging.getLogger(__name__)
+
+# Messages between workers ride the client manager as emits to this
+# namespace, which no client connects to
+NAMESPACE = "/devhub-workers"
+
+Handler = Callable[[dict, str], Union[Any, Awaitable[Any]]]
+
+
+class WorkerBus:
+    """Messages between the workers that share a client manager.
+
+    `send` reaches one worker, by its manager's host id, or all the others;
+    `request` also waits for the handler's return value. A worker publishes
+    its messages one at a time in the order they were sent, so every other
+    worker receives them in that order. A plain handler runs as its message
+    arrives, before the next one is looked at; a coroutine handler is started
+    as a task in arrival order. Delivery is at most once, like the rest of
+    the manager's traffic.
+    """
+
+    def __init__(self, manager: socketio.AsyncManager):
+        self.manager = manager
+        self.host: str = manager.host_id
+        self._handlers: dict[str, Handler] = {}
+        self._replies: dict[str, asyncio.Future] = {}
+        self._outgoing: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        # The server only starts the manager's listener on its first
+        # connection; a worker without clients still has to hear the others
+        server = self.manager.server
+        if not server.manager_initialized:
+            server.manager_initialized = True
+            self.manager.initialize()
+
+    def on(self, event: str, handler: Handler) -> None:
+        self._handlers[event] = handler
+
+    def send(self, event: str, data: dict, host: Optional[str] = None) -> None:
+        if self._outgoing is None:
+            self._outgoing = asyncio.Queue()
+            self._task = asyncio.create_task(self._publish())
+        self._outgoing.put_nowait((event, data, host))
+
+    async def request(self, host: str, event: str, data: dict, timeout: float) -> Any:
+        """The return value of `host`'s handler for `event`; raises asyncio.TimeoutError."""
+        request_id = uuid.uuid4().hex
+        future = self._replies[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            self.send(event, {**data, "request_id": request_id}, host)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._replies.pop(request_id, None)
+
+    async def _publish(self) -> None:
+        while True:
+            event, data, host = await self._outgoing.get()
+            try:
+                await self.manager.emit(event, data, namespace=NAMESPACE, room=host)
+            except Exception:
+                logger.exception("could not publish %s", event)
+            finally:
+                self._outgoing.task_done()
+
+    def receive(self, message: dict) -> None:
+        """Called by the manager for every message another worker published."""
+        host = message.get("room")
+        if host is not None and host != self.host:
+            return
+        event, data, sender = message.get("event"), message["data"][0], message.get("host_id")
+        if event == "reply":
+            future = self._replies.get(data["request_id"])
+            if future is not None and not future.done():
+                future.set_result(data["result"])
+            return
+        handler = self._handlers.get(event)
+        if handler is None:
+            return
+        try:
+            result = handler(data, sender)
+        except Exception:
+            logger.exception("worker message %s failed", event)
+            return
+        if asyncio.iscoroutine(result):
+            asyncio.create_task(self._answer(data, sender, result))
+        elif "request_id" in data:
+            self.send("reply", {"request_id": data["request_id"], "result": result}, sender)
+
+    async def _answer(self, data: dict, sender: str, pending: Awaitable) -> None:
+        try:
+            result = await pending
+        except Exception:
+            logger.exception("worker message failed")
+            return
+        if "request_id" in data:
+            self.send("reply", {"request_id": data["request_id"], "result": result}, sender)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Publish what was sent before stopping, within reason
+            try:
+                await asyncio.wait_for(self._outgoing.join(), 5.0)
+            except asyncio.TimeoutError:
+                pass
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
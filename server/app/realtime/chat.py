@@ -0,0 +1,130 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..metrics import registry
+from .. import models
+from ..session_codes import resolve_many
+from .db import run_db
+
+
+logger = logging.getLogger(__name__)
+
+flush_seconds = registry.histogram(
+    "devhub_chat_flush_seconds", "Time to persist one batch of chat messages", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+
+class PendingMessage(NamedTuple):
+    room: str
+    user_email: str
+    content: str
+    created_at: datetime
+
+
+def _write_batch(db: Session, batch: list[PendingMessage]) -> int:
+    emails = {m.user_email for m in batch}
+    session_ids = {code: ref.id for code, ref in resolve_many(db, (m.room for m in batch)).items()}
+    user_ids = dict(db.query(models.User.email, models.User.id).filter(models.User.email.in_(emails)).all())
+    rows = [
+        {"session_id": session_ids[m.room], "user_id": user_ids[m.user_email], "content": m.content, "created_at": m.created_at}
+        for m in batch
+        if m.room in session_ids and m.user_email in user_ids
+    ]
+    if rows:
+        db.execute(insert(models.ChatMessage), rows)
+        db.commit()
+    return len(rows)
+
+
+class ChatWriter:
+    """Write-behind queue for chat messages.
+
+    Messages are persisted with one multi-row INSERT per `chat_flush_interval`
+    or `chat_batch_size` messages. The queue holds at most `chat_queue_size`
+    messages; beyond that `submit` waits, pushing back on the sender.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue[PendingMessage]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "queue_capacity": settings.chat_queue_size,
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+        }
+
+    async def submit(self, room: str, user_email: str, content: str, created_at: datetime) -> None:
+        if self._queue is None:
+            raise RuntimeError("chat writer is not running")
+        await self._queue.put(PendingMessage(room, user_email, content, created_at))
+
+    async def _flush(self, queue: asyncio.Queue, batch: list[PendingMessage]) -> None:
+        started = time.perf_counter()
+        try:
+            self.written += await run_db(_write_batch, batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("failed to persist %d chat messages", len(batch))
+        finally:
+            self.last_flush_seconds = time.perf_counter() - started
+            if settings.metrics_enabled:
+                flush_seconds.observe(self.last_flush_seconds)
+            self.max_flush_seconds = max(self.max_flush_seconds, self.last_flush_seconds)
+            self.batches += 1
+            for _ in batch:
+                queue.task_done()
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if queue.qsize() < settings.chat_batch_size:
+                # Give the batch a moment to fill up
+                await asyncio.sleep(settings.chat_flush_interval)
+            while len(batch) < settings.chat_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            await self._flush(queue, batch)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=settings.chat_queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("dropping %d unsaved chat messages at shutdown", self.depth)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
+
+
+chat_writer = ChatWriter()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import zlib
+from typing import Any, Optional, Union
+import msgpack
+import socketio
+from ..config import settings
+
+
+# Leading byte of a packed payload
+RAW = 0
+DEFLATE = 1
+
+ENCODINGS = ("json", "msgpack")
+
+
+def pack(data: Any) -> Union[Any, bytes]:
+    """Wire form of `data` for a msgpack client.
+
+    Socket.IO frames every binary payload with a ~40 byte placeholder header,
+    so payloads that pack smaller than `socket_binary_min_bytes` stay JSON;
+    clients that negotiated msgpack accept both.
+    """
+    body = msgpack.packb(data, use_bin_type=True)
+    if len(body) < settings.socket_binary_min_bytes:
+        return data
+    if len(body) >= settings.socket_compress_min_bytes:
+        return bytes([DEFLATE]) + zlib.compress(body, settings.socket_compress_level)
+    return bytes([RAW]) + body
+
+
+def unpack(raw: Any) -> Any:
+    """Inverse of `pack`; anything that is not bytes is already decoded.
+
+    Bytes that do not decode, inflate past `socket_max_payload_bytes`, or
+    arrive while msgpack is disabled give None, which handlers treat like
+    any other payload missing its fields.
+    """
+    if not isinstance(raw, (bytes, bytearray)):
+        return raw
+    if not settings.socket_msgpack or not raw:
+        return None
+    body = raw[1:]
+    try:
+        if raw[0] == DEFLATE:
+            inflate = zlib.decompressobj()
+            body = inflate.decompress(body, settings.socket_max_payload_bytes)
+            if inflate.unconsumed_tail:
+                return None
+        return msgpack.unpackb(body, raw=False)
+    except (zlib.error, ValueError, TypeError, msgpack.UnpackException):
+        return None
+
+
+class Wire:
+    """Per-connection payload encoding, negotiated at join_session.
+
+    Connections that asked for msgpack get packed payloads, when
+    `socket_msgpack` allows it; everybody else keeps plain JSON.
+    """
+
+    def __init__(self):
+        self.encodings: dict[str, str] = {}
+
+    def negotiate(self, sid: str, requested: Any) -> str:
+        encoding = requested if requested in ENCODINGS and settings.socket_msgpack else "json"
+        if encoding == "json":
+            self.encodings.pop(sid, None)
+        else:
+            self.encodings[sid] = encoding
+        return encoding
+
+    def discard(self, sid: str) -> None:
+        self.encodings.pop(sid, None)
+
+    def payload(self, sid: str, data: Any) -> Any:
+        return pack(data) if sid in self.encodings else data
+
+    async def emit(self, sio: socketio.AsyncServer, event: str, data: Any, to: Optional[str] = None, room: Optional[str] = None, skip_sid: Optional[str] = None) -> None:
+        if to is not None:
+            await sio.emit(event, self.payload(to, data), to=to)
+            return
+        packed = [sid for sid, _ in sio.manager.get_participants("/", room) if sid in self.encodings and sid != skip_sid]
+        if not packed:
+            await sio.emit(event, data, room=room, skip_sid=skip_sid)
+            return
+        # JSON to the room (and other workers), packed once to local msgpack members
+        await sio.emit(event, data, room=room, skip_sid=packed + ([skip_sid] if skip_sid else []))
+        body = pack(data)
+        for sid in packed:
+            await sio.emit(event, body, to=sid, ignore_queue=True)
+
+
+wire = Wire()
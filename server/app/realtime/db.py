@@ -0,0 +1,75 @@
+from __future__ import annotations
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from ..config import settings
+from ..database import build_engine
+from ..metrics import pool_timeouts
+
+
+T = TypeVar("T")
+
+
+class DatabaseBusy(Exception):
+    pass
+
+
+# Socket handlers never touch the database on the event loop. Their queries run
+# on a small dedicated thread pool with a connection pool of the same size, so
+# realtime persistence cannot starve (or be starved by) the HTTP routers.
+executor = ThreadPoolExecutor(max_workers=settings.realtime_db_workers, thread_name_prefix="realtime-db")
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+RealtimeSession = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = build_engine("realtime", settings.realtime_db_workers, 0)
+    return _engine
+
+
+# Work running or queued for a thread; callers wait up to
+# realtime_db_queue_timeout for a slot beyond that, then fail.
+_slots = asyncio.Semaphore(settings.realtime_db_workers + settings.realtime_db_queue_limit)
+
+
+def _call(fn: Callable[..., T], args: tuple) -> T:
+    db = RealtimeSession(bind=get_engine())
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def run_db(fn: Callable[..., T], *args: Any) -> T:
+    """Run `fn(db, *args)` on the realtime pool and await its result.
+
+    Raises DatabaseBusy when no slot frees up within `realtime_db_queue_timeout`.
+    """
+    try:
+        await asyncio.wait_for(_slots.acquire(), settings.realtime_db_queue_timeout)
+    except asyncio.TimeoutError:
+        pool_timeouts.inc("realtime")
+        raise DatabaseBusy("Database busy, try again")
+    loop = asyncio.get_running_loop()
+    try:
+        future = executor.submit(_call, fn, args)
+    except BaseException:
+        _slots.release()
+        raise
+    # Held until the thread is done, even if the caller stops waiting
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_slots.release))
+    return await asyncio.wrap_future(future)
+
+
+def shutdown() -> None:
+    executor.shutdown(wait=True)
+    if _engine is not None:
+        _engine.dispose()
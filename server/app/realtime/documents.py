@@ -0,0 +1,601 @@
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Awaitable, Callable, Iterable, Optional, Union
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..config import settings
+from .. import models
+from . import ot, revisions
+from .db import DatabaseBusy, run_db
+
+if TYPE_CHECKING:
+    from .bus import WorkerBus
+
+
+logger = logging.getLogger(__name__)
+
+
+class StaleRevision(Exception):
+    pass
+
+
+class StoreBusy(Exception):
+    """The store's event loop, or the worker holding the document, did not answer in time."""
+
+
+class DocumentState:
+    def __init__(self, document_id: int, session_id: int, content: str, rev: int = 0, chain: Optional[int] = None, owner: Optional[str] = None):
+        self.document_id = document_id
+        self.session_id = session_id
+        self.content = content
+        self.rev = rev
+        self.persisted_rev = rev
+        # Depth of the saved revision at persisted_rev; None when there is
+        # none, so the next save starts a new snapshot.
+        self.chain = chain
+        self.room: Optional[str] = None
+        # Whether members of `room` on this worker have the document open
+        self.in_use = False
+        # Set by every open, cleared by the store's sweep; only documents left
+        # alone for a whole flush interval are let go of there
+        self.touched = True
+        # Host id of the worker that owns the document when this is a
+        # read-only mirror of it, kept in step by that worker's fanouts; None
+        # when this worker owns it
+        self.owner = owner
+        # Workers mirroring this owned document -> when they last said so
+        self.watchers: dict[str, float] = {}
+        # Held while an edit is applied and announced, so every client sees
+        # acks and ops in revision order.
+        self.lock = asyncio.Lock()
+        # Ops applied to reach revisions rev - len(history) + 1 .. rev.
+        self.history: deque[ot.Op] = deque(maxlen=settings.editor_history_limit)
+
+    @property
+    def dirty(self) -> bool:
+        return self.owner is None and self.rev != self.persisted_rev
+
+    def follow(self, rev: int, op: ot.Op) -> bool:
+        """Apply the owner's op that made `rev` to a mirror; False if it does
+        not follow on from the mirror's revision."""
+        if rev != self.rev + 1:
+            return False
+        self.apply(self.rev, op)
+        return True
+
+    def apply(self, base_rev: int, op: ot.Op) -> ot.Op:
+        """Apply `op` made against `base_rev` and return it as applied.
+
+        An op that is or becomes empty changes nothing and leaves the
+        revision where it is.
+        """
+        if base_rev > self.rev:
+            raise StaleRevision(f"unknown revision {base_rev}")
+        behind = self.rev - base_rev
+        if behind > len(self.history):
+            raise StaleRevision(f"revision {base_rev} is too old")
+        for applied in list(self.history)[len(self.history) - behind:]:
+            op, _ = ot.transform(op, applied)
+        if not op:
+            return op
+        self.content = ot.apply(self.content, op)
+        self.history.append(op)
+        self.rev += 1
+        return op
+
+    def replace(self, content: str) -> ot.Op:
+        if content == self.content:
+            return []
+        return self.apply(self.rev, [ot.Edit(0, len(self.content), content)])
+
+    def revision_payload(self) -> tuple[int, Union[str, ot.Op]]:
+        """(depth, payload) of the revision row saving the current content:
+        the ops since the last save, or a snapshot once the chain is full,
+        the ops are gone from history or they outweigh the content."""
+        behind = self.rev - self.persisted_rev
+        if self.chain is not None and self.chain < settings.revision_chain_limit and behind <= len(self.history):
+            op = [e for applied in list(self.history)[len(self.history) - behind:] for e in applied]
+            if sum(len(e.insert) for e in op) < len(self.content):
+                return self.chain + 1, op
+        return 0, self.content
+
+
+def _load(db: Session, document_id: int) -> Optional[tuple[int, str, int, Optional[int]]]:
+    row = (
+        db.query(models.Document.session_id, models.Document.content, models.Document.revision)
+        .filter(models.Document.id == document_id)
+        .first()
+    )
+    if row is None:
+        return None
+    rev = row.revision or 0
+    return row.session_id, row.content or "", rev, revisions.chain_depth(db, document_id, rev)
+
+
+def _write(db: Session, rows: list[dict], saved: list[tuple]) -> None:
+    db.execute(update(models.Document), rows)
+    db.execute(insert(models.DocumentRevision), [revisions.row(*r) for r in saved])
+    db.commit()
+
+
+def _result(future: concurrent.futures.Future, timeout: float):
+    # The write is left to finish; it is applied and saved as usual, the
+    # caller just does not wait for it
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        raise StoreBusy("document store busy, try again") from None
+
+
+
+
+_Lease = models.DocumentLease
+
+
+def _claim_lease(db: Session, document_id: int, worker: str, ttl: float) -> str:
+    """Take the document's lease for `worker` unless another worker holds a
+    live one; returns the worker holding it afterwards."""
+    for _ in range(3):
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=ttl)
+        lease = db.get(_Lease, document_id)
+        if lease is None:
+            db.add(_Lease(document_id=document_id, worker=worker, expires_at=expires))
+            try:
+                db.commit()
+                return worker
+            except IntegrityError:
+                db.rollback()
+                continue
+        if lease.worker != worker and lease.expires_at > now:
+            return lease.worker
+        # Ours already, or run out: take it unless another worker just did
+        taken = db.execute(
+            update(_Lease)
+            .where(_Lease.document_id == document_id, _Lease.worker == lease.worker, _Lease.expires_at == lease.expires_at)
+            .values(worker=worker, expires_at=expires)
+        ).rowcount
+        db.commit()
+        if taken:
+            return worker
+    raise DatabaseBusy("document lease contended, try again")
+
+
+def _renew_leases(db: Session, document_ids: list[int], worker: str, ttl: float) -> set[int]:
+    # The documents whose lease `worker` still holds
+    expires = datetime.utcnow() + timedelta(seconds=ttl)
+    db.execute(update(_Lease).where(_Lease.document_id.in_(document_ids), _Lease.worker == worker).values(expires_at=expires))
+    held = set(db.scalars(select(_Lease.document_id).where(_Lease.document_id.in_(document_ids), _Lease.worker == worker)))
+    db.commit()
+    return held
+
+
+def _release_leases(db: Session, document_ids: list[int], worker: str) -> None:
+    db.execute(delete(_Lease).where(_Lease.document_id.in_(document_ids), _Lease.worker == worker))
+    db.commit()
+
+
+def _lease_holders(db: Session, document_ids: list[int]) -> dict[int, str]:
+    rows = db.execute(select(_Lease.document_id, _Lease.worker).where(_Lease.document_id.in_(document_ids), _Lease.expires_at > datetime.utcnow()))
+    return {document_id: worker for document_id, worker in rows}
+
+
+class DocumentStore:
+    """Authoritative copy of every document open in a room.
+
+    Live edits only touch memory; dirty documents are written back in batches
+    every `editor_flush_interval` seconds, when their room empties and at
+    shutdown.
+
+    With several workers (`bus` set), a document is live on the one worker
+    holding its lease in document_leases, renewed at every flush; no other
+    worker edits or saves it. The others that have it open keep a read-only
+    mirror, loaded from the owner and kept in step by the fanout the owner
+    publishes for every edit (see socket.py), and hand their edits to the
+    owner. A mirror that misses a fanout, or whose owner lets the document go
+    or stops holding its lease, is dropped and `on_drop` tells its editors to
+    open it again.
+    """
+
+    def __init__(self):
+        self._docs: dict[int, DocumentState] = {}
+        self._loading: dict[int, asyncio.Future] = {}
+        self._releasing: dict[int, asyncio.Future] = {}
+        # document_id -> (rev, op) fanouts that arrived while its mirror loads
+        self._watching: dict[int, list[tuple[int, ot.Op]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flushing = asyncio.Lock()
+        self.bus: Optional[WorkerBus] = None
+        # Called with (state, rev, op) for edits that did not come from a socket.
+        self.on_external_change: Optional[Callable[[DocumentState, int, ot.Op], Awaitable[None]]] = None
+        # Called with a document this worker had open and no longer has live.
+        self.on_drop: Optional[Callable[[DocumentState], None]] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def attach(self, bus: WorkerBus) -> None:
+        self.bus = bus
+        bus.on("doc_watch", self._on_watch)
+        bus.on("doc_watching", self._on_watching)
+        bus.on("doc_unwatch", self._on_unwatch)
+        bus.on("doc_closed", self._on_closed)
+        bus.on("doc_patch", self._on_patch)
+        bus.on("doc_replace", self._on_replace)
+
+    def get(self, document_id: int) -> Optional[DocumentState]:
+        return self._docs.get(document_id)
+
+    def for_session(self, session_id: int) -> list[DocumentState]:
+        return [s for s in list(self._docs.values()) if s.session_id == session_id]
+
+    async def open(self, document_id: int) -> Optional[DocumentState]:
+        """The live copy of a document, or this worker's mirror of it."""
+        state = self._docs.get(document_id)
+        if state is None:
+            pending = self._loading.get(document_id)
+            if pending is None:
+                pending = self._loading[document_id] = asyncio.ensure_future(self._load_state(document_id))
+                pending.add_done_callback(lambda _: self._loading.pop(document_id, None))
+            state = await asyncio.shield(pending)
+            if state is None:
+                return None
+        state.touched = True
+        return state
+
+    async def _load_state(self, document_id: int) -> Optional[DocumentState]:
+        releasing = self._releasing.get(document_id)
+        if releasing is not None:
+            await asyncio.wait([releasing])
+        if self.bus is not None:
+            holder = await run_db(_claim_lease, document_id, self.bus.host, settings.editor_lease_ttl)
+            if holder != self.bus.host:
+                return await self._watch(document_id, holder)
+        row = await run_db(_load, document_id)
+        if row is None:
+            if self.bus is not None:
+                await run_db(_release_leases, [document_id], self.bus.host)
+            return None
+        state = self._docs[document_id] = DocumentState(document_id, *row)
+        return state
+
+    async def _watch(self, document_id: int, owner: str) -> Optional[DocumentState]:
+        self._watching[document_id] = []
+        try:
+            reply = await self.bus.request(owner, "doc_watch", {"document_id": document_id}, settings.editor_worker_timeout)
+        except asyncio.TimeoutError:
+            reply = None
+        finally:
+            missed = self._watching.pop(document_id)
+        if reply is None:
+            raise StoreBusy("the worker holding the document did not answer, try again")
+        state = DocumentState(document_id, reply["session_id"], reply["content"], reply["rev"], owner=owner)
+        for rev, op in missed:
+            if rev > state.rev and not state.follow(rev, op):
+                self.bus.send("doc_unwatch", {"document_id": document_id}, owner)
+                raise StoreBusy("the document changed while it was opened, try again")
+        self._docs[document_id] = state
+        return state
+
+    def follow(self, owner: str, document_id: int, rev: int, op: ot.Op) -> bool:
+        """Apply an owner's fanout to this worker's mirror of the document.
+
+        False when its editors should not get the op: they have already seen
+        it, or the mirror missed an earlier one and has been dropped.
+        """
+        missed = self._watching.get(document_id)
+        if missed is not None:
+            missed.append((rev, op))
+            return True
+        state = self._docs.get(document_id)
+        if state is None or state.owner != owner:
+            return True
+        if rev <= state.rev:
+            return False
+        if not state.follow(rev, op):
+            self._forget(state)
+            self.bus.send("doc_unwatch", {"document_id": document_id}, owner)
+            return False
+        return True
+
+    def _forget(self, state: DocumentState) -> None:
+        # Drop a document this worker can no longer keep live or in step
+        if self._docs.get(state.document_id) is state:
+            del self._docs[state.document_id]
+            if self.on_drop is not None:
+                self.on_drop(state)
+
+    def _on_watch(self, data: dict, sender: str) -> Awaitable[Optional[dict]]:
+        return self._watched(data["document_id"], sender)
+
+    async def _watched(self, document_id: int, sender: str) -> Optional[dict]:
+        state = self._docs.get(document_id)
+        pending = self._loading.get(document_id)
+        if state is None and pending is not None:
+            try:
+                state = await asyncio.shield(pending)
+            except Exception:
+                # Not ours after all; the asking worker tries again
+                return None
+        if state is None or state.owner is not None or self._docs.get(document_id) is not state:
+            return None
+        state.watchers[sender] = time.monotonic()
+        return {"session_id": state.session_id, "rev": state.rev, "content": state.content}
+
+    def _on_watching(self, data: dict, sender: str) -> None:
+        now = time.monotonic()
+        for document_id in data["document_ids"]:
+            state = self._docs.get(document_id)
+            if state is not None and state.owner is None:
+                state.watchers[sender] = now
+
+    def _on_unwatch(self, data: dict, sender: str) -> None:
+        state = self._docs.get(data["document_id"])
+        if state is not None:
+            state.watchers.pop(sender, None)
+
+    def _on_closed(self, data: dict, sender: str) -> None:
+        state = self._docs.get(data["document_id"])
+        if state is not None and state.owner == sender:
+            self._forget(state)
+
+    def _owns(self, document_id: int) -> bool:
+        state = self._docs.get(document_id)
+        return state is not None and state.owner is None
+
+    async def _owner_of(self, document_id: int) -> Optional[str]:
+        # The worker holding a document live when it is not this one
+        state = self._docs.get(document_id)
+        if state is not None:
+            return state.owner
+        if self.bus is None or document_id in self._loading:
+            return None
+        holder = (await run_db(_lease_holders, [document_id])).get(document_id)
+        return holder if holder != self.bus.host else None
+
+    async def _forward(self, owner: str, event: str, data: dict) -> Optional[dict]:
+        try:
+            reply = await self.bus.request(owner, event, data, settings.editor_worker_timeout)
+        except asyncio.TimeoutError:
+            raise StoreBusy("the worker holding the document did not answer, try again") from None
+        if reply is not None and reply.get("error") == "moved":
+            raise StoreBusy("the document is moving between workers, try again")
+        return reply
+
+    def _idle(self, state: DocumentState) -> bool:
+        return not state.in_use and not state.watchers and not state.dirty and not state.lock.locked()
+
+    async def _drop(self, state: DocumentState) -> None:
+        # Let go of a document nobody here uses: unwatch a mirror, or give up
+        # the lease of an owned document once it is saved
+        document_id = state.document_id
+        if self._docs.get(document_id) is not state:
+            return
+        del self._docs[document_id]
+        if self.bus is None:
+            return
+        if state.owner is not None:
+            self.bus.send("doc_unwatch", {"document_id": document_id}, state.owner)
+            return
+        self.bus.send("doc_closed", {"document_id": document_id})
+        release = self._releasing[document_id] = asyncio.ensure_future(run_db(_release_leases, [document_id], self.bus.host))
+        release.add_done_callback(lambda f: self._releasing.pop(document_id) if self._releasing.get(document_id) is f else None)
+        try:
+            await asyncio.shield(release)
+        except Exception:
+            # It runs out by itself
+            logger.exception("failed to release the lease of document %d", document_id)
+
+    async def flush(self, document_ids: Optional[Iterable[int]] = None) -> int:
+        # One flush at a time, so a revision is never saved twice
+        async with self._flushing:
+            return await self._flush(document_ids)
+
+    async def _flush(self, document_ids: Optional[Iterable[int]]) -> int:
+        states = [self._docs[i] for i in document_ids if i in self._docs] if document_ids is not None else list(self._docs.values())
+        dirty = [s for s in states if s.dirty]
+        written = 0
+        for start in range(0, len(dirty), settings.editor_flush_batch_size):
+            batch = dirty[start:start + settings.editor_flush_batch_size]
+            now = datetime.utcnow()
+            revs = [s.rev for s in batch]
+            rows = [{"id": s.document_id, "content": s.content, "revision": s.rev, "updated_at": now} for s in batch]
+            saved = [(s.document_id, s.rev, *s.revision_payload()) for s in batch]
+            try:
+                await run_db(_write, rows, saved)
+            except Exception:
+                logger.exception("failed to flush %d documents", len(rows))
+                continue
+            for s, rev, (_, _, depth, _) in zip(batch, revs, saved):
+                s.persisted_rev = rev
+                s.chain = depth
+            written += len(rows)
+        return written
+
+    async def close_room(self, room: str) -> None:
+        states = [s for s in self._docs.values() if s.room == room]
+        for s in states:
+            s.in_use = False
+        await self.flush([s.document_id for s in states])
+        for s in states:
+            if self._idle(s):
+                await self._drop(s)
+
+    async def _keep(self) -> None:
+        # Renew the leases of owned documents, drop the ones lost while this
+        # worker stalled, and check every mirror's owner still holds its lease
+        owned = [s for s in self._docs.values() if s.owner is None]
+        mirrors = [s for s in self._docs.values() if s.owner is not None]
+        if owned:
+            held = await run_db(_renew_leases, [s.document_id for s in owned], self.bus.host, settings.editor_lease_ttl)
+            for state in owned:
+                if state.document_id not in held:
+                    logger.warning("lost the lease of document %d at revision %d", state.document_id, state.rev)
+                    self.bus.send("doc_closed", {"document_id": state.document_id})
+                    self._forget(state)
+        if mirrors:
+            holders = await run_db(_lease_holders, [s.document_id for s in mirrors])
+            by_owner: dict[str, list[int]] = {}
+            for state in mirrors:
+                if holders.get(state.document_id) != state.owner:
+                    self._forget(state)
+                else:
+                    by_owner.setdefault(state.owner, []).append(state.document_id)
+            for owner, document_ids in by_owner.items():
+                self.bus.send("doc_watching", {"document_ids": document_ids}, owner)
+        # Mirrors that went away without unwatching
+        cutoff = time.monotonic() - settings.editor_lease_ttl
+        for state in owned:
+            state.watchers = {host: seen for host, seen in state.watchers.items() if seen > cutoff}
+
+    async def _sweep(self) -> None:
+        # Let go of documents opened for something that has finished, or
+        # whose flush failed when they were closed
+        for state in list(self._docs.values()):
+            if state.touched:
+                state.touched = False
+            elif self._idle(state):
+                await self._drop(state)
+
+    def patch_threadsafe(self, document_id: int, base_rev: int, op: ot.Op, timeout: float = 10.0) -> Optional[tuple[int, str]]:
+        """Apply `op` made against `base_rev` from a worker thread and persist it.
+
+        Returns (revision, content) afterwards, None for an unknown document.
+        Raises StaleRevision when the document has moved past `base_rev`,
+        ValueError when the op does not fit the document and StoreBusy when
+        the loop, or the worker holding the document, does not answer within
+        `timeout`.
+        """
+        if self._loop is None:
+            raise RuntimeError("document store is not running")
+        future = asyncio.run_coroutine_threadsafe(self._patch(document_id, base_rev, op), self._loop)
+        return _result(future, timeout)
+
+    async def _patch(self, document_id: int, base_rev: int, op: ot.Op) -> Optional[tuple[int, str]]:
+        owner = await self._owner_of(document_id)
+        state = None
+        try:
+            if owner is None:
+                state = await self.open(document_id)
+                if state is None:
+                    return None
+                owner = state.owner
+            if owner is not None:
+                reply = await self._forward(owner, "doc_patch", {"document_id": document_id, "base_rev": base_rev, "ops": ot.dump_op(op)})
+                if reply is None:
+                    return None
+                if reply.get("error") == "stale":
+                    raise StaleRevision(reply["detail"])
+                if reply.get("error") == "range":
+                    raise ValueError("op range outside document")
+                return reply["rev"], reply["content"]
+            async with state.lock:
+                if base_rev != state.rev:
+                    raise StaleRevision(f"document is at revision {state.rev}")
+                op = state.apply(base_rev, op)
+                result = state.rev, state.content
+                if op and self.on_external_change is not None:
+                    await self.on_external_change(state, state.rev, op)
+            await self.flush([document_id])
+            return result
+        finally:
+            if state is not None and self._idle(state):
+                await self._drop(state)
+
+    async def _on_patch(self, data: dict, sender: str) -> Optional[dict]:
+        if not self._owns(data["document_id"]):
+            return {"error": "moved"}
+        try:
+            result = await self._patch(data["document_id"], data["base_rev"], ot.parse_op(data["ops"]))
+        except StaleRevision as e:
+            return {"error": "stale", "detail": str(e)}
+        except ValueError:
+            return {"error": "range"}
+        return None if result is None else {"rev": result[0], "content": result[1]}
+
+    def replace_threadsafe(self, document_id: int, content: str, timeout: float = 10.0) -> bool:
+        """Replace a document's content from a worker thread and persist it.
+
+        Returns False for an unknown document or when the store is not
+        running, in which case the caller owns the database write. Raises
+        StoreBusy when the loop, or the worker holding the document, does not
+        answer within `timeout`.
+        """
+        if self._loop is None:
+            return False
+        future = asyncio.run_coroutine_threadsafe(self._replace(document_id, content), self._loop)
+        return _result(future, timeout)
+
+    async def _replace(self, document_id: int, content: str) -> bool:
+        owner = await self._owner_of(document_id)
+        state = None
+        try:
+            if owner is None:
+                state = await self.open(document_id)
+                if state is None:
+                    return False
+                owner = state.owner
+            if owner is not None:
+                reply = await self._forward(owner, "doc_replace", {"document_id": document_id, "content": content})
+                return bool(reply and reply.get("replaced"))
+            async with state.lock:
+                op = state.replace(content)
+                if op and self.on_external_change is not None:
+                    await self.on_external_change(state, state.rev, op)
+            await self.flush([document_id])
+            return True
+        finally:
+            if state is not None and self._idle(state):
+                await self._drop(state)
+
+    async def _on_replace(self, data: dict, sender: str) -> dict:
+        if not self._owns(data["document_id"]):
+            return {"error": "moved"}
+        return {"replaced": await self._replace(data["document_id"], data["content"])}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.editor_flush_interval)
+            await self.flush()
+            if self.bus is not None:
+                try:
+                    await self._keep()
+                except Exception:
+                    logger.exception("failed to renew document leases")
+            await self._sweep()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        # Hand documents over to whichever worker opens them next
+        for state in list(self._docs.values()):
+            state.in_use = False
+            state.watchers.clear()
+            if not state.dirty:
+                await self._drop(state)
+        self._loop = None
+
+
+store = DocumentStore()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import asyncio
+from typing import Optional
+from urllib.parse import urlparse
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from .bus import NAMESPACE, WorkerBus
+
+
+def create_manager(url: str, write_only: bool = False) -> Optional[socketio.AsyncManager]:
+    """Build the Socket.IO client manager for `url`.
+
+    - empty: single process, rooms are local to the worker
+    - redis://, rediss://, valkey://: any Redis-protocol server
+    - local://host:port: the workers of one box relay through a small TCP hub
+      hosted by whichever worker binds the port first
+    """
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme in ("redis", "rediss", "valkey", "valkeys", "unix"):
+        return RedisManager(url, write_only=write_only)
+    if scheme == "local":
+        return LocalPubSubManager(url, write_only=write_only)
+    raise ValueError(f"Unsupported socket manager url: {url}")
+
+
+class _BusMixin:
+    """Hands messages for the worker namespace to the manager's WorkerBus
+    instead of delivering them to clients."""
+
+    bus: Optional[WorkerBus] = None
+
+    async def _handle_emit(self, message):
+        if message.get("namespace") != NAMESPACE:
+            return await super()._handle_emit(message)
+        if self.bus is not None and message.get("host_id") != self.host_id:
+            self.bus.receive(message)
+
+
+class RedisManager(_BusMixin, socketio.AsyncRedisManager):
+    pass
+
+
+_HEADER = 4
+# A worker that takes longer than this to accept relayed frames is cut off
+# rather than left to buffer them or to hold up the other workers
+_DRAIN_TIMEOUT = 5.0
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(_HEADER)
+    return await reader.readexactly(int.from_bytes(header, "big"))
+
+
+def _frame(body: bytes) -> bytes:
+    return len(body).to_bytes(_HEADER, "big") + body
+
+
+class _Hub:
+    def __init__(self):
+        self.peers: set[asyncio.StreamWriter] = set()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.peers.add(writer)
+        try:
+            while True:
+                await self._relay(_frame(await _read_frame(reader)), writer)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.peers.discard(writer)
+            writer.close()
+
+    async def _relay(self, frame: bytes, source: asyncio.StreamWriter) -> None:
+        # The source is not read from again until every peer has taken the
+        # frame, so a fast publisher is held back instead of buffered
+        peers = [peer for peer in self.peers if peer is not source]
+        for peer in peers:
+            peer.write(frame)
+        results = await asyncio.gather(*(asyncio.wait_for(peer.drain(), _DRAIN_TIMEOUT) for peer in peers), return_exceptions=True)
+        for peer, result in zip(peers, results):
+            if isinstance(result, Exception):
+                # Its worker sees the connection drop and reconnects; what it
+                # missed is lost, as with Redis pub/sub
+                self.peers.discard(peer)
+                peer.close()
+
+
+class LocalPubSubManager(_BusMixin, AsyncPubSubManager):
+    name = "asynclocal"
+
+    def __init__(self, url: str = "local://127.0.0.1:7465", channel: str = "socketio", write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 7465
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connecting = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        async with self._connecting:
+            while self._writer is None:
+                try:
+                    self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                    break
+                except OSError:
+                    pass
+                # Nobody is hosting the hub (or its worker died): try to take over
+                try:
+                    self._server = await asyncio.start_server(_Hub().serve, self.host, self.port)
+                except OSError:
+                    await asyncio.sleep(0.1)
+
+    def _reset(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _publish(self, data):
+        if self._writer is None:
+            await self._connect()
+        try:
+            self._writer.write(_frame(self.json.dumps(data).encode()))
+            await self._writer.drain()
+        except ConnectionError:
+            # Pub/sub delivery is at most once, like Redis
+            self._reset()
+
+    async def _listen(self):
+        while True:
+            if self._reader is None:
+                await self._connect()
+            try:
+                yield await _read_frame(self._reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self._reset()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+from typing import Any, NamedTuple
+
+
+class Edit(NamedTuple):
+    # Replace `delete` characters at `pos` with `insert`.
+    pos: int
+    delete: int
+    insert: str
+
+
+# An operation is a list of edits applied one after another, each against the
+# text produced by the previous one.
+Op = list[Edit]
+
+
+def parse_op(raw: Any) -> Op:
+    if not isinstance(raw, list):
+        raise ValueError("ops must be a list")
+    op: Op = []
+    for item in raw:
+        if not isinstance(item, dict):
+            raise ValueError("op entries must be objects")
+        pos = item.get("pos", 0)
+        delete = item.get("del", 0)
+        insert = item.get("ins", "")
+        if not isinstance(pos, int) or not isinstance(delete, int) or not isinstance(insert, str):
+            raise ValueError("invalid op entry")
+        if pos < 0 or delete < 0:
+            raise ValueError("negative op range")
+        if delete or insert:
+            op.append(Edit(pos, delete, insert))
+    return op
+
+
+def dump_op(op: Op) -> list[dict]:
+    return [{"pos": e.pos, "del": e.delete, "ins": e.insert} for e in op]
+
+
+def apply(text: str, op: Op) -> str:
+    for e in op:
+        if e.pos + e.delete > len(text):
+            raise ValueError("op range outside document")
+        text = text[:e.pos] + e.insert + text[e.pos + e.delete:]
+    return text
+
+
+def _transform_edit(a: Edit, b: Edit, a_first: bool) -> Op:
+    # Rewrite `a` so it applies after `b`. Both were made against the same
+    # text; `a_first` breaks ties when both insert at the same position.
+    a_end = a.pos + a.delete
+    b_end = b.pos + b.delete
+    b_len = len(b.insert)
+
+    # Parts of a's deleted range that b did not already delete.
+    left = max(0, min(a_end, b.pos) - a.pos)
+    right = max(0, a_end - max(a.pos, b_end))
+    right_pos = max(a.pos, b_end) - b.delete + b_len
+
+    if a.pos < b.pos or (a.pos == b.pos and a_first):
+        pos = a.pos
+    elif a.pos >= b_end and a.pos > b.pos:
+        pos = a.pos - b.delete + b_len
+    else:
+        pos = b.pos + b_len
+
+    if right and pos + left == right_pos:
+        return [Edit(pos, left + right, a.insert)]
+    out: Op = []
+    if right:
+        out.append(Edit(right_pos, right, ""))
+    if left or a.insert:
+        out.append(Edit(pos, left, a.insert))
+    return out
+
+
+def transform(a: Op, b: Op, a_first: bool = False) -> tuple[Op, Op]:
+    """Return (a', b') such that apply(apply(s, b), a') == apply(apply(s, a), b')."""
+    if not a or not b:
+        return a, b
+    if len(a) == 1 and len(b) == 1:
+        return _transform_edit(a[0], b[0], a_first), _transform_edit(b[0], a[0], not a_first)
+    if len(a) > 1:
+        head, b1 = transform(a[:1], b, a_first)
+        tail, b2 = transform(a[1:], b1, a_first)
+        return head + tail, b2
+    a1, head = transform(a, b[:1], a_first)
+    a2, tail = transform(a1, b[1:], a_first)
+    return a2, head + tail
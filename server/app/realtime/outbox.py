@@ -0,0 +1,180 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Callable, Iterable, Optional
+import socketio
+from ..config import settings
+from . import ot
+from .codec import wire
+from .documents import DocumentState
+
+
+# Op-protocol events for one document; superseded by a newer snapshot of it
+_DOCUMENT_EVENTS = ("editor_op", "editor_ack", "editor_snapshot")
+
+
+class Outbox:
+    """Per-connection outbound queue for editor traffic.
+
+    The first message after a quiet spell goes out at once; later ones wait
+    for the rest of `editor_broadcast_window` and are sent together. While
+    they wait, consecutive `editor_op`s for a document merge into one op and
+    a newer full-content `editor_change` replaces the queued one.
+
+    A connection is handed at most `editor_send_buffer` messages per window,
+    and none while its transport queue (what Engine.IO has yet to write to
+    the socket) holds more than that; the rest stay queued and keep merging.
+    A connection whose transport queue still passes `editor_queue_limit`
+    packets is not reading at all and is disconnected. Once its queue passes
+    `editor_queue_limit` messages its op traffic is dropped, and when it
+    catches up it is rebuilt from each document's history: the ops it missed
+    as merged `editor_op`s around the `editor_ack`s it was owed, which the
+    client transforms its pending edits against. Only a connection further
+    behind than the history reaches gets an `editor_snapshot` instead.
+    """
+
+    def __init__(self, sio: socketio.AsyncServer, documents: Callable[[int], Optional[DocumentState]]):
+        self.sio = sio
+        # document_id -> the live copy, if open
+        self.documents = documents
+        self._queues: dict[str, list[tuple[str, dict]]] = {}
+        # sid -> document_id -> revisions acked to the connection while its
+        # traffic was dropped, or None when it needs a snapshot
+        self._resync: dict[str, dict[int, Optional[set[int]]]] = {}
+        # sid -> document_id -> revision of the last message handed over
+        self._revs: dict[str, dict[int, int]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._last_sent: dict[str, float] = {}
+        self.merged = 0
+        self.resyncs = 0
+        self.disconnects = 0
+
+    def broadcast(self, sids: Iterable[str], event: str, data: dict, skip_sid: Optional[str] = None) -> None:
+        for sid in sids:
+            if sid != skip_sid:
+                self.send(sid, event, data)
+
+    def send(self, sid: str, event: str, data: dict) -> None:
+        queue = self._queues.setdefault(sid, [])
+        document_id = data.get("document_id")
+        resync = self._resync.get(sid)
+        if event in _DOCUMENT_EVENTS and resync is not None and document_id in resync:
+            self._dropped(resync, event, data)
+            self.merged += 1
+        elif event == "editor_op" and queue and queue[-1][0] == "editor_op" and queue[-1][1]["document_id"] == document_id:
+            last = queue[-1][1]
+            queue[-1] = (event, {"document_id": document_id, "rev": data["rev"], "ops": last["ops"] + data["ops"]})
+            self.merged += 1
+        else:
+            if event == "editor_change" or event == "editor_snapshot":
+                superseded = ("editor_change",) if event == "editor_change" else _DOCUMENT_EVENTS
+                kept = [m for m in queue if not (m[0] in superseded and m[1].get("document_id") == document_id)]
+                self.merged += len(queue) - len(kept)
+                queue[:] = kept
+            queue.append((event, data))
+            if len(queue) > settings.editor_queue_limit:
+                self._collapse(sid, queue)
+        if sid not in self._tasks:
+            delay = self._last_sent.get(sid, 0.0) + settings.editor_broadcast_window - time.monotonic()
+            self._tasks[sid] = asyncio.create_task(self._drain(sid, max(0.0, delay)))
+
+    @staticmethod
+    def _dropped(resync: dict[int, Optional[set[int]]], event: str, data: dict) -> None:
+        # Ops are rebuilt from history later; acks and snapshots are remembered
+        document_id = data["document_id"]
+        acks = resync.setdefault(document_id, set())
+        if event == "editor_snapshot":
+            resync[document_id] = None
+        elif event == "editor_ack" and acks is not None:
+            acks.add(data["rev"])
+
+    def _collapse(self, sid: str, queue: list[tuple[str, dict]]) -> None:
+        resync = self._resync.setdefault(sid, {})
+        for event, data in queue:
+            if event in _DOCUMENT_EVENTS:
+                self._dropped(resync, event, data)
+        queue[:] = [m for m in queue if m[0] not in _DOCUMENT_EVENTS]
+        self.resyncs += 1
+
+    def _backlog(self, sid: str) -> int:
+        eio_sid = self.sio.manager.eio_sid_from_sid(sid, "/")
+        socket = self.sio.eio.sockets.get(eio_sid) if eio_sid else None
+        return socket.queue.qsize() if socket is not None else 0
+
+    def _catch_up(self, sid: str, document_id: int, acks: Optional[set[int]]) -> list[tuple[str, dict]]:
+        state = self.documents(document_id)
+        if state is None:
+            return []
+        base = self._revs.get(sid, {}).get(document_id)
+        behind = state.rev - base if base is not None else None
+        if acks is None or behind is None or behind > len(state.history):
+            return [("editor_snapshot", {"document_id": document_id, "rev": state.rev, "content": state.content})]
+        messages: list[tuple[str, dict]] = []
+        ops: list[dict] = []
+        rev = base
+        for op in list(state.history)[len(state.history) - behind:]:
+            rev += 1
+            if rev in acks:
+                if ops:
+                    messages.append(("editor_op", {"document_id": document_id, "rev": rev - 1, "ops": ops}))
+                    ops = []
+                messages.append(("editor_ack", {"document_id": document_id, "rev": rev}))
+            else:
+                ops.extend(ot.dump_op(op))
+        if rev > (messages[-1][1]["rev"] if messages else base):
+            messages.append(("editor_op", {"document_id": document_id, "rev": rev, "ops": ops}))
+        return messages
+
+    def _take(self, sid: str) -> list[tuple[str, dict]]:
+        messages = []
+        for document_id, acks in self._resync.pop(sid, {}).items():
+            messages.extend(self._catch_up(sid, document_id, acks))
+        queue = self._queues.get(sid, [])
+        messages.extend(queue[:settings.editor_send_buffer])
+        del queue[:settings.editor_send_buffer]
+        if not queue:
+            self._queues.pop(sid, None)
+        return messages
+
+    async def _drain(self, sid: str, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+            while True:
+                backlog = self._backlog(sid)
+                if backlog > settings.editor_queue_limit:
+                    # Nothing is being read; its traffic would only pile up
+                    # in the transport. Forget the task so the disconnect
+                    # handler's discard does not cancel the disconnect.
+                    del self._tasks[sid]
+                    self.disconnects += 1
+                    await self.sio.disconnect(sid)
+                    return
+                if backlog <= settings.editor_send_buffer:
+                    self._last_sent[sid] = time.monotonic()
+                    for event, data in self._take(sid):
+                        if event in _DOCUMENT_EVENTS:
+                            self._revs.setdefault(sid, {})[data["document_id"]] = data["rev"]
+                        await self.sio.emit(event, wire.payload(sid, data), to=sid, ignore_queue=True)
+                    if not self._queues.get(sid) and sid not in self._resync:
+                        return
+                await asyncio.sleep(settings.editor_broadcast_window)
+        finally:
+            if self._tasks.get(sid) is asyncio.current_task():
+                del self._tasks[sid]
+
+    def discard(self, sid: str) -> None:
+        self._queues.pop(sid, None)
+        self._resync.pop(sid, None)
+        self._revs.pop(sid, None)
+        self._last_sent.pop(sid, None)
+        task = self._tasks.pop(sid, None)
+        if task is not None:
+            task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._queues),
+            "queued": sum(len(q) for q in self._queues.values()),
+            "merged": self.merged,
+            "resyncs": self.resyncs,
+        }
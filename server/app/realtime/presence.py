@@ -0,0 +1,137 @@
+from __future__ import annotations
+import asyncio
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+import socketio
+from ..config import settings
+from .codec import wire
+from .rooms import RoomRegistry
+
+
+@dataclass
+class Member:
+    sid: str
+    user: str
+    document_id: Optional[int] = None
+    # Character offsets into the document, as in ops
+    cursor: Optional[int] = None
+    selection: Optional[tuple[int, int]] = None
+    last_seen: float = field(default_factory=time.monotonic)
+
+    def view(self) -> dict:
+        data = asdict(self)
+        del data["last_seen"]
+        return data
+
+
+def _offset(value: Any) -> Optional[int]:
+    return value if isinstance(value, int) and not isinstance(value, bool) and value >= 0 else None
+
+
+class Presence:
+    """Where each room member's cursor is.
+
+    Membership comes from the RoomRegistry; presence adds a cursor per
+    connection. Cursor updates are coalesced per connection: at most one
+    `presence` message per `presence_interval` carries the latest position,
+    whatever the document size. Members that neither update nor heartbeat for
+    `presence_timeout` seconds are dropped from presence; if the connection
+    is still in its room, its next update or heartbeat joins it again.
+    """
+
+    def __init__(self, sio: socketio.AsyncServer, rooms: RoomRegistry):
+        self.sio = sio
+        self.rooms = rooms
+        self._members: dict[str, Member] = {}
+        self._last_sent: dict[str, float] = {}
+        self._pending: dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def members(self, room: str) -> list[dict]:
+        return [self._members[sid].view() for sid in self.rooms.members(room) if sid in self._members]
+
+    async def join(self, sid: str) -> None:
+        """Announce a connection the registry has just put in a room."""
+        grant = self.rooms.grant(sid)
+        if grant is None:
+            return
+        member = self._members[sid] = Member(sid, grant.user_email)
+        await wire.emit(self.sio, "presence_state", {"members": self.members(grant.code)}, to=sid)
+        await wire.emit(self.sio, "presence_join", member.view(), room=grant.code, skip_sid=sid)
+
+    async def leave(self, sid: str) -> None:
+        """Call while the registry still has the connection's room."""
+        member = self._members.pop(sid, None)
+        self._last_sent.pop(sid, None)
+        task = self._pending.pop(sid, None)
+        if task is not None:
+            task.cancel()
+        grant = self.rooms.grant(sid)
+        if member is not None and grant is not None:
+            await wire.emit(self.sio, "presence_leave", {"sid": sid}, room=grant.code)
+
+    async def _member(self, sid: str) -> Optional[Member]:
+        member = self._members.get(sid)
+        if member is None and self.rooms.grant(sid) is not None:
+            # Swept while idle but still connected
+            await self.join(sid)
+            member = self._members.get(sid)
+        return member
+
+    async def heartbeat(self, sid: str) -> None:
+        member = await self._member(sid)
+        if member is not None:
+            member.last_seen = time.monotonic()
+
+    async def update(self, sid: str, data: Any) -> None:
+        if not isinstance(data, dict):
+            return
+        member = await self._member(sid)
+        if member is None:
+            return
+        member.last_seen = time.monotonic()
+        document_id = data.get("document_id")
+        if isinstance(document_id, int):
+            member.document_id = document_id
+        member.cursor = _offset(data.get("cursor"))
+        selection = data.get("selection")
+        if isinstance(selection, (list, tuple)) and len(selection) == 2 and None not in map(_offset, selection):
+            member.selection = (min(selection), max(selection))
+        else:
+            member.selection = None
+        if sid not in self._pending:
+            delay = self._last_sent.get(sid, 0.0) + settings.presence_interval - time.monotonic()
+            self._pending[sid] = asyncio.create_task(self._send(sid, max(0.0, delay)))
+
+    async def _send(self, sid: str, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            if self._pending.get(sid) is asyncio.current_task():
+                del self._pending[sid]
+        member = self._members.get(sid)
+        grant = self.rooms.grant(sid)
+        if member is not None and grant is not None:
+            self._last_sent[sid] = time.monotonic()
+            await wire.emit(self.sio, "presence", member.view(), room=grant.code, skip_sid=sid)
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(settings.presence_timeout / 2)
+            cutoff = time.monotonic() - settings.presence_timeout
+            for sid in [m.sid for m in self._members.values() if m.last_seen < cutoff]:
+                await self.leave(sid)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,69 @@
+from __future__ import annotations
+import json
+import zlib
+from datetime import datetime
+from typing import Optional, Union
+from sqlalchemy.orm import Session
+from ..config import settings
+from .. import models
+from . import ot
+
+
+def encode(payload: Union[str, ot.Op]) -> bytes:
+    raw = payload if isinstance(payload, str) else json.dumps([list(e) for e in payload], separators=(",", ":"), ensure_ascii=False)
+    return zlib.compress(raw.encode(), settings.revision_compression_level)
+
+
+def row(document_id: int, revision: int, depth: int, payload: Union[str, ot.Op]) -> dict:
+    """Revision row: `payload` is the content for a snapshot (depth 0), else
+    the op leading from the previous row's content."""
+    return {"document_id": document_id, "revision": revision, "depth": depth, "data": encode(payload), "created_at": datetime.utcnow()}
+
+
+def record_snapshot(db: Session, document_id: int, revision: int, content: str) -> None:
+    db.add(models.DocumentRevision(**row(document_id, revision, 0, content)))
+
+
+def chain_depth(db: Session, document_id: int, revision: int) -> Optional[int]:
+    """Depth of the newest saved row when it is `revision`, i.e. when a delta
+    from `revision` can extend the chain; None otherwise."""
+    last = (
+        db.query(models.DocumentRevision.revision, models.DocumentRevision.depth)
+        .filter(models.DocumentRevision.document_id == document_id)
+        .order_by(models.DocumentRevision.revision.desc())
+        .first()
+    )
+    return last.depth if last is not None and last.revision == revision else None
+
+
+def load(db: Session, document_id: int, revision: int) -> Optional[str]:
+    """Content at a saved `revision`: its snapshot plus at most
+    `revision_chain_limit` deltas."""
+    base = (
+        db.query(models.DocumentRevision.revision)
+        .filter(
+            models.DocumentRevision.document_id == document_id,
+            models.DocumentRevision.revision <= revision,
+            models.DocumentRevision.depth == 0,
+        )
+        .order_by(models.DocumentRevision.revision.desc())
+        .limit(1)
+        .scalar()
+    )
+    if base is None:
+        return None
+    rows = (
+        db.query(models.DocumentRevision.revision, models.DocumentRevision.data)
+        .filter(
+            models.DocumentRevision.document_id == document_id,
+            models.DocumentRevision.revision.between(base, revision),
+        )
+        .order_by(models.DocumentRevision.revision)
+        .all()
+    )
+    if rows[-1].revision != revision:
+        return None
+    content = zlib.decompress(rows[0].data).decode()
+    for r in rows[1:]:
+        content = ot.apply(content, [ot.Edit(*e) for e in json.loads(zlib.decompress(r.data))])
+    return content
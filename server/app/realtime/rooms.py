@@ -0,0 +1,107 @@
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass
+from typing import Collection, Optional
+from sqlalchemy.orm import Session
+from ..auth import InvalidToken, authenticate, principal_cache
+from ..session_codes import resolve, session_cache
+from .db import DatabaseBusy, run_db
+
+
+class JoinRefused(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Grant:
+    """What join_session verified for a connection; handlers trust it as is."""
+
+    session_id: int
+    code: str
+    user_id: int
+    user_email: str
+
+
+def _authorize(db: Session, code: str, token: str) -> Grant:
+    try:
+        principal = authenticate(db, token)
+    except InvalidToken as e:
+        raise JoinRefused(str(e))
+    ref = resolve(db, code)
+    if ref is None:
+        raise JoinRefused("Session not found")
+    return Grant(ref.id, ref.code, principal.id, principal.email)
+
+
+async def authorize(code: str, token: str) -> Grant:
+    """Check that the token's user may join the session `code`: any signed-in
+    user holding the code may. Answered from the token and session caches
+    when both know the answer, else on the realtime database pool."""
+    principal = principal_cache.get(token)
+    ref = session_cache.get(code) if principal is not None else None
+    if ref is not None:
+        return Grant(ref.id, ref.code, principal.id, principal.email)
+    try:
+        return await run_db(_authorize, code, token)
+    except DatabaseBusy as e:
+        raise JoinRefused(str(e))
+
+
+class RoomRegistry:
+    """Connections on this worker by room, and each connection's grant.
+
+    Both directions are dicts, so a connection's room and user, a room's
+    members and the totals are all O(1).
+    """
+
+    def __init__(self):
+        self.rooms: dict[str, dict[str, Grant]] = {}
+        self._grants: dict[str, Grant] = {}
+        self._joining: dict[str, asyncio.Event] = {}
+
+    def grant(self, sid: str) -> Optional[Grant]:
+        return self._grants.get(sid)
+
+    async def settled(self, sid: str) -> Optional[Grant]:
+        """The connection's grant, once a join_session in progress is decided;
+        clients send their first events without waiting for its reply."""
+        pending = self._joining.get(sid)
+        if pending is not None:
+            await pending.wait()
+        return self._grants.get(sid)
+
+    def start_join(self, sid: str) -> asyncio.Event:
+        pending = self._joining[sid] = asyncio.Event()
+        return pending
+
+    def end_join(self, sid: str, pending: asyncio.Event) -> None:
+        pending.set()
+        if self._joining.get(sid) is pending:
+            del self._joining[sid]
+
+    def members(self, room: str) -> Collection[str]:
+        return self.rooms.get(room, {}).keys()
+
+    def join(self, sid: str, grant: Grant) -> None:
+        self.leave(sid)
+        self._grants[sid] = grant
+        self.rooms.setdefault(grant.code, {})[sid] = grant
+
+    def leave(self, sid: str) -> tuple[Optional[Grant], bool]:
+        """The connection's grant, if it had one, and whether its room is now empty."""
+        grant = self._grants.pop(sid, None)
+        if grant is None:
+            return None, False
+        members = self.rooms[grant.code]
+        del members[sid]
+        if members:
+            return grant, False
+        del self.rooms[grant.code]
+        return grant, True
+
+    @property
+    def member_count(self) -> int:
+        return len(self._grants)
+
+    def __len__(self) -> int:
+        return len(self.rooms)
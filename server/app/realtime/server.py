@@ -0,0 +1,85 @@
+from __future__ import annotations
+from functools import partial
+import engineio
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+from ..config import settings
+from ..metrics import socket_bytes, socket_events
+
+
+def _event_name(data) -> str:
+    # Reads the event name out of an encoded Socket.IO packet such as
+    # 2["editor_op",{...}] or 451-["editor_snapshot",{...}] without decoding it
+    if isinstance(data, (bytes, bytearray)):
+        return "binary_attachment"
+    if not data or data[0] not in "25":
+        return "control"
+    start = data.find('["', 0, 64)
+    end = data.find('"', start + 2, start + 66) if start >= 0 else -1
+    return data[start + 2:end] if end > 0 else "other"
+
+
+# Private hooks overridden below. requirements.txt pins the versions they are
+# written against; fail at import rather than silently lose them on an upgrade.
+for _cls, _names in ((engineio.AsyncServer, ("send_packet",)), (socketio.AsyncServer, ("_engineio_server_class", "_handle_eio_message", "_handle_event", "_send_packet"))):
+    _missing = [name for name in _names if not hasattr(_cls, name)]
+    if _missing:
+        raise ImportError(f"{_cls.__module__}.{_cls.__name__} has no {', '.join(_missing)}; check the pinned python-socketio/python-engineio")
+
+
+def _size(data) -> int:
+    if isinstance(data, (bytes, bytearray)) or data.isascii():
+        return len(data)
+    return len(data.encode())
+
+
+class _EngineServer(engineio.AsyncServer):
+    async def send_packet(self, sid, pkt):
+        if settings.metrics_enabled and pkt.packet_type == eio_packet.MESSAGE:
+            event = _event_name(pkt.data)
+            socket_events.inc("out", event)
+            socket_bytes.inc("out", event, amount=_size(pkt.data))
+        await super().send_packet(sid, pkt)
+
+
+class InstrumentedServer(socketio.AsyncServer):
+    """AsyncServer that counts packets and payload bytes per event.
+
+    A `gate`, if set, sees every event before its handler task is started:
+    an async gate(sid, event, deliver) returns "pass", "hold" when it kept
+    `deliver` to run the event later, or "drop". A dropped event that asked
+    for an acknowledgement gets {"error": "rate limited"}, and `rejected`, if
+    set, is awaited as rejected(sid, event, *args) so it can answer one that
+    did not.
+    """
+
+    gate = None
+    rejected = None
+
+    def _engineio_server_class(self):
+        return _EngineServer
+
+    async def _handle_event(self, eio_sid, namespace, id, data):
+        namespace = namespace or "/"
+        if self.gate is not None and data and isinstance(data[0], str):
+            sid = self.manager.sid_from_eio_sid(eio_sid, namespace)
+            if sid is not None and self.manager.is_connected(sid, namespace):
+                action = await self.gate(sid, data[0], partial(super()._handle_event, eio_sid, namespace, id, data))
+                if action != "pass":
+                    if action == "drop" and id is not None:
+                        await self._send_packet(eio_sid, self.packet_class(packet.ACK, namespace=namespace, id=id, data=[{"error": "rate limited"}]))
+                    if action == "drop" and self.rejected is not None:
+                        await self.rejected(sid, *data)
+                    return
+        await super()._handle_event(eio_sid, namespace, id, data)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        if settings.metrics_enabled:
+            event = _event_name(data)
+            # Only events with a handler get their own label
+            if event not in self.handlers.get("/", {}) and event not in ("control", "binary_attachment"):
+                event = "other"
+            socket_events.inc("in", event)
+            socket_bytes.inc("in", event, amount=_size(data))
+        await super()._handle_eio_message(eio_sid, data)
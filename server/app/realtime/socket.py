@@ -1,16 +1,35 @@
-import socketio
-import jwt
+from ..assist import AssistBusy, AssistFailed, assistant
 from ..config import settings
-from ..database import SessionLocal
-from .. import models
+from ..metrics import registry
+from . import ot
+from .bus import WorkerBus
+from .documents import store, StaleRevision, StoreBusy
+from .db import DatabaseBusy
+from .manager import create_manager
+from .chat import chat_writer
+from .outbox import Outbox
+from .presence import Presence
+from .rooms import JoinRefused, RoomRegistry, authorize
+from .throttle import EventThrottle
+from .codec import unpack, wire
+from .server import InstrumentedServer
 from datetime import datetime
 
 
-mgr = socketio.AsyncRedisManager(url=None) if False else None  # placeholder for future scale-out
+# Relays room broadcasts between workers when SOCKET_MANAGER_URL is set
+mgr = create_manager(settings.socket_manager_url)
+# and editor traffic between a document's owner and the other workers
+bus = WorkerBus(mgr) if mgr is not None else None
+if bus is not None:
+    mgr.bus = bus
+    store.attach(bus)
+_HOST = bus.host if bus is not None else None
 
-sio = socketio.AsyncServer(
+sio = InstrumentedServer(
     async_mode="asgi",
     cors_allowed_origins="*",
+    client_manager=mgr,
+    max_http_buffer_size=settings.socket_max_payload_bytes,
 )
 
 
@@ -19,69 +38,314 @@ async def connect(sid, environ):
     pass
 
 
+# Who is in which room on this worker, with what join_session granted them
+rooms = RoomRegistry()
+
+
+# Editor traffic goes to the members of a room on this worker through
+# per-connection queues; other workers deliver it to theirs
+outbox = Outbox(sio, store.get)
+presence = Presence(sio, rooms)
+# Inbound events over their rate limits are held or dropped before a handler runs
+throttle = sio.gate = EventThrottle(rooms)
+
+registry.gauge("devhub_socket_connections", "Open Socket.IO connections on this worker", lambda: {(): len(sio.eio.sockets)})
+registry.gauge("devhub_rooms", "Rooms with members on this worker", lambda: {(): len(rooms)})
+registry.gauge("devhub_room_members", "Room memberships on this worker", lambda: {(): rooms.member_count})
+registry.gauge("devhub_documents_open", "Documents held by the realtime store", lambda: {(): len(store)})
+registry.gauge("devhub_outbox_queued", "Editor messages waiting in per-connection queues", lambda: {(): outbox.stats()["queued"]})
+registry.gauge("devhub_outbox_merged_total", "Editor messages merged or superseded before sending", lambda: {(): outbox.merged}, kind="counter")
+registry.gauge("devhub_outbox_resyncs_total", "Times a slow connection's queued editor traffic was dropped to be rebuilt from history", lambda: {(): outbox.resyncs}, kind="counter")
+registry.gauge("devhub_outbox_disconnects_total", "Connections disconnected for not reading their transport queue", lambda: {(): outbox.disconnects}, kind="counter")
+registry.gauge("devhub_socket_throttled_total", "Inbound events held or dropped by rate limits", lambda: {("held",): throttle.held, ("dropped",): throttle.dropped}, ("action",), kind="counter")
+registry.gauge("devhub_chat_queue_depth", "Chat messages waiting to be persisted", lambda: {(): chat_writer.depth})
+
+
+async def _leave_room(sid):
+    grant, emptied = rooms.leave(sid)
+    if emptied:
+        # Flushes the room's documents once nobody here edits them
+        await store.close_room(grant.code)
+
+
+async def _open(grant, document_id):
+    # The live copy of a document of the granted session, else None
+    if not isinstance(document_id, int):
+        return None
+    state = await store.open(document_id)
+    if state is None or state.session_id != grant.session_id:
+        return None
+    state.room = grant.code
+    state.in_use = True
+    return state
+
+
 @sio.event
 async def disconnect(sid):
-    pass
+    outbox.discard(sid)
+    throttle.discard(sid)
+    await presence.leave(sid)
+    wire.discard(sid)
+    await _leave_room(sid)
+
+
+def _fanout(state, room, op, skip_sid=None, change=None, ack_sid=None, ack_host=None):
+    # Every worker delivers an edit of a document it owns to the room's
+    # members on every worker, acks included, and keeps their mirrors in step
+    fanout = {
+        "document_id": state.document_id, "room": room, "rev": state.rev, "ops": ot.dump_op(op),
+        "skip_sid": skip_sid, "change": change, "ack_sid": ack_sid, "ack_host": ack_host,
+    }
+    _deliver(fanout)
+    if bus is not None:
+        bus.send("doc_fanout", fanout)
+
+
+def _deliver(fanout, sender=None):
+    document_id, rev, ops, skip_sid = fanout["document_id"], fanout["rev"], fanout["ops"], fanout["skip_sid"]
+    send_ops = bool(ops)
+    if sender is not None and ops:
+        send_ops = store.follow(sender, document_id, rev, ot.parse_op(ops))
+    state = store.get(document_id)
+    room = fanout["room"] or (state.room if state is not None else None)
+    members = rooms.members(room) if room else ()
+    if fanout["change"] is not None:
+        outbox.broadcast(members, "editor_change", fanout["change"], skip_sid=skip_sid)
+    if fanout["ack_sid"] is not None and fanout["ack_host"] == _HOST:
+        outbox.send(fanout["ack_sid"], "editor_ack", {"document_id": document_id, "rev": rev})
+    if send_ops:
+        outbox.broadcast(members, "editor_op", {"document_id": document_id, "rev": rev, "ops": ops}, skip_sid=skip_sid)
+
+
+def _apply_op(state, room, host, sid, base_rev, raw):
+    # Under state.lock, on the document's owner; `host` is the worker `sid` is on
+    try:
+        if not isinstance(base_rev, int):
+            raise ValueError("missing revision")
+        op = state.apply(base_rev, ot.parse_op(raw))
+    except (ValueError, StaleRevision):
+        if host == _HOST:
+            _send_snapshot(sid, state)
+        else:
+            bus.send("doc_resync", {"document_id": state.document_id, "sid": sid}, host)
+        return
+    _fanout(state, room, op, skip_sid=sid, ack_sid=sid, ack_host=host)
+
+
+def _apply_change(state, room, sid, change):
+    # Under state.lock, on the document's owner
+    op = state.replace(change["content"]) if isinstance(change["content"], str) else []
+    _fanout(state, room, op, skip_sid=sid, change=change)
+
+
+async def _remote_edit(edit, sender):
+    # An edit made on a worker with a mirror of a document this one owns
+    state = store.get(edit["document_id"])
+    if state is None or state.owner is not None:
+        # Its mirror is out of date; have it drop the document
+        bus.send("doc_closed", {"document_id": edit["document_id"]}, sender)
+        return
+    async with state.lock:
+        if "change" in edit:
+            _apply_change(state, edit["room"], edit["sid"], edit["change"])
+        else:
+            _apply_op(state, edit["room"], sender, edit["sid"], edit["rev"], edit["ops"])
+
+
+def _resync(data, sender):
+    # The owner refused an op from a member here; the mirror has caught up
+    # with everything it published before saying so
+    state = store.get(data["document_id"])
+    if state is not None:
+        _send_snapshot(data["sid"], state)
+
+
+async def _broadcast_external(state, rev, op):
+    _fanout(state, state.room, op)
+
+
+def _dropped(state):
+    if state.room:
+        outbox.broadcast(rooms.members(state.room), "editor_reject", {"document_id": state.document_id, "reason": "document moved to another worker"})
+
+
+store.on_external_change = _broadcast_external
+store.on_drop = _dropped
+if bus is not None:
+    bus.on("doc_fanout", _deliver)
+    bus.on("doc_edit", _remote_edit)
+    bus.on("doc_resync", _resync)
 
 
 @sio.event
 async def join_session(sid, data):
-    session_code = data.get("code")
-    token = data.get("token")
-
-    user_email = None
-    if token:
+    # Verified once here; the grant is what every later event of the
+    # connection is checked against, without further lookups
+    data = unpack(data) or {}
+    code, token = data.get("code"), data.get("token")
+    if not isinstance(code, str) or not code or not isinstance(token, str) or not token:
+        return {"error": "A session code and a token are required"}
+    joining = rooms.start_join(sid)
+    try:
         try:
-            payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])
-            user_email = payload.get("sub")
-        except Exception:
-            user_email = None
+            grant = await authorize(code, token)
+        except JoinRefused as e:
+            return {"error": str(e)}
+        if not sio.manager.is_connected(sid, "/"):
+            return
+
+        previous = rooms.grant(sid)
+        if previous is not None:
+            await presence.leave(sid)
+            if previous.code != grant.code:
+                await sio.leave_room(sid, previous.code)
+                await _leave_room(sid)
+
+        rooms.join(sid, grant)
+        await sio.enter_room(sid, grant.code)
+    finally:
+        rooms.end_join(sid, joining)
+    # Clients that ask for "msgpack" may receive packed payloads from here on
+    encoding = wire.negotiate(sid, data.get("encoding"))
+    await wire.emit(sio, "system", {"message": f"joined {grant.code}"}, to=sid)
+    await presence.join(sid)
+    return {"encoding": encoding}
+
 
-    await sio.save_session(sid, {"session_code": session_code, "user_email": user_email})
-    await sio.enter_room(sid, session_code)
-    await sio.emit("system", {"message": f"joined {session_code}"}, room=sid)
+@sio.event
+async def presence_update(sid, data):
+    await presence.update(sid, unpack(data))
+
+
+@sio.event
+async def presence_heartbeat(sid, data=None):
+    await presence.heartbeat(sid)
 
 
 @sio.event
 async def editor_change(sid, data):
-    sess = await sio.get_session(sid)
-    room = sess.get("session_code")
-    # Include document_id and cursor info if provided
+    grant = await rooms.settled(sid)
+    if grant is None:
+        return
+    data = unpack(data) or {}
+    try:
+        state = await _open(grant, data.get("document_id"))
+    except (DatabaseBusy, StoreBusy):
+        return
+    if state is None:
+        return
     payload = {
-        "document_id": (data or {}).get("document_id"),
-        "content": (data or {}).get("content", ""),
-        "cursor": (data or {}).get("cursor"),
-        "ts": (data or {}).get("ts"),
+        "document_id": state.document_id,
+        "content": data.get("content", ""),
+        "cursor": data.get("cursor"),
+        "ts": data.get("ts"),
     }
-    await sio.emit("editor_change", payload, room=room, skip_sid=sid)
+    # Apply to the live copy and keep op-based clients of the same document in sync
+    if state.owner is not None:
+        bus.send("doc_edit", {"document_id": state.document_id, "room": grant.code, "sid": sid, "change": payload}, state.owner)
+    else:
+        async with state.lock:
+            _apply_change(state, grant.code, sid, payload)
+    if payload["cursor"] is not None:
+        await presence.update(sid, {"document_id": payload["document_id"], "cursor": payload["cursor"]})
+
+
+def _send_snapshot(sid, state):
+    outbox.send(sid, "editor_snapshot", {"document_id": state.document_id, "rev": state.rev, "content": state.content})
+
+
+@sio.event
+async def editor_open(sid, data):
+    grant = await rooms.settled(sid)
+    document_id = (unpack(data) or {}).get("document_id")
+    if grant is None or not isinstance(document_id, int):
+        return
+    try:
+        state = await _open(grant, document_id)
+    except (DatabaseBusy, StoreBusy) as e:
+        await sio.emit("editor_reject", {"document_id": document_id, "reason": str(e)}, room=sid)
+        return
+    if state is None:
+        await sio.emit("editor_reject", {"document_id": document_id, "reason": "document not found"}, room=sid)
+        return
+    async with state.lock:
+        _send_snapshot(sid, state)
+
+
+@sio.event
+async def editor_op(sid, data):
+    grant = await rooms.settled(sid)
+    if grant is None:
+        return
+    data = unpack(data)
+    document_id = (data or {}).get("document_id")
+    state = store.get(document_id) if isinstance(document_id, int) else None
+    if state is None or state.session_id != grant.session_id:
+        await sio.emit("editor_reject", {"document_id": document_id, "reason": "document not open"}, room=sid)
+        return
+    base_rev, raw = data.get("rev"), data.get("ops")
+    if state.owner is not None:
+        # Applied, acked and broadcast by the worker that owns the document
+        bus.send("doc_edit", {"document_id": document_id, "room": grant.code, "sid": sid, "rev": base_rev, "ops": raw}, state.owner)
+        return
+    async with state.lock:
+        _apply_op(state, grant.code, _HOST, sid, base_rev, raw)
+
+
+async def _rejected(sid, event, data=None, *args):
+    # An op refused by the rate limit is never acked; send the document as it
+    # stands so the client drops it with its pending edits and carries on
+    if event != "editor_op":
+        return
+    grant = await rooms.settled(sid)
+    document_id = (unpack(data) or {}).get("document_id")
+    state = store.get(document_id) if isinstance(document_id, int) else None
+    if grant is None or state is None or state.session_id != grant.session_id:
+        return
+    _send_snapshot(sid, state)
+
+
+sio.rejected = _rejected
 
 
 @sio.event
 async def chat_message(sid, data):
-    sess = await sio.get_session(sid)
-    room = sess.get("session_code")
-    user_email = sess.get("user_email") or "anon"
-    content = (data or {}).get("content", "")
-    created_at = datetime.utcnow().isoformat()
+    grant = await rooms.settled(sid)
+    if grant is None:
+        return
+    content = (unpack(data) or {}).get("content", "")
+    if not isinstance(content, str):
+        return
+    now = datetime.utcnow()
+    created_at = now.isoformat()
 
     # Broadcast
-    await sio.emit("chat_message", {"user": user_email, "content": content, "created_at": created_at}, room=room, skip_sid=None)
+    await wire.emit(sio, "chat_message", {"user": grant.user_email, "content": content, "created_at": created_at}, room=grant.code)
 
-    # Persist message (best-effort)
-    try:
-        db = SessionLocal()
-        s = db.query(models.Session).filter(models.Session.code == room).first()
-        u = db.query(models.User).filter(models.User.email == user_email).first() if user_email and user_email != "anon" else None
-        if s and u and content:
-            msg = models.ChatMessage(session_id=s.id, user_id=u.id, content=content)
-            db.add(msg)
-            db.commit()
-    except Exception:
-        pass
-    finally:
-        try:
-            db.close()
-        except Exception:
-            pass
+    # Persist through the write-behind queue; waits only when it is full
+    if content:
+        await chat_writer.submit(grant.code, grant.user_email, content, now)
 
 
+@sio.event
+async def ai_assist(sid, data):
+    # Streams `ai_token` {request_id, token} events; the acknowledgement
+    # carries {request_id, cached} or {request_id, error} once it is done
+    data = unpack(data) or {}
+    request_id = data.get("request_id")
+    if await rooms.settled(sid) is None:
+        return {"request_id": request_id, "error": "Join a session first"}
+    code, question = data.get("code", ""), data.get("question", "")
+    if not isinstance(code, str) or not isinstance(question, str):
+        return {"request_id": request_id, "error": "code and question must be strings"}
+    if len(code) > settings.ai_max_code_chars or len(question) > settings.ai_max_question_chars:
+        return {"request_id": request_id, "error": "prompt too long"}
+    try:
+        job = assistant.submit(code, question)
+        async for chunk in job.stream():
+            await wire.emit(sio, "ai_token", {"request_id": request_id, "token": chunk}, to=sid)
+    except AssistBusy:
+        return {"request_id": request_id, "error": "The assistant is busy, please retry"}
+    except AssistFailed as e:
+        return {"request_id": request_id, "error": str(e)}
+    return {"request_id": request_id, "cached": job.cached}
@@ -0,0 +1,107 @@
+from __future__ import annotations
+import asyncio
+from typing import Awaitable, Callable
+from ..config import settings
+from ..ratelimit import check
+from .rooms import RoomRegistry
+
+
+# event -> limit group; events not listed fall under "socket"
+EVENT_GROUPS = {
+    "editor_op": "editor",
+    "editor_change": "editor",
+    "presence_update": "presence",
+    "presence_heartbeat": "presence",
+    "chat_message": "chat",
+    "join_session": "join",
+    "editor_open": "join",
+    "ai_assist": "ai",
+}
+
+# group -> (bucket name, setting, per "conn", "user" or "room")
+GROUP_LIMITS = {
+    "editor": (("editor", "rate_limit_editor", "conn"), ("editor_room", "rate_limit_editor_room", "room")),
+    "presence": (("presence", "rate_limit_presence", "conn"),),
+    "chat": (("chat", "rate_limit_chat", "conn"), ("chat_user", "rate_limit_chat_user", "user"), ("chat_room", "rate_limit_chat_room", "room")),
+    "join": (("join", "rate_limit_join", "conn"),),
+    "ai": (("ai_user", "rate_limit_ai_user", "user"),),
+    "socket": (("socket", "rate_limit_socket", "conn"),),
+}
+
+# Events whose newest payload stands in for the ones before it (a full
+# document, a cursor). Not editor_op: each op waits for its own ack, so one
+# over the limit is dropped and answered (see socket.py) rather than replaced.
+COALESCED = {"editor_change", "presence_update", "presence_heartbeat"}
+
+
+class EventThrottle:
+    """Token-bucket screening of inbound Socket.IO events, before any handler runs.
+
+    Over the limit, a COALESCED event is held, newest only per connection and
+    event, and delivered once its buckets have a token again; other events are
+    dropped. Per-room buckets apply once the connection has joined a session.
+    Per-user buckets wait for a join in progress and count the joined user,
+    so reconnecting does not reset them; a connection that never joined
+    skips them, as the handlers of those events refuse it anyway.
+    """
+
+    def __init__(self, rooms: RoomRegistry):
+        self.rooms = rooms
+        self._held: dict[tuple[str, str], Callable[[], Awaitable]] = {}
+        self._tasks: dict[tuple[str, str], asyncio.Task] = {}
+        self.held = 0
+        self.dropped = 0
+
+    async def __call__(self, sid: str, event: str, deliver: Callable[[], Awaitable]) -> str:
+        """"pass", "hold" (kept to `deliver` later) or "drop"."""
+        key = (sid, event)
+        if key in self._held:
+            self._held[key] = deliver
+            self.held += 1
+            return "hold"
+        wait = await self._take(sid, event)
+        if not wait:
+            return "pass"
+        if event in COALESCED:
+            self._held[key] = deliver
+            self._tasks[key] = asyncio.create_task(self._release(key, wait))
+            self.held += 1
+            return "hold"
+        self.dropped += 1
+        return "drop"
+
+    async def _take(self, sid: str, event: str) -> float:
+        grant = self.rooms.grant(sid)
+        for name, setting, scope in GROUP_LIMITS[EVENT_GROUPS.get(event, "socket")]:
+            ident = sid
+            if scope == "user":
+                grant = grant or await self.rooms.settled(sid)
+                if grant is None:
+                    continue
+                ident = grant.user_email
+            elif scope == "room":
+                if grant is None:
+                    continue
+                ident = grant.code
+            wait = await check(name, getattr(settings, setting), ident)
+            if wait:
+                return wait
+        return 0.0
+
+    async def _release(self, key: tuple[str, str], wait: float) -> None:
+        try:
+            while wait:
+                await asyncio.sleep(wait)
+                wait = await self._take(*key)
+            deliver = self._held.pop(key)
+            del self._tasks[key]
+            await deliver()
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+                self._held.pop(key, None)
+
+    def discard(self, sid: str) -> None:
+        for key in [k for k in self._tasks if k[0] == sid]:
+            self._tasks.pop(key).cancel()
+            self._held.pop(key, None)
@@ -1,17 +1,43 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from ..deps import get_db_dep
+import json
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from .. import schemas
+from ..assist import AssistBusy, AssistFailed, AssistJob, assistant
 
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
 
-@router.post("/assist")
-def assist(prompt: dict, db: Session = Depends(get_db_dep)):
-    # Placeholder for future AI integration (OpenAI, etc.)
-    code = prompt.get("code", "")
-    question = prompt.get("question", "")
-    return {"answer": f"AI assistant is not configured. You asked: {question}", "codeEcho": code}
+def _submit(prompt: schemas.AssistIn) -> AssistJob:
+    try:
+        return assistant.submit(prompt.code, prompt.question)
+    except AssistBusy:
+        raise HTTPException(status_code=503, detail="The assistant is busy, please retry", headers={"Retry-After": "2"})
 
 
+@router.post("/assist", response_model=schemas.AssistOut)
+async def assist(prompt: schemas.AssistIn):
+    job = _submit(prompt)
+    try:
+        answer = await job.result()
+    except AssistFailed as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"answer": answer, "cached": job.cached}
 
+
+@router.post("/assist/stream")
+async def assist_stream(prompt: schemas.AssistIn):
+    # Server-sent events: `data: {"token"}` per piece of the answer, then
+    # `event: done` with {"cached"} or `event: error` with {"detail"}
+    job = _submit(prompt)
+
+    async def events():
+        try:
+            async for chunk in job.stream():
+                yield f"data: {json.dumps({'token': chunk})}\n\n"
+        except AssistFailed as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps({'cached': job.cached})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,10 +1,26 @@
+import difflib
+import hashlib
 import random
+import re
 import string
-from fastapi import APIRouter, Depends, HTTPException
+import tempfile
+from typing import IO, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from .. import models, schemas
-from ..auth import get_current_user
+from ..archives import ArchiveError, export_files, import_archive, tar_stream, zip_stream
+from ..auth import Principal, get_current_user, get_current_user_released
+from ..config import settings
+from ..database import request_session
 from ..deps import get_db_dep
+from ..search import nested_repeats, required_literals, search_index
+from ..session_codes import SessionRef, resolve, session_cache
+from ..realtime import ot, revisions
+from ..realtime.documents import store, StaleRevision, StoreBusy
 
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
@@ -14,26 +30,74 @@ def _generate_code(length: int = 8) -> str:
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
 
-@router.post("/create", response_model=schemas.SessionOut)
-def create_session(payload: schemas.SessionCreate, db: Session = Depends(get_db_dep), current_user: models.User = Depends(get_current_user)):
-    code = _generate_code()
-    while db.query(models.Session).filter(models.Session.code == code).first() is not None:
-        code = _generate_code()
-    session = models.Session(name=payload.name, code=code, owner_id=current_user.id)
-    db.add(session)
-    db.commit()
-    db.refresh(session)
+def _is_code_conflict(e: IntegrityError) -> bool:
+    # MySQL names the constraint, SQLite names the column
+    message = str(e.orig)
+    return "uq_sessions_code" in message or "sessions.code" in message
+
+
+def _message_page(db: Session, session_id: int, before: Optional[int] = None, after: Optional[int] = None, limit: int = 50) -> list[dict]:
+    # Keyset pagination over (session_id, id): the latest page by default,
+    # older pages with before=<id>, newer ones with after=<id>
+    q = (
+        db.query(models.ChatMessage.id, models.ChatMessage.content, models.ChatMessage.created_at, models.User.email.label("user_email"))
+        .outerjoin(models.User, models.User.id == models.ChatMessage.user_id)
+        .filter(models.ChatMessage.session_id == session_id)
+    )
+    if after is not None:
+        rows = q.filter(models.ChatMessage.id > after).order_by(models.ChatMessage.id.asc()).limit(limit).all()
+    else:
+        if before is not None:
+            q = q.filter(models.ChatMessage.id < before)
+        rows = q.order_by(models.ChatMessage.id.desc()).limit(limit).all()
+        rows.reverse()
+    return [row._asdict() for row in rows]
 
-    # create default document
-    doc = models.Document(session_id=session.id, title="main.ts", content="", language="typescript")
-    db.add(doc)
-    db.commit()
-    return session
+
+def _list_documents(db: Session, session_id: int, include_content: bool) -> list[dict]:
+    columns = [models.Document.id, models.Document.session_id, models.Document.title, models.Document.language, models.Document.revision, models.Document.updated_at]
+    if include_content:
+        columns.append(models.Document.content)
+    documents = []
+    for row in db.query(*columns).filter(models.Document.session_id == session_id).order_by(models.Document.id).all():
+        doc = row._asdict()
+        # Open documents may have edits the database has not seen yet
+        live = store.get(doc["id"]) if include_content else None
+        if live is not None:
+            doc["content"] = live.content
+            doc["revision"] = live.rev
+        documents.append(doc)
+    return documents
+
+
+@router.post("/create", response_model=schemas.SessionOut)
+def create_session(payload: schemas.SessionCreate, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
+    # Codes are random over 36**8, so a clash is rare: insert and let
+    # uq_sessions_code reject it rather than probing for a free code first
+    for _ in range(5):
+        session = models.Session(name=payload.name, code=_generate_code(), owner_id=current_user.id)
+        db.add(session)
+        # create default document
+        doc = models.Document(session=session, title="main.ts", content="", language="typescript")
+        db.add(doc)
+        try:
+            db.flush()
+        except IntegrityError as e:
+            db.rollback()
+            if not _is_code_conflict(e):
+                raise
+            continue
+        revisions.record_snapshot(db, doc.id, 0, doc.content)
+        ref = SessionRef(session.id, session.name, session.code, session.owner_id, current_user.email, session.created_at)
+        db.commit()
+        session_cache.set(ref.code, ref)
+        return ref
+    raise HTTPException(status_code=503, detail="Could not allocate a session code, try again")
 
 
 @router.get("/by-code/{code}", response_model=schemas.SessionOut)
-def get_by_code(code: str, db: Session = Depends(get_db_dep), current_user: models.User = Depends(get_current_user)):
-    session = db.query(models.Session).filter(models.Session.code == code).first()
+def get_by_code(code: str, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
+    session = resolve(db, code)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return session
@@ -41,71 +105,295 @@ def get_by_code(code: str, db: Session = Depends(get_db_dep), current_user: mode
 
 @router.get("/info/{code}", response_model=schemas.SessionInfoOut)
 def get_info(code: str, db: Session = Depends(get_db_dep)):
-    session = db.query(models.Session).filter(models.Session.code == code).first()
+    session = resolve(db, code)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    owner = db.query(models.User).filter(models.User.id == session.owner_id).first()
-    return {
-        "id": session.id,
-        "name": session.name,
-        "code": session.code,
-        "owner_email": owner.email if owner else None,
-        "created_at": session.created_at,
-    }
+    return session
 
 
-@router.get("/{session_id}/documents", response_model=list[schemas.DocumentOut])
-def list_documents(session_id: int, db: Session = Depends(get_db_dep), current_user: models.User = Depends(get_current_user)):
-    docs = db.query(models.Document).filter(models.Document.session_id == session_id).all()
-    return docs
+@router.get("/{session_id}/documents", response_model=list[schemas.DocumentMetaOut])
+def list_documents(session_id: int, include_content: bool = False, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
+    # Files are listed without reading their TEXT columns unless asked to;
+    # fetch a file with GET /documents/{id}/content when it is opened
+    return _list_documents(db, session_id, include_content)
+
+
+@router.get("/documents/{document_id}/content", response_model=schemas.DocumentOut)
+def get_document_content(document_id: int, request: Request, response: Response, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
+    doc = db.query(models.Document).filter(models.Document.id == document_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    live = store.get(doc.id)
+    content, revision = (live.content, live.rev) if live is not None else (doc.content or "", doc.revision or 0)
+    # Every content change bumps the revision; title and language do not
+    meta = hashlib.sha256(f"{doc.title}\0{doc.language}".encode()).hexdigest()[:12]
+    etag = f'"{doc.id}-{revision}-{meta}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return {
+        "id": doc.id,
+        "session_id": doc.session_id,
+        "title": doc.title,
+        "content": content,
+        "language": doc.language,
+        "revision": revision,
+        "updated_at": doc.updated_at,
+    }
 
 
 @router.patch("/documents/{document_id}", response_model=schemas.DocumentOut)
-def upsert_document(document_id: int, payload: schemas.DocumentUpsert, db: Session = Depends(get_db_dep), current_user: models.User = Depends(get_current_user)):
+def upsert_document(document_id: int, payload: schemas.DocumentUpsert, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
     doc = db.query(models.Document).filter(models.Document.id == document_id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
+    if payload.content is not None:
+        # Content is owned by the realtime store, which broadcasts the change
+        # to open editors and persists it along with its revision history
+        try:
+            replaced = store.replace_threadsafe(doc.id, payload.content)
+        except StoreBusy as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        if replaced:
+            # Ends this transaction so the store's write is visible
+            db.commit()
+        elif payload.content != doc.content:
+            doc.content = payload.content
+            doc.revision = (doc.revision or 0) + 1
+            revisions.record_snapshot(db, doc.id, doc.revision, doc.content)
     if payload.title is not None:
         doc.title = payload.title
-    if payload.content is not None:
-        doc.content = payload.content
     if payload.language is not None:
         doc.language = payload.language
     db.add(doc)
     db.commit()
     db.refresh(doc)
+    search_index.put(doc.session_id, doc.id, doc.title, doc.revision or 0, doc.content or "")
     return doc
 
 
+def _patch_row(db: Session, document_id: int, base_revision: int, op: ot.Op) -> Optional[tuple[int, str]]:
+    # The store's checks on the stored row, for processes without a running store
+    doc = db.query(models.Document).filter(models.Document.id == document_id).with_for_update().first()
+    if doc is None:
+        return None
+    revision = doc.revision or 0
+    if base_revision != revision:
+        raise StaleRevision(f"document is at revision {revision}")
+    if not op:
+        return revision, doc.content or ""
+    doc.content = ot.apply(doc.content or "", op)
+    doc.revision = revision + 1
+    revisions.record_snapshot(db, doc.id, doc.revision, doc.content)
+    db.commit()
+    return doc.revision, doc.content
+
+
+@router.post("/documents/{document_id}/patch", response_model=schemas.DocumentOut)
+def patch_document(document_id: int, payload: schemas.DocumentPatch, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
+    # Edits go through the realtime store, which applies them to the live copy
+    # (loading it if needed), tells open editors and persists the result
+    op = [ot.Edit(e.pos, e.delete, e.insert) for e in payload.edits if e.delete or e.insert]
+    try:
+        if store.running:
+            result = store.patch_threadsafe(document_id, payload.base_revision, op)
+        else:
+            result = _patch_row(db, document_id, payload.base_revision, op)
+    except StaleRevision as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Edit range outside document")
+    except StoreBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if result is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    doc = db.query(models.Document).filter(models.Document.id == document_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    revision, content = result
+    search_index.put(doc.session_id, doc.id, doc.title, revision, content)
+    return {
+        "id": doc.id,
+        "session_id": doc.session_id,
+        "title": doc.title,
+        "content": content,
+        "language": doc.language,
+        "revision": revision,
+        "updated_at": doc.updated_at,
+    }
+
+
+@router.get("/documents/{document_id}/revisions", response_model=list[schemas.DocumentRevisionOut])
+def list_revisions(
+    document_id: int,
+    before: Optional[int] = None,
+    limit: int = Query(default=100, ge=1, le=500),
+    db: Session = Depends(get_db_dep),
+    current_user: Principal = Depends(get_current_user),
+):
+    R = models.DocumentRevision
+    q = db.query(R.revision, R.depth, func.length(R.data).label("size"), R.created_at).filter(R.document_id == document_id)
+    if before is not None:
+        q = q.filter(R.revision < before)
+    return [row._asdict() for row in q.order_by(R.revision.desc()).limit(limit).all()]
+
+
+def _revision_content(db: Session, document_id: int, revision: int) -> str:
+    content = revisions.load(db, document_id, revision)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Revision {revision} not found")
+    return content
+
+
+@router.get("/documents/{document_id}/revisions/{revision}", response_model=schemas.DocumentRevisionContentOut)
+def get_revision(document_id: int, revision: int, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
+    return {"document_id": document_id, "revision": revision, "content": _revision_content(db, document_id, revision)}
+
+
+@router.get("/documents/{document_id}/diff", response_model=schemas.DocumentDiffOut)
+def diff_revisions(
+    document_id: int,
+    from_revision: int = Query(alias="from"),
+    to_revision: int = Query(alias="to"),
+    db: Session = Depends(get_db_dep),
+    current_user: Principal = Depends(get_current_user),
+):
+    old = _revision_content(db, document_id, from_revision)
+    new = _revision_content(db, document_id, to_revision)
+    diff = difflib.unified_diff(
+        old.splitlines(), new.splitlines(), fromfile=f"r{from_revision}", tofile=f"r{to_revision}", lineterm=""
+    )
+    return {"document_id": document_id, "from_revision": from_revision, "to_revision": to_revision, "diff": "\n".join(diff)}
+
+
 @router.post("/{session_id}/documents", response_model=schemas.DocumentOut)
-def create_document(session_id: int, payload: schemas.DocumentCreate, db: Session = Depends(get_db_dep), current_user: models.User = Depends(get_current_user)):
+def create_document(session_id: int, payload: schemas.DocumentCreate, db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
     session = db.query(models.Session).filter(models.Session.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     doc = models.Document(session_id=session_id, title=payload.title, content="", language=payload.language or "typescript")
     db.add(doc)
+    db.flush()
+    revisions.record_snapshot(db, doc.id, 0, "")
     db.commit()
     db.refresh(doc)
+    search_index.put(session_id, doc.id, doc.title, 0, "")
     return doc
 
 
 @router.get("/mine", response_model=list[schemas.SessionOut])
-def my_sessions(db: Session = Depends(get_db_dep), current_user: models.User = Depends(get_current_user)):
+def my_sessions(db: Session = Depends(get_db_dep), current_user: Principal = Depends(get_current_user)):
     sessions = db.query(models.Session).filter(models.Session.owner_id == current_user.id).order_by(models.Session.created_at.desc()).all()
     return sessions
 
 
 @router.get("/{session_id}/messages", response_model=list[schemas.ChatMessageViewOut])
-def list_messages(session_id: int, db: Session = Depends(get_db_dep), current_user: models.User = Depends(get_current_user)):
-    msgs = db.query(models.ChatMessage).filter(models.ChatMessage.session_id == session_id).order_by(models.ChatMessage.created_at.asc()).all()
-    result: list[schemas.ChatMessageViewOut] = []
-    for m in msgs:
-        user = db.query(models.User).filter(models.User.id == m.user_id).first()
-        result.append({
-            "content": m.content,
-            "created_at": m.created_at,
-            "user_email": user.email if user else None,
-        })
-    return result
+def list_messages(
+    session_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Query(default=50, ge=1, le=200),
+    db: Session = Depends(get_db_dep),
+    current_user: Principal = Depends(get_current_user),
+):
+    return _message_page(db, session_id, before=before, after=after, limit=limit)
 
 
+@router.get("/{session_id}/search", response_model=schemas.SearchOut)
+def search_documents(
+    session_id: int,
+    q: str = Query(min_length=1, max_length=500),
+    regex: bool = False,
+    case: bool = False,
+    limit: int = Query(default=50, ge=1, le=500),
+    per_file: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db_dep),
+    current_user: Principal = Depends(get_current_user),
+):
+    # Substring search by default; regex=true takes a Python regular expression.
+    # Files are narrowed down with a trigram index, then matched for real.
+    flags = re.MULTILINE if case else re.MULTILINE | re.IGNORECASE
+    if regex:
+        try:
+            pattern = re.compile(q, flags)
+        except re.error as e:
+            raise HTTPException(status_code=422, detail=f"Invalid regular expression: {e}")
+        if nested_repeats(q, flags):
+            raise HTTPException(status_code=422, detail="Regular expression too expensive: a repeat inside a repeat")
+        literals = required_literals(q, flags)
+    else:
+        pattern = re.compile(re.escape(q), flags)
+        literals = [q]
+    return search_index.search(db, session_id, pattern, literals, limit, per_file)
+
+
+def _import(session_id: int, fileobj: IO[bytes]) -> dict:
+    with request_session() as db:
+        if db.query(models.Session.id).filter(models.Session.id == session_id).first() is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        try:
+            return import_archive(db, session_id, fileobj)
+        except ArchiveError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.post("/{session_id}/import", response_model=schemas.ImportOut)
+async def import_session_archive(session_id: int, request: Request, current_user: Principal = Depends(get_current_user_released)):
+    # The body is the .zip or .tar(.gz) itself. It is spooled (to disk past
+    # import_spool_bytes) as it arrives, then read file by file; no database
+    # session is held until the upload is complete.
+    with tempfile.SpooledTemporaryFile(max_size=settings.import_spool_bytes) as spool:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.import_max_bytes:
+                raise HTTPException(status_code=413, detail="Archive too large")
+            spool.write(chunk)
+        if not size:
+            raise HTTPException(status_code=422, detail="Expected a zip or tar archive")
+        return await run_in_threadpool(_import, session_id, spool)
+
+
+@router.get("/{session_id}/export")
+def export_session_archive(
+    session_id: int,
+    format: str = Query(default="zip", pattern="^(zip|tar\\.gz)$"),
+    db: Session = Depends(get_db_dep),
+    current_user: Principal = Depends(get_current_user),
+):
+    # Built file by file while it is sent, from a server-side cursor
+    session = db.query(models.Session.code).filter(models.Session.id == session_id).first()
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    stream, media_type = (zip_stream, "application/zip") if format == "zip" else (tar_stream, "application/gzip")
+    return StreamingResponse(
+        stream(export_files(db, session_id)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{session.code}.{format}"'},
+    )
+
+
+@router.get("/{code}/bootstrap", response_model=schemas.SessionBootstrapOut)
+def bootstrap(
+    code: str,
+    include_content: bool = False,
+    messages: int = Query(default=50, ge=0, le=200),
+    db: Session = Depends(get_db_dep),
+    current_user: Principal = Depends(get_current_user),
+):
+    # Everything the editor needs on entry in one round trip: the session, its
+    # files (content only when asked for; editors get it from editor_open) and
+    # the latest page of chat
+    session = resolve(db, code)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    documents = _list_documents(db, session.id, include_content)
+    page = _message_page(db, session.id, limit=messages + 1) if messages else []
+    return {
+        "session": session,
+        "documents": documents,
+        "messages": page[-messages:] if messages else [],
+        "has_earlier_messages": len(page) > messages,
+    }
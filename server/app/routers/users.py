@@ -4,12 +4,13 @@ from fastapi.security import OAuth2PasswordRequestForm
 from .. import models, schemas
 from ..auth import hash_password, verify_password, create_access_token
 from ..deps import get_db_dep
+from ..ratelimit import limit_login, limit_register
 
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 
-@router.post("/register", response_model=schemas.UserOut)
+@router.post("/register", response_model=schemas.UserOut, dependencies=[Depends(limit_register)])
 def register(user_in: schemas.UserCreate, db: Session = Depends(get_db_dep)):
     existing = db.query(models.User).filter(models.User.email == user_in.email).first()
     if existing:
@@ -21,7 +22,7 @@ def register(user_in: schemas.UserCreate, db: Session = Depends(get_db_dep)):
     return user
 
 
-@router.post("/login", response_model=schemas.TokenOut)
+@router.post("/login", response_model=schemas.TokenOut, dependencies=[Depends(limit_login)])
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db_dep)):
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
     if not user or not verify_password(form_data.password, user.password_hash):
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
+from .config import settings
 
 
 class UserCreate(BaseModel):
@@ -65,12 +66,104 @@ class DocumentOut(BaseModel):
     title: str
     content: str
     language: str
+    revision: int = 0
     updated_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class DocumentMetaOut(BaseModel):
+    id: int
+    session_id: int
+    title: str
+    language: str
+    revision: int = 0
+    updated_at: datetime
+    content: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DocumentEdit(BaseModel):
+    # Replace `del` characters at `pos` with `ins`; edits apply in order
+    pos: int = Field(ge=0)
+    delete: int = Field(default=0, ge=0, alias="del")
+    insert: str = Field(default="", alias="ins")
+
+
+class DocumentPatch(BaseModel):
+    base_revision: int
+    edits: List[DocumentEdit]
+
+
+class DocumentRevisionOut(BaseModel):
+    revision: int
+    # 0 for a full snapshot, else the number of deltas since the last one
+    depth: int
+    size: int
+    created_at: datetime
+
+
+class DocumentRevisionContentOut(BaseModel):
+    document_id: int
+    revision: int
+    content: str
+
+
+class DocumentDiffOut(BaseModel):
+    document_id: int
+    from_revision: int
+    to_revision: int
+    # Unified diff, empty when the revisions match
+    diff: str
+
+
+class SearchHitOut(BaseModel):
+    # 1-based, in characters, like the editor
+    line: int
+    column: int
+    length: int
+    text: str
+
+
+class SearchFileOut(BaseModel):
+    document_id: int
+    title: str
+    hits: List[SearchHitOut]
+
+
+class SearchOut(BaseModel):
+    files: List[SearchFileOut]
+    # Files the trigram index could not rule out
+    candidates: int
+    truncated: bool
+
+
+class SkippedFileOut(BaseModel):
+    path: str
+    # "exists", "binary", "too large", "invalid path" or "too many files"
+    reason: str
+
+
+class ImportOut(BaseModel):
+    created: int
+    skipped: int
+    # The first 100 skipped files
+    skipped_files: List[SkippedFileOut]
+
+
+class AssistIn(BaseModel):
+    code: str = Field(default="", max_length=settings.ai_max_code_chars)
+    question: str = Field(default="", max_length=settings.ai_max_question_chars)
+
+
+class AssistOut(BaseModel):
+    answer: str
+    cached: bool
+
+
 class DocumentCreate(BaseModel):
     title: str
     language: Optional[str] = "typescript"
@@ -92,8 +185,14 @@ class ChatMessageOut(BaseModel):
 
 
 class ChatMessageViewOut(BaseModel):
+    id: int
     content: str
     created_at: datetime
     user_email: EmailStr | None = None
 
 
+class SessionBootstrapOut(BaseModel):
+    session: SessionOut
+    documents: List[DocumentMetaOut]
+    messages: List[ChatMessageViewOut]
+    has_earlier_messages: bool
@@ -0,0 +1,287 @@
+from __future__ import annotations
+import bisect
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+from sqlalchemy.orm import Session
+from .config import settings
+from . import models
+from .realtime.documents import store
+
+# The regex parser is private; without it queries go unfiltered and unchecked
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    try:  # Python < 3.11
+        import sre_constants, sre_parse
+    except ImportError:
+        sre_constants = sre_parse = None
+
+
+def trigrams(text: str) -> set[str]:
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _parse(pattern: str, flags: int):
+    if sre_parse is None:
+        return None
+    try:
+        return sre_parse.parse(pattern, flags)
+    except (re.error, RecursionError):
+        return None
+
+
+def required_literals(pattern: str, flags: int = 0) -> list[str]:
+    """Lowercased substrings that every match of the regex `pattern` contains.
+
+    Only runs of plain characters outside alternations and repeats count, so
+    the result may be empty (nothing to prefilter on) but is never wrong.
+    """
+    parsed = _parse(pattern, flags)
+    if parsed is None:
+        return []
+    out: list[str] = []
+    run: list[str] = []
+
+    def end_run() -> None:
+        if len(run) >= 3:
+            out.append("".join(run).lower())
+        run.clear()
+
+    def walk(items) -> None:
+        for op, av in items:
+            if op is sre_constants.LITERAL:
+                run.append(chr(av))
+            elif op is sre_constants.SUBPATTERN:
+                walk(av[-1])
+            else:
+                end_run()
+
+    try:
+        walk(parsed)
+    except (AttributeError, TypeError, ValueError):
+        # Parser internals changed shape
+        return []
+    end_run()
+    return out
+
+
+def nested_repeats(pattern: str, flags: int = 0) -> bool:
+    """Whether the regex `pattern` repeats something that itself repeats,
+    like (a+)+, the shape that backtracks exponentially on a near miss."""
+    parsed = _parse(pattern, flags)
+    if parsed is None:
+        return False
+    repeats = {getattr(sre_constants, name) for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(sre_constants, name)}
+
+    def subpatterns(av):
+        if isinstance(av, sre_parse.SubPattern):
+            yield av
+        elif isinstance(av, (tuple, list)):
+            for item in av:
+                yield from subpatterns(item)
+
+    def walk(items, repeated: bool) -> bool:
+        for op, av in items:
+            # Repeats of at most once, like (a+)?, cannot blow up
+            repeat = op in repeats and av[1] > 1
+            if repeat and repeated:
+                return True
+            if any(walk(sub, repeated or repeat) for sub in subpatterns(av)):
+                return True
+        return False
+
+    try:
+        return walk(parsed, False)
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+class _Doc:
+    __slots__ = ("slot", "title", "revision", "content")
+
+    def __init__(self, slot: int, title: str, revision: int, content: str):
+        self.slot = slot
+        self.title = title
+        self.revision = revision
+        self.content = content
+
+
+class SessionIndex:
+    """Trigram index over one session's documents.
+
+    Each trigram's posting list is a bitset (a Python int) over document
+    slots, so narrowing a query to candidate files is a few big-int ANDs.
+    Trigrams are lowercased; matching against the real text decides case.
+    """
+
+    def __init__(self):
+        self.docs: dict[int, _Doc] = {}
+        self.lock = threading.Lock()
+        self.synced = 0.0
+        self._slots: list[Optional[int]] = []
+        self._free: list[int] = []
+        self._postings: dict[str, int] = {}
+
+    def put(self, document_id: int, title: str, revision: int, content: str) -> None:
+        doc = self.docs.get(document_id)
+        if doc is None:
+            slot = self._free.pop() if self._free else len(self._slots)
+            if slot == len(self._slots):
+                self._slots.append(None)
+            self._slots[slot] = document_id
+            doc = self.docs[document_id] = _Doc(slot, title, revision, "")
+            old = set()
+        else:
+            doc.title = title
+            if doc.revision == revision and doc.content == content:
+                return
+            old = trigrams(doc.content)
+        new = trigrams(content)
+        bit = 1 << doc.slot
+        for t in old - new:
+            self._clear(t, bit)
+        for t in new - old:
+            self._postings[t] = self._postings.get(t, 0) | bit
+        doc.revision = revision
+        doc.content = content
+
+    def remove(self, document_id: int) -> None:
+        doc = self.docs.pop(document_id, None)
+        if doc is None:
+            return
+        bit = 1 << doc.slot
+        for t in trigrams(doc.content):
+            self._clear(t, bit)
+        self._slots[doc.slot] = None
+        self._free.append(doc.slot)
+
+    def _clear(self, trigram: str, bit: int) -> None:
+        rest = self._postings.get(trigram, 0) & ~bit
+        if rest:
+            self._postings[trigram] = rest
+        else:
+            self._postings.pop(trigram, None)
+
+    def candidates(self, literals: Iterable[str]) -> list[int]:
+        """Ids of documents containing every trigram of every literal, in id order."""
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal)
+        if not grams:
+            return sorted(self.docs)
+        mask = -1
+        # Rarest first, so a miss or a tiny set ends the ANDs early
+        for t in sorted(grams, key=lambda t: self._postings.get(t, 0).bit_count()):
+            mask &= self._postings.get(t, 0)
+            if not mask:
+                return []
+        bits = bin(mask)[:1:-1]
+        return sorted(self._slots[i] for i, b in enumerate(bits) if b == "1")
+
+    @property
+    def size(self) -> int:
+        return len(self._postings)
+
+
+def _hits(content: str, regex: re.Pattern, limit: int) -> list[dict]:
+    hits = []
+    starts = None
+    for m in regex.finditer(content):
+        if m.start() == m.end():
+            continue
+        if starts is None:
+            starts = [0] + [n.end() for n in re.finditer("\n", content)]
+        line = bisect.bisect_right(starts, m.start()) - 1
+        end = content.find("\n", starts[line])
+        text = content[starts[line]:end if end != -1 else len(content)]
+        hits.append({"line": line + 1, "column": m.start() - starts[line] + 1, "length": m.end() - m.start(), "text": text[:200]})
+        if len(hits) >= limit:
+            break
+    return hits
+
+
+class SearchIndex:
+    """Per-session trigram indexes, built on first search and kept current.
+
+    Writes in this process update an index directly (`put`). Before a search
+    the index is checked against document revisions in the database, at most
+    every `search_sync_interval` seconds, which picks up writes made
+    elsewhere, and against live copies in the realtime store.
+    """
+
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[int, SessionIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index(self, session_id: int, create: bool) -> Optional[SessionIndex]:
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None and create:
+                index = self._sessions[session_id] = SessionIndex()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            if index is not None:
+                self._sessions.move_to_end(session_id)
+            return index
+
+    def put(self, session_id: int, document_id: int, title: str, revision: int, content: str) -> None:
+        # Sessions nobody has searched yet are indexed on their first search
+        index = self._index(session_id, create=False)
+        if index is not None:
+            with index.lock:
+                index.put(document_id, title, revision, content)
+
+    def _sync(self, db: Session, session_id: int, index: SessionIndex) -> None:
+        now = time.monotonic()
+        if now - index.synced >= settings.search_sync_interval:
+            D = models.Document
+            meta = db.query(D.id, D.title, D.revision).filter(D.session_id == session_id).all()
+            known = {row.id for row in meta}
+            for document_id in [i for i in index.docs if i not in known]:
+                index.remove(document_id)
+            stale = []
+            for row in meta:
+                doc = index.docs.get(row.id)
+                if doc is None or doc.revision < (row.revision or 0):
+                    stale.append(row.id)
+                else:
+                    doc.title = row.title
+            for start in range(0, len(stale), 500):
+                for row in db.query(D.id, D.title, D.revision, D.content).filter(D.id.in_(stale[start:start + 500])).all():
+                    index.put(row.id, row.title, row.revision or 0, row.content or "")
+            index.synced = now
+        # Open documents may be ahead of the database
+        for state in store.for_session(session_id):
+            doc = index.docs.get(state.document_id)
+            if doc is not None and state.rev > doc.revision:
+                index.put(state.document_id, doc.title, state.rev, state.content)
+
+    def search(self, db: Session, session_id: int, regex: re.Pattern, literals: list[str], limit: int, per_file: int) -> dict:
+        index = self._index(session_id, create=True)
+        with index.lock:
+            self._sync(db, session_id, index)
+            candidates = [(i, index.docs[i].title, index.docs[i].content) for i in index.candidates(literals)]
+        # Matched outside the lock, so a slow pattern holds up no other search
+        # or write; past `search_timeout` the remaining files are skipped
+        deadline = time.monotonic() + settings.search_timeout
+        files = []
+        truncated = False
+        for document_id, title, content in candidates:
+            if time.monotonic() > deadline:
+                truncated = True
+                break
+            hits = _hits(content, regex, per_file)
+            if hits:
+                if len(files) == limit:
+                    truncated = True
+                    break
+                files.append({"document_id": document_id, "title": title, "hits": hits})
+        return {"files": files, "candidates": len(candidates), "truncated": truncated}
+
+
+search_index = SearchIndex(settings.search_index_sessions)
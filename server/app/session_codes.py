@@ -0,0 +1,75 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from .config import settings
+from . import models
+from .utils.cache import TTLCache
+
+
+@dataclass(frozen=True)
+class SessionRef:
+    id: int
+    name: str
+    code: str
+    owner_id: int
+    owner_email: Optional[str]
+    created_at: datetime
+
+
+# Session code -> session, for the routes and socket handlers that address
+# sessions by code. Changes made through the ORM in this process drop their
+# entries; the ttl bounds how long changes made by other workers go unseen.
+session_cache: TTLCache[str, SessionRef] = TTLCache(settings.session_cache_size, settings.session_cache_ttl)
+
+
+def _query(db: Session):
+    return db.query(
+        models.Session.id,
+        models.Session.name,
+        models.Session.code,
+        models.Session.owner_id,
+        models.User.email.label("owner_email"),
+        models.Session.created_at,
+    ).outerjoin(models.User, models.User.id == models.Session.owner_id)
+
+
+def resolve(db: Session, code: str) -> Optional[SessionRef]:
+    ref = session_cache.get(code)
+    if ref is None:
+        row = _query(db).filter(models.Session.code == code).first()
+        if row is None:
+            return None
+        ref = SessionRef(**row._asdict())
+        session_cache.set(code, ref)
+    return ref
+
+
+def resolve_many(db: Session, codes: Iterable[str]) -> dict[str, SessionRef]:
+    found, missing = {}, []
+    for code in set(codes):
+        ref = session_cache.get(code)
+        if ref is None:
+            missing.append(code)
+        else:
+            found[code] = ref
+    if missing:
+        for row in _query(db).filter(models.Session.code.in_(missing)).all():
+            ref = found[row.code] = SessionRef(**row._asdict())
+            session_cache.set(row.code, ref)
+    return found
+
+
+@event.listens_for(models.Session, "after_update")
+@event.listens_for(models.Session, "after_delete")
+def _session_changed(mapper, connection, target: models.Session) -> None:
+    for code in {target.code, *(inspect(target).attrs.code.history.deleted or ())}:
+        session_cache.pop(code)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _owner_changed(mapper, connection, target: models.User) -> None:
+    session_cache.discard_where(lambda ref: ref.owner_id == target.id)
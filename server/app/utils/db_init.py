@@ -1,9 +1,17 @@
 from __future__ import annotations
-import pymysql
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
 from ..config import settings
 
 
+logger = logging.getLogger(__name__)
+
+
 def ensure_database_exists() -> None:
+    import pymysql
+
     connection = None
     try:
         connection = pymysql.connect(
@@ -12,15 +20,68 @@ def ensure_database_exists() -> None:
             password=settings.db_password,
             autocommit=True,
             charset="utf8mb4",
+            connect_timeout=settings.db_connect_timeout,
         )
         with connection.cursor() as cursor:
             cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{settings.db_name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;")
-    except Exception:
-        # Swallow errors silently; DB might not be creatable with provided user
-        pass
+    except Exception as exc:
+        # The user may not be allowed to create databases; connecting will tell
+        logger.warning("could not create database %s: %s", settings.db_name, exc)
     finally:
         if connection:
             connection.close()
 
 
+def upgrade_schema(engine: Engine) -> list[str]:
+    """Create missing tables, then add columns and indexes that existing tables lack.
+
+    Additive only: nothing is altered or dropped. Returns the DDL that ran.
+    """
+    from ..database import Base
+    from .. import models  # noqa: F401  (registers the tables)
+
+    applied = []
+    existing = set(inspect(engine).get_table_names())
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        inspector = inspect(conn)
+        preparer = conn.dialect.identifier_preparer
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                ddl = "ALTER TABLE %s ADD COLUMN %s %s" % (
+                    preparer.format_table(table), preparer.format_column(column), column.type.compile(dialect=conn.dialect)
+                )
+                default = getattr(column.server_default, "arg", None)
+                if default is not None:
+                    ddl += " DEFAULT " + ("'%s'" % default.replace("'", "''") if isinstance(default, str) else str(default))
+                # Existing rows need a value, so NOT NULL only comes with a default
+                if not column.nullable and default is not None:
+                    ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                applied.append(ddl)
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    conn.execute(CreateIndex(index))
+                    applied.append(str(CreateIndex(index).compile(dialect=conn.dialect)).strip())
+    for ddl in applied:
+        logger.info("schema upgrade: %s", ddl)
+    return applied
+
+
+def init_db() -> list[str]:
+    from ..database import get_engine
+
+    if not settings.database_url:
+        ensure_database_exists()
+    return upgrade_schema(get_engine())
+
 
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    init_db()
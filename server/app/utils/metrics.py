@@ -0,0 +1,142 @@
+from __future__ import annotations
+import abc
+import bisect
+import threading
+from typing import Callable, Iterable
+
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Labels, values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names: Labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def samples(self) -> list[str]:
+        """The exposition lines for every label set, without HELP and TYPE."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values: dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def total(self, *labels: str) -> float:
+        entry = self._values.get(labels)
+        return entry[1] if entry else 0.0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        lines = []
+        for k, counts, total in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, k, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, k)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, k)} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """Read at scrape time from `collect`, which returns {label values: value}.
+
+    Pass kind="counter" to expose a total some other component keeps.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], dict[Labels, float]], labels: Iterable[str] = (), kind: str = "gauge"):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in self.collect().items()]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, help, labels, **kwargs))
+
+    def gauge(self, name: str, help: str, collect: Callable[[], dict[Labels, float]], labels: Iterable[str] = (), kind: str = "gauge") -> Gauge:
+        return self.register(Gauge(name, help, collect, labels, kind))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(m.render() for m in self.metrics.values()) + "\n"
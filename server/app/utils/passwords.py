@@ -0,0 +1,66 @@
+from __future__ import annotations
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Optional, TypeVar
+from passlib.context import CryptContext
+from ..config import settings
+
+
+T = TypeVar("T")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def hash_sync(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_sync(plain_password: str, password_hash: str) -> bool:
+    return pwd_context.verify(plain_password, password_hash)
+
+
+# bcrypt is deliberately slow and holds the GIL, so hashing runs in worker
+# processes. At most `password_hash_workers + password_hash_queue_limit` calls
+# may be running or waiting; any more are refused straight away.
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, settings.password_hash_workers + settings.password_hash_queue_limit))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.password_hash_workers)
+        return _pool
+
+
+def run(fn: Callable[..., T], *args) -> T:
+    if settings.password_hash_workers <= 0:
+        return fn(*args)
+    if not _slots.acquire(blocking=False):
+        raise HasherBusy()
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot stays taken until the worker is done with the call, even if
+    # the caller below has given up on it
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=settings.password_hash_timeout)
+    except FutureTimeout:
+        raise HasherBusy()
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,173 @@
+from __future__ import annotations
+import itertools
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import NamedTuple, Optional, Protocol
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+
+class Rate(NamedTuple):
+    # Bursts of up to `count`, refilled at `count` per `period` seconds
+    count: float
+    period: float
+
+    @property
+    def per_second(self) -> float:
+        return self.count / self.period
+
+
+_UNITS = {"s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+@lru_cache(maxsize=256)
+def parse_rate(spec: str) -> Optional[Rate]:
+    """"20/s", "300/m", "5/10s" or "100/h"; empty or "0" means no limit.
+
+    Buckets hold whole tokens, so a count below 1 ("0.5/s") would never
+    refill to one; write it as "1/2s" instead.
+    """
+    spec = spec.strip()
+    if spec in ("", "0"):
+        return None
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)?\s*([smh])", spec)
+    if m is None:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    count, period = float(m.group(1)), float(m.group(2) or 1) * _UNITS[m.group(3)]
+    if period <= 0:
+        raise ValueError(f"Invalid rate limit: {spec!r} has an empty period")
+    if count < 1:
+        raise ValueError(f"Invalid rate limit: {spec!r} allows less than one request per period")
+    return Rate(count, period)
+
+
+class Buckets(Protocol):
+    async def take(self, key: str, rate: Rate) -> float:
+        """Take a token from `key`'s bucket: 0 if there was one, otherwise
+        the seconds until there will be."""
+        ...
+
+
+class MemoryBuckets:
+    """Token buckets in this process; a check is a dict lookup and some arithmetic.
+
+    Holds at most `max_keys` buckets. Past that, buckets that have refilled
+    (and so carry no state) are swept, then the oldest are dropped down to
+    90%, so the sweep's cost is spread over many new keys.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> [tokens, last update, time the bucket is full again]
+        self._buckets: dict[str, list[float]] = {}
+
+    def take_now(self, key: str, rate: Rate, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._sweep(now)
+            tokens = rate.count
+        else:
+            tokens = min(rate.count, bucket[0] + (now - bucket[1]) * rate.per_second)
+        if tokens < 1:
+            wait = (1 - tokens) / rate.per_second
+            if bucket is not None:
+                bucket[0], bucket[1] = tokens, now
+            return wait
+        tokens -= 1
+        full = now + (rate.count - tokens) / rate.per_second
+        if bucket is None:
+            self._buckets[key] = [tokens, now, full]
+        else:
+            bucket[0], bucket[1], bucket[2] = tokens, now, full
+        return 0.0
+
+    async def take(self, key: str, rate: Rate) -> float:
+        return self.take_now(key, rate)
+
+    def _sweep(self, now: float) -> None:
+        for key in [k for k, b in self._buckets.items() if b[2] <= now]:
+            del self._buckets[key]
+        excess = len(self._buckets) - int(self.max_keys * 0.9)
+        for key in list(itertools.islice(self._buckets, max(0, excess))):
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# KEYS[1] bucket; ARGV: count, tokens per second. Uses the server clock so
+# workers on different hosts agree. Returns the wait as a string (Lua numbers
+# are truncated to integers on the way out).
+_TAKE = """
+local count = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'n', 't')
+local tokens = count
+if b[1] then
+  tokens = math.min(count, tonumber(b[1]) + (now - tonumber(b[2])) * rate)
+end
+local wait = 0
+if tokens < 1 then
+  wait = (1 - tokens) / rate
+else
+  tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'n', tokens, 't', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((count - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Token buckets in Redis, shared by every worker: one script call per check.
+
+    A key found empty is remembered locally until it refills, so a client
+    hammering past its limit costs no round trips. If Redis is unreachable,
+    checks pass (limits are a safeguard, not a reason to go down).
+    """
+
+    def __init__(self, url: str, prefix: str = "devhub:rl:"):
+        import redis.asyncio as aioredis
+
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(_TAKE)
+        self._blocked: dict[str, float] = {}
+        self._warned = 0.0
+
+    async def take(self, key: str, rate: Rate) -> float:
+        now = time.monotonic()
+        until = self._blocked.get(key)
+        if until is not None:
+            if until > now:
+                return until - now
+            del self._blocked[key]
+        try:
+            wait = float(await self._script(keys=[self.prefix + key], args=[rate.count, rate.per_second]))
+        except Exception:
+            if now - self._warned > 60:
+                self._warned = now
+                logger.warning("rate limit store unreachable, not limiting", exc_info=True)
+            return 0.0
+        if wait > 0:
+            if len(self._blocked) > 100_000:
+                self._blocked = {k: v for k, v in self._blocked.items() if v > now}
+            self._blocked[key] = now + wait
+        return wait
+
+
+def create_buckets(url: str) -> Buckets:
+    """In-process buckets for an empty url; redis://, rediss:// or unix:// for shared ones."""
+    if not url:
+        return MemoryBuckets()
+    if urlparse(url).scheme in ("redis", "rediss", "valkey", "valkeys", "unix"):
+        return RedisBuckets(url)
+    raise ValueError(f"Unsupported rate limit url: {url}")
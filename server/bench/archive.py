@@ -0,0 +1,97 @@
+"""Session archive import and export: time and peak memory against file count.
+
+For each count, writes a zip of `--file-kb` source files to a temp file,
+imports it into a fresh session with archives.import_archive, then exports
+the session as a zip and as a tar.gz, discarding the bytes as a response
+would send them. Peak Python memory (tracemalloc) should stay flat as the
+count grows, since import works a batch at a time and export a file at a
+time. Prints one JSON line per count. Run from the repository root:
+
+    python -m server.bench.archive --counts 100,2000,10000 --file-kb 4
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from server.app import models
+from server.app.archives import export_files, import_archive, tar_stream, zip_stream
+from server.app.database import SessionLocal
+from server.app.utils.db_init import init_db
+
+
+def _source(rng: random.Random, size: int) -> str:
+    lines = []
+    while size > 0:
+        line = f"value_{rng.randrange(10**6)} = compute({rng.randrange(1000)}, '{rng.randrange(10**9):x}')"
+        lines.append(line)
+        size -= len(line) + 1
+    return "\n".join(lines)
+
+
+def _measure(fn) -> tuple[float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", default="100,2000,10000")
+    parser.add_argument("--file-kb", type=float, default=4)
+    args = parser.parse_args()
+    init_db()
+    rng = random.Random(1)
+    db = SessionLocal()
+    user = models.User(email="archive@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+
+    for count in [int(c) for c in args.counts.split(",")]:
+        session = models.Session(name=f"archive {count}", code=f"ARC{count:05d}", owner_id=user.id)
+        db.add(session)
+        db.commit()
+        with tempfile.TemporaryFile() as upload:
+            with zipfile.ZipFile(upload, "w", zipfile.ZIP_DEFLATED) as zf:
+                for i in range(count):
+                    zf.writestr(f"pkg{i // 100}/module{i}.py", _source(rng, int(args.file_kb * 1024)))
+            archive_mb = upload.tell() / 1e6
+            result = {}
+            import_s, import_peak = _measure(lambda: result.update(import_archive(db, session.id, upload)))
+
+        out = {"zip": 0, "tar.gz": 0}
+
+        def export(fmt: str, stream) -> None:
+            for chunk in stream(export_files(db, session.id)):
+                out[fmt] += len(chunk)
+
+        zip_s, zip_peak = _measure(lambda: export("zip", zip_stream))
+        tar_s, tar_peak = _measure(lambda: export("tar.gz", tar_stream))
+        print(json.dumps({
+            "files": count,
+            "archive_mb": round(archive_mb, 1),
+            "created": result["created"],
+            "import_s": round(import_s, 2),
+            "import_peak_mb": round(import_peak, 1),
+            "export_zip_s": round(zip_s, 2),
+            "export_zip_peak_mb": round(zip_peak, 1),
+            "export_tar_s": round(tar_s, 2),
+            "export_tar_peak_mb": round(tar_peak, 1),
+            "export_zip_mb": round(out["zip"] / 1e6, 1),
+        }))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
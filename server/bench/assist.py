@@ -0,0 +1,96 @@
+"""AI assist queue under load with the fake backend.
+
+Sends `--requests` POST /api/ai/assist calls from `--concurrency` clients
+in-process, first with distinct prompts and then with `--distinct` prompts
+repeated (so most are answered by a running job or the cache). While each
+phase runs, a probe times GET /metrics to show other routes stay responsive.
+Prints one JSON line per phase. Run from the repository root:
+
+    python -m server.bench.assist --requests 400 --concurrency 100 --token-delay 0.01
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+
+async def _phase(client, name: str, prompts: list[str], concurrency: int) -> dict:
+    from server.app.assist import assistant
+
+    before = (assistant.completed, assistant.joined, assistant.cache.hits, assistant.rejected)
+    latencies: list[float] = []
+    probes: list[float] = []
+    remaining = list(prompts)
+    running = [True]
+
+    async def worker() -> None:
+        while remaining:
+            question = remaining.pop()
+            start = time.perf_counter()
+            r = await client.post("/api/ai/assist", json={"code": "def f():\n    return 1\n", "question": question})
+            if r.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            elif r.status_code == 503:
+                remaining.append(question)
+                await asyncio.sleep(float(r.headers.get("retry-after", "1")) / 10)
+
+    async def probe() -> None:
+        while running[0]:
+            start = time.perf_counter()
+            await client.get("/metrics")
+            probes.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    running[0] = False
+    await prober
+    latencies.sort()
+    after = (assistant.completed, assistant.joined, assistant.cache.hits, assistant.rejected)
+    return {
+        "phase": name,
+        "requests": len(prompts),
+        "requests_per_s": round(len(prompts) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1),
+        "generated": after[0] - before[0],
+        "joined": after[1] - before[1],
+        "cache_hits": after[2] - before[2],
+        "rejected": after[3] - before[3],
+        "probe_p50_ms": round(statistics.median(probes) * 1000, 2) if probes else None,
+    }
+
+
+async def run(args) -> None:
+    import httpx
+    from server.app.main import app, lifespan
+
+    async with lifespan(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            distinct = [f"question {i}" for i in range(args.requests)]
+            print(json.dumps(await _phase(client, "distinct", distinct, args.concurrency)))
+            repeated = [f"repeated {i % args.distinct}" for i in range(args.requests)]
+            print(json.dumps(await _phase(client, "repeated", repeated, args.concurrency)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--distinct", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    os.environ.setdefault("AI_FAKE_TOKEN_DELAY", str(args.token_delay))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
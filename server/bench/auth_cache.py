@@ -0,0 +1,71 @@
+"""Requests per second on /api/sessions/mine with and without the principal cache.
+
+Runs the FastAPI app in-process on a throwaway SQLite database. Run from the
+repository root:
+
+    python -m server.bench.auth_cache --requests 2000
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+from server.app import models  # noqa: E402
+from server.app.auth import create_access_token, principal_cache  # noqa: E402
+from server.app.database import SessionLocal  # noqa: E402
+from server.app.utils.db_init import init_db  # noqa: E402
+from server.app.main import app  # noqa: E402
+
+
+def seed(sessions: int) -> str:
+    db = SessionLocal()
+    try:
+        user = models.User(email="bench@example.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        db.add_all(models.Session(name=f"s{i}", code=f"B{i:07d}", owner_id=user.id) for i in range(sessions))
+        db.commit()
+        return create_access_token(user.email)
+    finally:
+        db.close()
+
+
+async def measure(token: str, requests: int, concurrency: int) -> float:
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(n: int) -> None:
+            for _ in range(n):
+                r = await client.get("/api/sessions/mine", headers=headers)
+                r.raise_for_status()
+
+        await worker(10)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=5)
+    args = parser.parse_args()
+    init_db()
+    token = seed(args.sessions)
+    ttl = principal_cache.ttl
+    for enabled in (False, True):
+        principal_cache.clear()
+        principal_cache.ttl = ttl if enabled else 0
+        rps = asyncio.run(measure(token, args.requests, args.concurrency))
+        print(json.dumps({"cache": enabled, "requests": args.requests, "requests_per_s": round(rps)}))
+
+
+if __name__ == "__main__":
+    main()
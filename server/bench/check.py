@@ -0,0 +1,52 @@
+"""Run the benchmarks that have pass/fail bounds, as one check.
+
+Runs each gate below in its own interpreter with its default bounds, prints
+their JSON results keyed by name and exits non-zero when any of them failed
+or did not produce a result, so CI and pre-merge runs only need this one
+command. Extra arguments for a gate go after its name. Run from the
+repository root:
+
+    python -m server.bench.check
+    python -m server.bench.check --only import_time -- --budget-ms 2000
+"""
+from __future__ import annotations
+import argparse
+import json
+import subprocess
+import sys
+
+
+# Benchmarks that exit non-zero when over their bounds
+GATES = ("import_time", "editor_latency")
+
+
+def _run(name: str, extra: list[str]) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-m", f"server.bench.{name}", *extra],
+        capture_output=True, text=True, timeout=600,
+    )
+    lines = proc.stdout.strip().splitlines()
+    try:
+        result = json.loads(lines[-1])
+    except (IndexError, ValueError):
+        tail = proc.stderr.strip().splitlines()
+        result = {"error": tail[-1] if tail else f"exit status {proc.returncode}"}
+    result["ok"] = proc.returncode == 0 and result.get("ok", False)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", choices=GATES, action="append")
+    parser.add_argument("extra", nargs="*", help="arguments passed to the gate given with --only")
+    args = parser.parse_args()
+    if args.extra and len(args.only or ()) != 1:
+        parser.error("extra arguments need exactly one --only gate")
+    results = {name: _run(name, args.extra) for name in args.only or GATES}
+    ok = all(r["ok"] for r in results.values())
+    print(json.dumps({**results, "ok": ok}))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Latency of the editor_change handler while realtime database work runs.
+
+Calls the real `editor_change` and `chat_message` handlers in process, on a
+throwaway SQLite database, for `--clients` joined connections: each sends
+`--changes` full-content edits spread over `--documents` documents (so some
+events load a document first) and a chat message every `--chat-every`
+edits, while the store flushes and the chat writer persists in the
+background. A ticker standing in for other connections fires every 10 ms.
+Reports handler latency, how late the ticks were and how many database
+calls were refused as busy, and exits non-zero when the p99 handler latency,
+the worst tick lag or the busy count is over its bound. Run from the
+repository root:
+
+    python -m server.bench.editor_latency --clients 50 --changes 200 --documents 100
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+# Measure the handlers, not the per-connection rate limits
+for _limit in ("EDITOR", "EDITOR_ROOM", "CHAT", "CHAT_USER", "CHAT_ROOM"):
+    os.environ.setdefault(f"RATE_LIMIT_{_limit}", "")
+
+from server.app import models  # noqa: E402
+from server.app.database import SessionLocal  # noqa: E402
+from server.app.main import app, lifespan  # noqa: E402
+from server.app.metrics import pool_timeouts  # noqa: E402
+from server.app.realtime import socket  # noqa: E402
+from server.app.realtime.chat import chat_writer  # noqa: E402
+from server.app.realtime.rooms import Grant  # noqa: E402
+from server.app.utils.db_init import init_db  # noqa: E402
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50_ms": round(_percentile(values, 50), 2),
+        "p99_ms": round(_percentile(values, 99), 2),
+        "max_ms": round(max(values), 2) if values else 0.0,
+    }
+
+
+def seed(documents: int) -> tuple[Grant, list[int]]:
+    init_db()
+    db = SessionLocal()
+    try:
+        user = models.User(email="bench@example.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        session = models.Session(name="bench", code="BENCH", owner_id=user.id)
+        db.add(session)
+        db.flush()
+        docs = [models.Document(session_id=session.id, title=f"f{i}.py", content="x" * 2000) for i in range(documents)]
+        db.add_all(docs)
+        db.commit()
+        return Grant(session.id, session.code, user.id, user.email), [d.id for d in docs]
+    finally:
+        db.close()
+
+
+async def _ticker(lags: list[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    async with lifespan(app):
+        grant, documents = await asyncio.to_thread(seed, args.documents)
+        sids = [f"bench-{i}" for i in range(args.clients)]
+        for sid in sids:
+            socket.rooms.join(sid, grant)
+        latencies: list[float] = []
+        lags: list[float] = []
+        stop = asyncio.Event()
+        ticker = asyncio.create_task(_ticker(lags, stop))
+
+        async def client(i: int, sid: str) -> None:
+            for n in range(args.changes):
+                document_id = documents[(i * args.changes + n) % len(documents)]
+                start = time.perf_counter()
+                await socket.editor_change(sid, {"document_id": document_id, "content": f"edit {n} from {sid}"})
+                latencies.append((time.perf_counter() - start) * 1000)
+                if n % args.chat_every == 0:
+                    await socket.chat_message(sid, {"content": f"message {n}"})
+                await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i, sid) for i, sid in enumerate(sids)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+        for sid in sids:
+            socket.outbox.discard(sid)
+            await socket._leave_room(sid)
+        result = {
+            "clients": args.clients,
+            "documents": args.documents,
+            "events_per_s": round(len(latencies) / elapsed, 1),
+            "editor_change": _summary(latencies),
+            "tick_lag_ms_p50": round(statistics.median(lags), 2),
+            "tick_lag_ms_p99": round(_percentile(lags, 99), 2),
+            "tick_lag_ms_max": round(max(lags), 2),
+            "db_busy": pool_timeouts.value("realtime"),
+        }
+    # Queued chat messages are written at shutdown
+    result["chat_written"] = chat_writer.written
+    result["ok"] = (
+        result["editor_change"]["p99_ms"] <= args.max_p99_ms
+        and result["tick_lag_ms_max"] <= args.max_tick_lag_ms
+        and result["db_busy"] <= args.max_db_busy
+    )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--changes", type=int, default=200)
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--chat-every", type=int, default=10)
+    parser.add_argument("--max-p99-ms", type=float, default=100.0)
+    parser.add_argument("--max-tick-lag-ms", type=float, default=500.0)
+    parser.add_argument("--max-db-busy", type=int, default=0)
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result))
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Cold import time of the app and a check that importing it has no side effects.
+
+Imports `server.app.main` in fresh interpreters under `-X importtime`: once
+against a SQLite path that must not exist afterwards, and once with the MySQL
+settings pointing at an unroutable host, which would hang if anything
+connected at import. Prints wall time, the slowest modules and the budget
+verdict as JSON and exits non-zero when the budget is exceeded or a database
+was touched, so it can gate CI. Run from the repository root:
+
+    python -m server.bench.import_time --budget-ms 2500
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _import(env: dict) -> tuple[float, list[tuple[str, float]]]:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server.app.main"],
+        env={**os.environ, **env}, capture_output=True, text=True, timeout=60,
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    # "import time: self [us] | cumulative | imported package", nested imports
+    # indented two spaces per level; keep the app module and its direct imports
+    modules = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2][1:]
+            if len(name) - len(name.lstrip()) <= 2:
+                modules.append((name.strip(), int(parts[1]) / 1000))
+    return elapsed, sorted(modules, key=lambda m: -m[1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=2500.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), "import.db")
+    sqlite_ms, top = _import({"DATABASE_URL": f"sqlite:///{path}"})
+    touched = os.path.exists(path)
+    mysql_ms, _ = _import({"DATABASE_URL": "", "DB_HOST": "192.0.2.1"})
+    ok = not touched and max(sqlite_ms, mysql_ms) <= args.budget_ms
+    print(json.dumps({
+        "budget_ms": args.budget_ms,
+        "sqlite_import_ms": round(sqlite_ms, 1),
+        "unreachable_mysql_import_ms": round(mysql_ms, 1),
+        "database_touched": touched,
+        "slowest_imports_ms": {name: round(ms, 1) for name, ms in top[: args.top]},
+        "ok": ok,
+    }))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
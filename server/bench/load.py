@@ -0,0 +1,257 @@
+"""Realtime load test: N Socket.IO clients across M rooms against one server.
+
+Starts the app from `main.get_app()` under uvicorn in a child process, on a
+throwaway SQLite database, and connects `--clients` python-socketio clients
+spread over `--rooms` sessions. Every client joins its session, then emits
+`editor_change` and `chat_message` at the given per-client rates for
+`--duration` seconds. Reports delivered events per second, fan-out latency
+(sender emit to receiver handler) percentiles and the server's resident
+memory as one JSON object, also written to `--out` when given, so runs can be
+compared across releases. Run from the repository root:
+
+    python -m server.bench.load --clients 100 --rooms 10 --duration 20 --out load.json
+
+The clients share one event loop; when `client_loop_lag_ms` grows, the
+harness rather than the server is the bottleneck.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import socket
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+# Measure the server, not the per-client rate limits
+for _limit in ("EDITOR", "EDITOR_ROOM", "CHAT", "CHAT_USER", "CHAT_ROOM", "JOIN", "HTTP"):
+    os.environ.setdefault(f"RATE_LIMIT_{_limit}", "")
+
+import socketio  # noqa: E402
+from server.app import models  # noqa: E402
+from server.app.auth import create_access_token  # noqa: E402
+from server.app.database import SessionLocal  # noqa: E402
+from server.app.utils.db_init import init_db  # noqa: E402
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50_ms": round(_percentile(values, 50), 2),
+        "p90_ms": round(_percentile(values, 90), 2),
+        "p99_ms": round(_percentile(values, 99), 2),
+        "max_ms": round(max(values), 2) if values else 0.0,
+    }
+
+
+def seed(rooms: int, content_bytes: int) -> list[tuple[str, int]]:
+    init_db()
+    db = SessionLocal()
+    try:
+        user = models.User(email="load@example.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        out = []
+        for i in range(rooms):
+            session = models.Session(name=f"load {i}", code=f"LOAD{i:04d}", owner_id=user.id)
+            db.add(session)
+            db.flush()
+            doc = models.Document(session_id=session.id, title="main.py", content="x" * content_bytes)
+            db.add(doc)
+            db.flush()
+            out.append((session.code, doc.id))
+        db.commit()
+        return out
+    finally:
+        db.close()
+
+
+def _serve(port: int) -> None:
+    import uvicorn
+    uvicorn.run("server.app.main:get_app", factory=True, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _memory_kb(pid: int) -> dict:
+    # Linux only; other platforms report nulls
+    out = {"rss_kb": None, "peak_rss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    out["rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    out["peak_rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return out
+
+
+async def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+class Stats:
+    def __init__(self):
+        self.sent = {"editor_change": 0, "chat_message": 0}
+        self.latency: dict[str, list[float]] = {"editor_change": [], "chat_message": []}
+        self.errors = 0
+
+
+async def _client(url: str, token: str, code: str, document_id: int, args, stats: Stats, start: asyncio.Event, stop: asyncio.Event) -> None:
+    sio = socketio.AsyncClient(reconnection=False)
+    measuring = [False]
+
+    @sio.on("editor_change")
+    async def on_change(data):
+        if measuring[0] and isinstance(data.get("ts"), (int, float)):
+            stats.latency["editor_change"].append(time.time() * 1000 - data["ts"])
+
+    @sio.on("chat_message")
+    async def on_chat(data):
+        if measuring[0]:
+            try:
+                stats.latency["chat_message"].append(time.time() * 1000 - float(data["content"].split()[0]))
+            except (KeyError, ValueError, IndexError):
+                pass
+
+    try:
+        await sio.connect(url, transports=["websocket"])
+        await sio.call("join_session", {"code": code, "token": token})
+    except Exception:
+        stats.errors += 1
+        return
+    rng = random.Random()
+    content = list("x" * args.content_bytes)
+
+    async def emit_every(interval: float, event: str, make) -> None:
+        if interval <= 0:
+            return
+        await asyncio.sleep(rng.random() * interval)
+        while not stop.is_set():
+            await sio.emit(event, make())
+            stats.sent[event] += 1
+            await asyncio.sleep(interval)
+
+    def change() -> dict:
+        content[rng.randrange(len(content))] = rng.choice("abcdef")
+        return {"document_id": document_id, "content": "".join(content), "ts": time.time() * 1000}
+
+    def chat() -> dict:
+        return {"content": f"{time.time() * 1000} hello"}
+
+    await start.wait()
+    measuring[0] = True
+    await asyncio.gather(
+        emit_every(1 / args.edit_rate if args.edit_rate else 0, "editor_change", change),
+        emit_every(1 / args.chat_rate if args.chat_rate else 0, "chat_message", chat),
+    )
+    measuring[0] = False
+    await asyncio.sleep(0.5)
+    await sio.disconnect()
+
+
+async def _loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.05) -> None:
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - t - interval) * 1000)
+
+
+async def run(args, rooms: list[tuple[str, int]], port: int, pid: int) -> dict:
+    url = f"http://127.0.0.1:{port}"
+    token = create_access_token("load@example.com")
+    stats = Stats()
+    start, stop = asyncio.Event(), asyncio.Event()
+    clients = []
+    for i in range(args.clients):
+        code, document_id = rooms[i % len(rooms)]
+        clients.append(asyncio.create_task(_client(url, token, code, document_id, args, stats, start, stop)))
+        if i % 50 == 49:
+            await asyncio.sleep(0.05)
+    await asyncio.sleep(args.warmup)
+    memory_before = _memory_kb(pid)
+    lag: list[float] = []
+    lag_task = asyncio.create_task(_loop_lag(lag, stop))
+    began = time.perf_counter()
+    start.set()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    elapsed = time.perf_counter() - began
+    memory_after = _memory_kb(pid)
+    await asyncio.gather(*clients, lag_task)
+    members = args.clients / len(rooms)
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "python": platform.python_version(),
+        "duration_s": round(elapsed, 2),
+        "connect_errors": stats.errors,
+        "sent_per_s": {k: round(v / elapsed, 1) for k, v in stats.sent.items()},
+        "delivered_per_s": {k: round(len(v) / elapsed, 1) for k, v in stats.latency.items()},
+        # Deliveries if every emit reached its room: chat includes the sender,
+        # editor_change skips it and is merged per connection, so it may
+        # deliver fewer
+        "fanout_expected_per_s": {
+            "editor_change": round(stats.sent["editor_change"] * (members - 1) / elapsed, 1),
+            "chat_message": round(stats.sent["chat_message"] * members / elapsed, 1),
+        },
+        "latency": {k: _summary(v) for k, v in stats.latency.items()},
+        "server_memory_kb": {"before": memory_before, "after": memory_after},
+        "client_loop_lag_ms": _summary(lag),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=5)
+    parser.add_argument("--edit-rate", type=float, default=2.0, help="editor_change per client per second")
+    parser.add_argument("--chat-rate", type=float, default=0.2, help="chat_message per client per second")
+    parser.add_argument("--content-bytes", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--out")
+    args = parser.parse_args()
+    rooms = seed(args.rooms, args.content_bytes)
+    port = _free_port()
+    server = mp.get_context("spawn").Process(target=_serve, args=(port,), daemon=True)
+    server.start()
+    try:
+        asyncio.run(_wait_ready(port))
+        result = asyncio.run(run(args, rooms, port, server.pid))
+    finally:
+        server.terminate()
+        server.join(10)
+    text = json.dumps(result)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    sys.exit(1 if result["connect_errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
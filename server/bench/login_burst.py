@@ -0,0 +1,93 @@
+"""Latency of an unrelated endpoint while a burst of logins is hashing passwords.
+
+Fires `--logins` concurrent logins and meanwhile polls
+/api/sessions/info/{code}, once with bcrypt inline on the request threads and
+once through the password worker pool. Runs in-process on SQLite. Run from the
+repository root:
+
+    python -m server.bench.login_burst --logins 40 --workers 2
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+from server.app import models  # noqa: E402
+from server.app.config import settings  # noqa: E402
+from server.app.database import SessionLocal  # noqa: E402
+from server.app.utils.db_init import init_db  # noqa: E402
+from server.app.main import app  # noqa: E402
+from server.app.utils import passwords  # noqa: E402
+
+
+def seed() -> str:
+    init_db()
+    db = SessionLocal()
+    try:
+        user = models.User(email="bench@example.com", password_hash=passwords.hash_sync("secret123"))
+        db.add(user)
+        db.commit()
+        db.add(models.Session(name="bench", code="BENCH001", owner_id=user.id))
+        db.commit()
+        return "BENCH001"
+    finally:
+        db.close()
+
+
+async def measure(code: str, logins: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        latencies: list[float] = []
+        statuses: dict[int, int] = {}
+        done = asyncio.Event()
+
+        async def login() -> None:
+            r = await client.post("/api/users/login", data={"username": "bench@example.com", "password": "secret123"})
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        async def poll() -> None:
+            while not done.is_set():
+                start = time.perf_counter()
+                (await client.get(f"/api/sessions/info/{code}")).raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        poller = asyncio.create_task(poll())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await poller
+    latencies.sort()
+    return {
+        "password_hash_workers": settings.password_hash_workers,
+        "logins": logins,
+        "login_statuses": statuses,
+        "burst_s": round(elapsed, 2),
+        "info_requests": len(latencies),
+        "info_p50_ms": round(statistics.median(latencies), 1),
+        "info_p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    code = seed()
+    for workers in (0, args.workers):
+        settings.password_hash_workers = workers
+        print(json.dumps(asyncio.run(measure(code, args.logins))))
+    passwords.shutdown()
+
+
+if __name__ == "__main__":
+    main()
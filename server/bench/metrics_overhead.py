@@ -0,0 +1,116 @@
+"""Throughput cost of the metrics instrumentation.
+
+Serves /api/sessions/info/{code} in-process on a throwaway SQLite database
+with METRICS_ENABLED toggled at runtime, alternating rounds to even out
+drift. End-to-end numbers are noisy at this scale, so it also times the
+middleware around a no-op app and the per-packet Socket.IO accounting on
+their own. Run from the repository root:
+
+    python -m server.bench.metrics_overhead --requests 2000 --rounds 3
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import httpx  # noqa: E402
+from server.app import models  # noqa: E402
+from server.app.config import settings  # noqa: E402
+from server.app.database import SessionLocal  # noqa: E402
+from server.app.utils.db_init import init_db  # noqa: E402
+from server.app.main import app  # noqa: E402
+from server.app.metrics import MetricsMiddleware, socket_bytes, socket_events  # noqa: E402
+from server.app.realtime.server import _event_name, _size  # noqa: E402
+
+
+def seed() -> str:
+    init_db()
+    db = SessionLocal()
+    try:
+        user = models.User(email="bench@example.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        db.add(models.Session(name="bench", code="BENCH001", owner_id=user.id))
+        db.commit()
+        return "BENCH001"
+    finally:
+        db.close()
+
+
+async def requests_per_second(code: str, requests: int, concurrency: int = 8) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = [requests]
+
+        async def worker() -> None:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                (await client.get(f"/api/sessions/info/{code}")).raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def middleware_cost_us(requests: int = 100000) -> float:
+    class Route:
+        path = "/api/sessions/info/{code}"
+
+    async def endpoint(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200})
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(endpoint)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await middleware({"type": "http", "method": "GET"}, None, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def packet_cost_us(packets: int = 200000) -> float:
+    data = '2["editor_op",{"document_id":1234,"rev":5821,"ops":[{"pos":1832,"del":0,"ins":"e"}]}]'
+    start = time.perf_counter()
+    for _ in range(packets):
+        event = _event_name(data)
+        socket_events.inc("out", event)
+        socket_bytes.inc("out", event, amount=_size(data))
+    return (time.perf_counter() - start) / packets * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    code = seed()
+    results: dict[bool, list[float]] = {False: [], True: []}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            settings.metrics_enabled = enabled
+            results[enabled].append(asyncio.run(requests_per_second(code, args.requests)))
+    off, on = statistics.median(results[False]), statistics.median(results[True])
+    settings.metrics_enabled = False
+    bare = asyncio.run(middleware_cost_us())
+    settings.metrics_enabled = True
+    instrumented = asyncio.run(middleware_cost_us())
+    print(json.dumps({
+        "route": "/api/sessions/info/{code}",
+        "requests_per_s_metrics_off": round(off, 1),
+        "requests_per_s_metrics_on": round(on, 1),
+        "http_overhead_pct": round((off - on) / off * 100, 2),
+        "middleware_added_us": round(instrumented - bare, 3),
+        "socket_packet_accounting_us": round(packet_cost_us(), 3),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Sync-route throughput against HTTP connection pool size.
+
+For each pool size, a child process serves /api/sessions/info/{code} (two
+queries per request, run on the sync route threadpool) in-process with
+DB_POOL_SIZE set and no overflow, and `--concurrency` clients hammer it.
+Each query sleeps `--query-latency-ms` to stand in for the network round
+trip a real database adds; pass `--database-url` to measure a real one
+instead. Prints one JSON line per size with requests per second and the mean
+time requests queued for a session and for a pooled connection. Run from the
+repository root:
+
+    python -m server.bench.pool_size --sizes 2,5,10,20,40 --concurrency 64
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def child(args) -> None:
+    import httpx
+    from anyio import to_thread
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from server.app import models
+    from server.app.config import settings
+    from server.app.database import SessionLocal
+    from server.app.main import app
+    from server.app.metrics import pool_timeouts, pool_wait, session_wait
+    from server.app.utils.db_init import init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if not db.query(models.Session).filter(models.Session.code == "POOL0001").first():
+            user = models.User(email="pool@example.com", password_hash="x")
+            db.add(user)
+            db.flush()
+            db.add(models.Session(name="pool", code="POOL0001", owner_id=user.id))
+            db.commit()
+    finally:
+        db.close()
+
+    if args.query_latency_ms:
+        @event.listens_for(Engine, "before_cursor_execute")
+        def _latency(*_):
+            time.sleep(args.query_latency_ms / 1000)
+
+    async def run() -> float:
+        to_thread.current_default_thread_limiter().total_tokens = settings.http_threads
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            remaining = [args.requests]
+
+            async def worker() -> None:
+                while remaining[0] > 0:
+                    remaining[0] -= 1
+                    (await client.get("/api/sessions/info/POOL0001")).raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            return args.requests / (time.perf_counter() - start)
+
+    rps = asyncio.run(run())
+    checkouts, sessions = pool_wait.count("http"), session_wait.count()
+    print(json.dumps({
+        "pool_size": settings.db_pool_size,
+        "http_threads": settings.http_threads,
+        "concurrency": args.concurrency,
+        "requests_per_s": round(rps, 1),
+        "mean_session_wait_ms": round(session_wait.total() / sessions * 1000, 3) if sessions else 0.0,
+        "mean_checkout_wait_ms": round(pool_wait.total("http") / checkouts * 1000, 3) if checkouts else 0.0,
+        "timeouts": int(pool_timeouts.value("http")),
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="2,5,10,20,40")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--query-latency-ms", type=float, default=2.0)
+    parser.add_argument("--http-threads", type=int, default=40)
+    parser.add_argument("--database-url")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+    url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    for size in args.sizes.split(","):
+        env = {
+            **os.environ,
+            "DATABASE_URL": url,
+            "DB_POOL_SIZE": size,
+            "DB_POOL_MAX_OVERFLOW": "0",
+            "HTTP_THREADS": str(args.http_threads),
+            "METRICS_ENABLED": "true",
+        }
+        cmd = [
+            sys.executable, "-m", "server.bench.pool_size", "--child",
+            "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--query-latency-ms", str(args.query_latency_ms),
+        ]
+        subprocess.run(cmd, env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Cost of a rate limit check with in-process token buckets.
+
+Times MemoryBuckets.take_now over one hot key and over `--keys` keys (with
+the bucket table at its size limit, so sweeps are included), and the async
+check() that the HTTP middleware and the Socket.IO gate call. Prints JSON
+with nanoseconds per check. Run from the repository root:
+
+    python -m server.bench.ratelimit --checks 1000000 --keys 100000
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import time
+
+from server.app.ratelimit import check
+from server.app.utils.ratelimit import MemoryBuckets, parse_rate
+
+
+def _ns_per(fn, n: int) -> float:
+    start = time.perf_counter_ns()
+    fn(n)
+    return round((time.perf_counter_ns() - start) / n, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checks", type=int, default=1_000_000)
+    parser.add_argument("--keys", type=int, default=100_000)
+    args = parser.parse_args()
+    rate = parse_rate("100/s")
+
+    hot = MemoryBuckets()
+    spread = MemoryBuckets(max_keys=args.keys)
+    keys = [f"conn:{i}" for i in range(args.keys * 2)]
+
+    def one_key(n: int) -> None:
+        for _ in range(n):
+            hot.take_now("conn:1", rate)
+
+    def many_keys(n: int) -> None:
+        for i in range(n):
+            spread.take_now(keys[i % len(keys)], rate)
+
+    async def checks(n: int) -> None:
+        for i in range(n):
+            await check("bench", "100/s", keys[i % args.keys])
+
+    print(json.dumps({
+        "checks": args.checks,
+        "one_key_ns": _ns_per(one_key, args.checks),
+        "many_keys_ns": _ns_per(many_keys, args.checks),
+        "keys_held": len(spread),
+        "async_check_ns": _ns_per(lambda n: asyncio.run(checks(n)), args.checks),
+    }))
+
+
+if __name__ == "__main__":
+    main()
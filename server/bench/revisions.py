@@ -0,0 +1,133 @@
+"""Storage and reconstruction cost of document revision history.
+
+Types `--edits` random small edits into a `--size-kb` document through the
+realtime store, saving every `--edits-per-save` edits, once per chain limit.
+Reports history bytes per edit next to what full copies would take, and how
+long it takes to rebuild saved revisions. Runs on a throwaway SQLite
+database. Run from the repository root:
+
+    python -m server.bench.revisions --size-kb 256 --edits 5000 --chain-limits 1,10,50
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import func  # noqa: E402
+from server.app import models  # noqa: E402
+from server.app.config import settings  # noqa: E402
+from server.app.database import SessionLocal  # noqa: E402
+from server.app.utils.db_init import init_db  # noqa: E402
+from server.app.realtime import ot, revisions  # noqa: E402
+from server.app.realtime.documents import store  # noqa: E402
+
+WORDS = "def return self value import class for while yield lambda async await".split()
+
+
+def _source(size: int, rng: random.Random) -> str:
+    lines = []
+    total = 0
+    while total < size:
+        line = "    " * rng.randint(0, 3) + " ".join(rng.choices(WORDS, k=rng.randint(2, 8))) + "\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)
+
+
+def _edit(content: str, rng: random.Random) -> ot.Op:
+    pos = rng.randint(0, len(content))
+    if rng.random() < 0.8 or pos == len(content):
+        return [ot.Edit(pos, 0, rng.choice(WORDS) + " ")]
+    return [ot.Edit(pos, min(rng.randint(1, 10), len(content) - pos), "")]
+
+
+def seed(content: str) -> int:
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).first()
+        if user is None:
+            user = models.User(email="bench@example.com", password_hash="x")
+            db.add(user)
+            db.flush()
+            db.add(models.Session(name="bench", code="BENCH", owner_id=user.id))
+            db.flush()
+        session = db.query(models.Session).first()
+        doc = models.Document(session_id=session.id, title="bench.py", content=content)
+        db.add(doc)
+        db.flush()
+        revisions.record_snapshot(db, doc.id, 0, content)
+        db.commit()
+        return doc.id
+    finally:
+        db.close()
+
+
+async def _type(document_id: int, edits: int, per_save: int, rng: random.Random) -> None:
+    store.start()
+    try:
+        state = await store.open(document_id, "BENCH")
+        for i in range(edits):
+            state.apply(state.rev, _edit(state.content, rng))
+            if (i + 1) % per_save == 0:
+                await store.flush([document_id])
+    finally:
+        await store.stop()
+        await store.close_room("BENCH")
+
+
+def measure(chain_limit: int, size: int, edits: int, per_save: int, seed_value: int) -> dict:
+    settings.revision_chain_limit = chain_limit
+    rng = random.Random(seed_value)
+    document_id = seed(_source(size, rng))
+    asyncio.run(_type(document_id, edits, per_save, rng))
+
+    R = models.DocumentRevision
+    db = SessionLocal()
+    try:
+        rows = db.query(R.revision, R.depth, func.length(R.data)).filter(R.document_id == document_id).order_by(R.revision).all()
+        stored = sum(size for _, _, size in rows)
+        timings = []
+        full_copies = 0
+        for revision, depth, _ in rows:
+            start = time.perf_counter()
+            content = revisions.load(db, document_id, revision)
+            timings.append((time.perf_counter() - start) * 1000)
+            full_copies += len(content.encode())
+    finally:
+        db.close()
+    return {
+        "chain_limit": chain_limit,
+        "document_kb": size // 1024,
+        "edits": edits,
+        "saved_revisions": len(rows),
+        "snapshots": sum(1 for _, depth, _ in rows if depth == 0),
+        "history_bytes": stored,
+        "history_bytes_per_edit": round(stored / edits, 1),
+        "full_copy_bytes_per_edit": round(full_copies / edits, 1),
+        "reconstruct_ms_p50": round(statistics.median(timings), 3),
+        "reconstruct_ms_max": round(max(timings), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--edits", type=int, default=5000)
+    parser.add_argument("--edits-per-save", type=int, default=20)
+    parser.add_argument("--chain-limits", default="1,10,50")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    init_db()
+    for limit in (int(x) for x in args.chain_limits.split(",")):
+        print(json.dumps(measure(limit, args.size_kb * 1024, args.edits, args.edits_per_save, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
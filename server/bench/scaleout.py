@@ -0,0 +1,88 @@
+"""Room broadcast throughput across worker processes.
+
+Starts N processes that share a `local://` client manager, has each one emit
+`--messages` room broadcasts and reports how many messages per second reach
+the other workers. Run from the repository root:
+
+    python -m server.bench.scaleout --workers 1,2,4,8
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import time
+import socketio
+from server.app.realtime.manager import LocalPubSubManager
+
+
+class CountingManager(LocalPubSubManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.received = 0
+
+    async def _handle_emit(self, message):
+        if message.get("host_id") != self.host_id:
+            self.received += 1
+        await super()._handle_emit(message)
+
+
+def _worker(url: str, messages: int, expected: int, barrier, results) -> None:
+    async def run():
+        mgr = CountingManager(url)
+        sio = socketio.AsyncServer(async_mode="asgi", client_manager=mgr)
+        sio.manager_initialized = True
+        mgr.initialize()
+        await mgr._connect()
+        await asyncio.to_thread(barrier.wait)
+        payload = {"document_id": 1, "rev": 1, "ops": [{"pos": 0, "del": 0, "ins": "x"}]}
+        start = time.perf_counter()
+        for _ in range(messages):
+            await sio.emit("editor_op", payload, room="bench")
+        published = time.perf_counter() - start
+        deadline = time.monotonic() + 30
+        while mgr.received < expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        results.put({"published_s": published, "received": mgr.received, "done_s": time.perf_counter() - start})
+        # Keep serving the hub until every worker is done
+        await asyncio.to_thread(barrier.wait)
+
+    asyncio.run(run())
+
+
+def run(workers: int, messages: int, port: int) -> dict:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    url = f"local://127.0.0.1:{port}"
+    expected = messages * (workers - 1)
+    procs = [ctx.Process(target=_worker, args=(url, messages, expected, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    stats = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = max(s["done_s"] for s in stats)
+    delivered = sum(s["received"] for s in stats)
+    return {
+        "workers": workers,
+        "messages_per_worker": messages,
+        "published_per_s": round(workers * messages / max(s["published_s"] for s in stats)),
+        "delivered": delivered,
+        "expected": expected * workers,
+        "delivered_per_s": round(delivered / elapsed) if delivered else 0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=7466)
+    args = parser.parse_args()
+    for i, n in enumerate(int(w) for w in args.workers.split(",")):
+        print(json.dumps(run(n, args.messages, args.port + i)))
+
+
+if __name__ == "__main__":
+    main()
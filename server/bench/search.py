@@ -0,0 +1,132 @@
+"""Code search latency on a generated corpus, trigram index against a full scan.
+
+Generates `--files` source-like documents (random identifiers, keywords and
+literals, `--lines` lines each) and indexes them with search.SessionIndex.
+Reports build time, index size, the cost of re-indexing one edited file and,
+for each query, median milliseconds with the index (candidate narrowing plus
+matching) and with a regex scan over every file. Run from the repository root:
+
+    python -m server.bench.search --files 3000 --lines 120
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import time
+
+from server.app.search import SessionIndex, _hits, required_literals
+
+
+WORDS = (
+    "self return import from def class if else for while with try except raise yield async await lambda "
+    "const let var function export default interface type extends implements new this null undefined "
+    "value result items index count data config client server request response error handler state"
+).split()
+
+
+def _identifier(rng: random.Random) -> str:
+    return rng.choice(WORDS) + rng.choice(("", "_", "")) + rng.choice(WORDS).capitalize() + str(rng.randrange(100))
+
+
+def corpus(files: int, lines: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(files):
+        out = []
+        for _ in range(lines):
+            indent = "    " * rng.randrange(4)
+            words = [rng.choice(WORDS) if rng.random() < 0.6 else _identifier(rng) for _ in range(rng.randrange(2, 9))]
+            out.append(indent + " ".join(words) + rng.choice(("", ":", ";", "()", " = 0", ' = "text"')))
+        docs.append("\n".join(out))
+    return docs
+
+
+def _median_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=3000)
+    parser.add_argument("--lines", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    docs = corpus(args.files, args.lines)
+    # A couple of needles so selective queries have something to find
+    docs[args.files // 3] += "\nconnection_pool_exhausted = True"
+    docs[args.files // 2] += "\nraise ConnectionPoolExhausted(retry_after)"
+
+    index = SessionIndex()
+    start = time.perf_counter()
+    for i, content in enumerate(docs):
+        index.put(i, f"file{i}.py", 0, content)
+    build_ms = (time.perf_counter() - start) * 1000
+    postings_bytes = sum(sys.getsizeof(v) for v in index._postings.values())
+
+    edited = docs[7].replace("return", "return  ", 1)
+    update_ms = _median_ms(lambda: (index.put(7, "file7.py", 1, edited), index.put(7, "file7.py", 0, docs[7])), args.repeat) / 2
+
+    queries = [
+        ("connection_pool_exhausted", False),
+        ("ConnectionPoolExhausted", False),
+        ("handler", False),
+        (r"raise \w+Exhausted\(", True),
+        (r"def \w+\(self", True),
+        (r"\d{3,}", True),
+    ]
+    results = []
+    for q, is_regex in queries:
+        flags = re.MULTILINE | re.IGNORECASE
+        pattern = re.compile(q if is_regex else re.escape(q), flags)
+        literals = required_literals(q, flags) if is_regex else [q]
+
+        def indexed():
+            found = []
+            for i in index.candidates(literals):
+                hits = _hits(index.docs[i].content, pattern, 20)
+                if hits:
+                    found.append(i)
+                    if len(found) >= 50:
+                        break
+            return found
+
+        def scan():
+            found = []
+            for i, content in enumerate(docs):
+                hits = _hits(content, pattern, 20)
+                if hits:
+                    found.append(i)
+                    if len(found) >= 50:
+                        break
+            return found
+
+        results.append({
+            "query": q,
+            "regex": is_regex,
+            "candidates": len(index.candidates(literals)),
+            "files": len(indexed()),
+            "indexed_ms": round(_median_ms(indexed, args.repeat), 3),
+            "scan_ms": round(_median_ms(scan, args.repeat), 3),
+        })
+
+    print(json.dumps({
+        "files": args.files,
+        "corpus_mb": round(sum(len(d) for d in docs) / 1e6, 1),
+        "build_ms": round(build_ms, 1),
+        "trigrams": index.size,
+        "postings_mb": round(postings_bytes / 1e6, 1),
+        "reindex_one_file_ms": round(update_ms, 3),
+        "queries": results,
+    }, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Bytes on the wire and encode CPU per realtime event, JSON against msgpack.
+
+Encodes typical `editor_op`, `editor_change`, `editor_snapshot`, `presence`
+and `chat_message` payloads into Socket.IO packets the way the server sends
+them to JSON and to msgpack clients. Run from the repository root:
+
+    python -m server.bench.wire --content-kb 1,16,128 --rounds 2000
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import time
+from socketio import packet
+from server.app.config import settings
+from server.app.realtime import codec
+
+# Events that carry the whole document
+SIZED = ("editor_change", "editor_snapshot")
+
+
+def _source(size: int) -> str:
+    rng = random.Random(size)
+    words = "def return self value import class for while yield lambda async await".split()
+    text = ""
+    while len(text) < size:
+        text += "    " * rng.randint(0, 3) + " ".join(rng.choices(words, k=rng.randint(2, 8))) + "\n"
+    return text[:size]
+
+
+def events(content: str) -> dict[str, dict]:
+    return {
+        "editor_op": {"document_id": 1234, "rev": 5821, "ops": [{"pos": 1832, "del": 0, "ins": "e"}]},
+        "presence": {"sid": "Lxq6J9u5c1Dww8-uAAAF", "user": "someone@example.com", "document_id": 1234, "cursor": 1833, "selection": None},
+        "chat_message": {"user": "someone@example.com", "content": "pushed the fix, can you pull and re-run?", "created_at": "2025-01-01T12:00:00.000000"},
+        "editor_change": {"document_id": 1234, "content": content, "cursor": 1833, "ts": 1735732800000},
+        "editor_snapshot": {"document_id": 1234, "rev": 5821, "content": content},
+    }
+
+
+def _wire_bytes(encoded) -> int:
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(p.encode() if isinstance(p, str) else p) for p in parts)
+
+
+def _always_packed(data):
+    threshold, settings.socket_binary_min_bytes = settings.socket_binary_min_bytes, 0
+    try:
+        return codec.pack(data)
+    finally:
+        settings.socket_binary_min_bytes = threshold
+
+
+def measure(event: str, data: dict, rounds: int) -> dict:
+    out = {}
+    for name, encode in (("json", lambda d: d), ("msgpack", codec.pack), ("always_packed", _always_packed)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            encoded = packet.Packet(packet.EVENT, data=[event, encode(data)], namespace="/").encode()
+        out[name] = (_wire_bytes(encoded), (time.perf_counter() - start) / rounds * 1e6)
+    return {
+        "event": event,
+        "json_bytes": out["json"][0],
+        "msgpack_bytes": out["msgpack"][0],
+        "ratio": round(out["msgpack"][0] / out["json"][0], 3),
+        # What the payload would cost packed regardless of socket_binary_min_bytes
+        "always_packed_bytes": out["always_packed"][0],
+        "json_encode_us": round(out["json"][1], 2),
+        "msgpack_encode_us": round(out["msgpack"][1], 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--content-kb", default="1,16,128")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.content_kb.split(",")]
+    for kb in sizes:
+        for event, data in events(_source(kb * 1024)).items():
+            if event in SIZED:
+                print(json.dumps({"content_kb": kb, **measure(event, data, args.rounds)}))
+            elif kb == sizes[0]:
+                print(json.dumps({"content_kb": None, **measure(event, data, args.rounds)}))
+
+
+if __name__ == "__main__":
+    main()